@@ -0,0 +1,309 @@
+"""
+受付制御モジュール
+処理段階ごとの同時実行数・処理中の音声バイト数・OpenAIのトークン毎分（TPM）を制限し、
+上限に達している場合はアップロードの時点で断る（処理の途中で失敗させない）
+"""
+
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, Optional
+from config import (
+    STT_MAX_CONCURRENT,
+    LLM_MAX_CONCURRENT,
+    INFLIGHT_MAX_BYTES,
+    OPENAI_TPM_LIMIT,
+    STAGE_WAIT_TIMEOUT_SECONDS,
+    ADMISSION_MAX_TPM_WAIT_SECONDS,
+    ADMISSION_RETRY_AFTER_SECONDS
+)
+from convert_audio import conversion_pool
+
+# ログ設定
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 受付時に見積もる1件あたりの要約のトークン数（プロンプト＋出力）
+ESTIMATED_TOKENS_PER_JOB = 4000
+
+
+class AdmissionRejectedError(Exception):
+    """受付上限に達している場合の例外（HTTPステータスと再試行までの秒数を持つ）"""
+
+    def __init__(self, message: str, status_code: int = 503, retry_after: float = 10):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+class StageLimiter:
+    """処理段階（音声認識・要約など）の同時実行数を制限するクラス"""
+
+    def __init__(self, name: str, limit: int, timeout_seconds: float = STAGE_WAIT_TIMEOUT_SECONDS):
+        """
+        初期化
+
+        Args:
+            name: 処理段階の名前
+            limit: 同時実行数
+            timeout_seconds: 空きを待つ最大秒数
+        """
+        self.name = name
+        self.limit = limit
+        self.timeout_seconds = timeout_seconds
+        self._slots = threading.Semaphore(limit)
+        self._lock = threading.Lock()
+        self._stats = {'running': 0, 'waiting': 0, 'completed': 0, 'timeouts': 0, 'total_wait_seconds': 0.0}
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None, wait_forever: bool = False) -> Iterator[None]:
+        """
+        空きを待って処理を実行するコンテキストマネージャー
+
+        Args:
+            timeout: 空きを待つ最大秒数（省略時は timeout_seconds）
+            wait_forever: Trueの場合はタイムアウトせずに空きを待つ（処理の途中で失敗させると
+                          それまでの結果が無駄になる、分割認識の区間など）
+        """
+        queued_at = time.monotonic()
+        with self._lock:
+            self._stats['waiting'] += 1
+        if wait_forever:
+            acquired = self._slots.acquire()
+        else:
+            acquired = self._slots.acquire(timeout=self.timeout_seconds if timeout is None else max(0.0, timeout))
+        with self._lock:
+            self._stats['waiting'] -= 1
+            if not acquired:
+                self._stats['timeouts'] += 1
+            else:
+                self._stats['running'] += 1
+                self._stats['total_wait_seconds'] += time.monotonic() - queued_at
+        if not acquired:
+            raise TimeoutError(f"{self.name}の同時実行数の空きを待つ間にタイムアウトしました")
+        try:
+            yield
+        finally:
+            self._slots.release()
+            with self._lock:
+                self._stats['running'] -= 1
+                self._stats['completed'] += 1
+
+    def try_acquire(self) -> bool:
+        """
+        空きがあれば待たずに1つ確保（ヘッジの2つ目のリクエストなど、空きがなければ行わない処理に使う）
+
+        Returns:
+            確保できた場合True（終了時に release で解放する）
+        """
+        if not self._slots.acquire(blocking=False):
+            return False
+        with self._lock:
+            self._stats['running'] += 1
+        return True
+
+    def release(self):
+        """try_acquire で確保した空きを解放"""
+        self._slots.release()
+        with self._lock:
+            self._stats['running'] -= 1
+            self._stats['completed'] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """同時実行数・待ち数・平均待ち時間を取得"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['limit'] = self.limit
+        stats['avg_wait_seconds'] = stats['total_wait_seconds'] / stats['completed'] if stats['completed'] else 0.0
+        return stats
+
+
+class ByteBudget:
+    """処理中の音声データの合計バイト数を制限するクラス"""
+
+    def __init__(self, max_bytes: int):
+        """
+        初期化
+
+        Args:
+            max_bytes: 同時に処理できる合計バイト数
+        """
+        self.max_bytes = max_bytes
+        self.in_use = 0
+        self._lock = threading.Lock()
+
+    def try_reserve(self, size: int) -> bool:
+        """
+        バイト数を確保
+
+        Args:
+            size: 確保するバイト数
+
+        Returns:
+            確保できた場合True（何も処理していない場合は上限を超える1件も受け付ける）
+        """
+        with self._lock:
+            if self.in_use and self.in_use + size > self.max_bytes:
+                return False
+            self.in_use += size
+            return True
+
+    def release(self, size: int):
+        """確保したバイト数を解放"""
+        with self._lock:
+            self.in_use = max(0, self.in_use - size)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """使用中のバイト数を取得"""
+        with self._lock:
+            return {'in_use_bytes': self.in_use, 'max_bytes': self.max_bytes}
+
+
+class TokenBucket:
+    """トークン毎分の上限をトークンバケットで守るクラス"""
+
+    def __init__(self, tokens_per_minute: int):
+        """
+        初期化
+
+        Args:
+            tokens_per_minute: 1分あたりのトークン数（0の場合は制限しない）
+        """
+        self.rate = tokens_per_minute / 60.0
+        self.capacity = tokens_per_minute
+        self.tokens = float(tokens_per_minute)
+        self.pending = 0
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        """経過時間分のトークンを補充（ロック取得済みで呼ぶ）"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def wait_seconds(self, tokens: int) -> float:
+        """
+        トークンを使えるようになるまでの秒数を見積もる（待機中の要求を含む）
+
+        Args:
+            tokens: 使うトークン数
+
+        Returns:
+            待ち時間の秒数
+        """
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            self._refill()
+            shortage = self.pending + min(tokens, self.capacity) - self.tokens
+        return max(0.0, shortage / self.rate)
+
+    def consume(self, tokens: int, deadline: Optional[float] = None):
+        """
+        トークンを使う（足りない場合は補充されるまで待つ）
+
+        Args:
+            tokens: 使うトークン数（上限を超える場合は上限分だけ待つ）
+            deadline: 待機の期限（time.monotonic() の値）
+        """
+        if not self.rate:
+            return
+        tokens = min(tokens, self.capacity)
+        with self._lock:
+            self.pending += tokens
+        try:
+            while True:
+                with self._lock:
+                    self._refill()
+                    if self.tokens >= tokens:
+                        self.tokens -= tokens
+                        return
+                    wait = (tokens - self.tokens) / self.rate
+                if deadline is not None and time.monotonic() + wait > deadline:
+                    raise TimeoutError("OpenAIのトークン毎分の上限のため、期限内に要約を開始できません")
+                time.sleep(min(wait, 1.0))
+        finally:
+            with self._lock:
+                self.pending -= tokens
+
+    def try_consume(self, tokens: int) -> bool:
+        """
+        トークンが足りていれば待たずに使う（待機中の要求がある場合は使わない）
+
+        Args:
+            tokens: 使うトークン数
+
+        Returns:
+            使った場合True
+        """
+        if not self.rate:
+            return True
+        tokens = min(tokens, self.capacity)
+        with self._lock:
+            self._refill()
+            if self.pending or self.tokens < tokens:
+                return False
+            self.tokens -= tokens
+            return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """残りトークン数と待機中のトークン数を取得"""
+        with self._lock:
+            self._refill()
+            return {'tokens_per_minute': self.capacity, 'available': int(self.tokens), 'pending': self.pending}
+
+
+# プロセス内で共有する制限
+stt_limiter = StageLimiter('音声認識', STT_MAX_CONCURRENT)
+llm_limiter = StageLimiter('要約', LLM_MAX_CONCURRENT)
+inflight_bytes = ByteBudget(INFLIGHT_MAX_BYTES)
+openai_tpm = TokenBucket(OPENAI_TPM_LIMIT)
+
+
+def admit_upload(size_bytes: int) -> int:
+    """
+    アップロードを受け付けられるか判定し、処理中のバイト数を確保
+
+    Args:
+        size_bytes: アップロードのバイト数
+
+    Returns:
+        確保したバイト数（処理が終わったら inflight_bytes.release で解放する）
+
+    Raises:
+        AdmissionRejectedError: 受付上限に達している場合
+    """
+    tpm_wait = openai_tpm.wait_seconds(ESTIMATED_TOKENS_PER_JOB)
+    if tpm_wait > ADMISSION_MAX_TPM_WAIT_SECONDS:
+        logger.warning(f"OpenAIのTPM上限のため受付を断りました（待ち時間の見積もり: {tpm_wait:.0f}秒）")
+        raise AdmissionRejectedError("要約APIの利用上限に達しています。しばらくしてから再度お試しください",
+                                     status_code=429, retry_after=tpm_wait)
+
+    conversion = conversion_pool.get_stats()
+    if conversion['queued'] >= conversion['max_queue']:
+        logger.warning("音声変換の待ちが上限のため受付を断りました")
+        raise AdmissionRejectedError("音声変換の待ちが上限に達しています。しばらくしてから再度お試しください",
+                                     retry_after=ADMISSION_RETRY_AFTER_SECONDS)
+
+    if not inflight_bytes.try_reserve(size_bytes):
+        logger.warning(f"処理中の音声の合計サイズが上限のため受付を断りました（{size_bytes}バイト）")
+        raise AdmissionRejectedError("処理中の音声が多すぎます。しばらくしてから再度お試しください",
+                                     retry_after=ADMISSION_RETRY_AFTER_SECONDS)
+    return size_bytes
+
+
+def get_admission_stats() -> Dict[str, Any]:
+    """
+    受付制御の状態を取得
+
+    Returns:
+        段階ごとの同時実行数・処理中のバイト数・TPMの残りの辞書
+    """
+    return {
+        'stt': stt_limiter.get_stats(),
+        'llm': llm_limiter.get_stats(),
+        'inflight': inflight_bytes.get_stats(),
+        'openai_tpm': openai_tpm.get_stats()
+    }
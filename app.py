@@ -3,17 +3,34 @@
 """
 
 import os
+import json
+import base64
+import math
 import logging
-from flask import Flask, render_template, request, send_file, jsonify
+import datetime
+from typing import Optional, Dict, Any
+from flask import Flask, Response, render_template, request, send_file, jsonify
 from werkzeug.utils import secure_filename
-from voice_recognizer import create_voice_recognizer
-from text_summarizer import create_text_summarizer
-from formatter import create_formatter
+from werkzeug.http import http_date
+from job_manager import create_job_manager, JobQueueFullError
+from job_store import create_job_store
+from pipeline import PIPELINES, audio_state, transcript_state, write_output
+from streaming_recognizer import create_streaming_session_manager, StreamingSessionLimitError
+from result_cache import create_result_cache
+from convert_audio import conversion_pool
+from text_summarizer import summary_usage
+from admission import AdmissionRejectedError, admit_upload, inflight_bytes, get_admission_stats
+from operation_tracker import get_operation_tracker
+from upload_stream import UploadRejectedError, open_upload, check_audio_header, save_upload
+from resumable_upload import create_resumable_upload_store
+from gcs_handler import start_staging_sweeper
 from config import (
-    GOOGLE_APPLICATION_CREDENTIALS,
-    OPENAI_API_KEY,
     UPLOAD_FOLDER,
-    MAX_CONTENT_LENGTH
+    OUTPUT_FOLDER,
+    MAX_CONTENT_LENGTH,
+    ADMISSION_RETRY_AFTER_SECONDS,
+    JOB_BACKEND,
+    GCS_SWEEP_INTERVAL_SECONDS
 )
 
 # ログ設定
@@ -28,7 +45,56 @@ app.config['SECRET_KEY'] = 'your-secret-key-here'
 
 # 必要なディレクトリを作成
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs('outputs', exist_ok=True)
+os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+
+# バックグラウンド処理用のワーカープール
+job_manager = create_job_manager()
+
+# 永続ジョブキュー（JOB_BACKEND=sqlite の場合は worker.py が別プロセスで処理）
+job_store = create_job_store() if JOB_BACKEND == 'sqlite' else None
+jobs = job_store or job_manager
+
+# 前回の停止時に完了していなかった非同期認識のポーリングを再開（GCSの一時ファイルも削除される）
+if job_store is None:
+    operation_tracker = get_operation_tracker()
+    operation_tracker.resume()
+    # 認識が中断されて残ったGCSの一時ファイルを定期的に削除（複数のWebプロセスのうちリースを持つ1つだけ）
+    start_staging_sweeper(
+        should_sweep=lambda: operation_tracker.hold_lease('sweeper', GCS_SWEEP_INTERVAL_SECONDS * 2))
+
+# 録音中のストリーミング認識セッション
+stream_manager = create_streaming_session_manager()
+
+# 処理結果キャッシュ（無効時はNone）
+result_cache = create_result_cache()
+
+# 再開可能なアップロード（tus 方式）
+upload_sessions = create_resumable_upload_store()
+TUS_VERSION = '1.0.0'
+
+# 進捗イベント（SSE）が無い間に接続維持用のコメントを送る間隔（秒）
+SSE_HEARTBEAT_SECONDS = 15
+
+
+def submit_job(pipeline: str, state: dict, on_finish=None) -> str:
+    """
+    処理ジョブを登録（永続ジョブキューが有効な場合はキューに、無効な場合はプロセス内のワーカープールに）
+
+    Args:
+        pipeline: 処理段階の種類（'audio' / 'transcript'）
+        state: 段階間で受け渡す辞書
+        on_finish: このプロセスでの処理が終わった時に呼ぶ関数
+
+    Returns:
+        ジョブID
+    """
+    if job_store is None:
+        return job_manager.submit_stages(PIPELINES[pipeline], state, on_finish=on_finish)
+    job_id = job_store.enqueue(pipeline, state)
+    # 処理は別プロセスのワーカーが行うため、このプロセスでの確保はすぐに解放
+    if on_finish is not None:
+        on_finish()
+    return job_id
 
 
 @app.route('/')
@@ -43,99 +109,387 @@ def manifest():
     return send_file('static/manifest.json', mimetype='application/json')
 
 
+def remove_upload(filepath: str, pcm_path: str = None):
+    """処理しないアップロードファイル（と受信中に変換したPCM）を削除"""
+    os.remove(filepath)
+    if pcm_path and os.path.exists(pcm_path):
+        os.remove(pcm_path)
+
+
+def rejected_response(message: str, status_code: int, retry_after: int, **extra):
+    """受付上限に達した場合のレスポンス（Retry-After 付き）"""
+    # Retry-After は整数の秒数で返す（TPMの待ち時間は小数のため切り上げる）
+    retry_after = math.ceil(retry_after)
+    response = jsonify({'error': message, 'retry_after': retry_after, **extra})
+    response.status_code = status_code
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def new_upload_filename(original_filename: str) -> str:
+    """保存用のファイル名を生成（日本語ファイル名に対応するためタイムスタンプを使用）"""
+    # 元のファイル名から拡張子を取得
+    file_ext = os.path.splitext(original_filename)[1] if '.' in original_filename else ''
+    timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    return f"audio_{timestamp}{file_ext}" if file_ext else f"audio_{timestamp}"
+
+
+def submit_upload(filepath: str, filename: str, audio_hash: str, reserved_bytes: int,
+                  pcm_path: Optional[str] = None):
+    """
+    受信が終わった音声の処理ジョブを登録（処理済みの音声はキャッシュから返す）
+
+    Args:
+        filepath: 保存したファイルのパス
+        filename: 保存したファイル名
+        audio_hash: ファイル内容のSHA-256
+        reserved_bytes: admit_upload で確保したバイト数（ジョブの終了時、または返却時に解放）
+        pcm_path: 受信中に変換したPCMファイルのパス
+
+    Returns:
+        レスポンス
+    """
+    try:
+        # 同じ音声を処理済みの場合はキャッシュから返す
+        cache_key = None
+        if result_cache:
+            cache_key = result_cache.make_key(audio_hash)
+            cached = result_cache.get(cache_key)
+            if cached:
+                remove_upload(filepath, pcm_path)
+                if not os.path.exists(os.path.join(OUTPUT_FOLDER, cached['output_file'])):
+                    cached['output_file'] = write_output(filename, cached['transcript'], cached['summary'])
+                return jsonify({'success': True, 'cached': True, 'result': cached})
+        
+        # バックグラウンドで処理（リクエストはすぐに返す）
+        try:
+            # 段階ごとのワーカープールで処理（確保したバイト数は終了時に解放）
+            released_bytes = reserved_bytes
+            job_id = submit_job('audio', audio_state(filepath, filename, cache_key, pcm_path),
+                                on_finish=lambda: inflight_bytes.release(released_bytes))
+        except JobQueueFullError as e:
+            remove_upload(filepath, pcm_path)
+            return rejected_response(str(e), 503, ADMISSION_RETRY_AFTER_SECONDS)
+        # 確保したバイト数はジョブの終了時に解放される
+        reserved_bytes = 0
+        
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status_url': f"/jobs/{job_id}",
+            'events_url': f"/jobs/{job_id}/events"
+        }), 202
+    finally:
+        inflight_bytes.release(reserved_bytes)
+
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    """ファイルアップロードと処理"""
+    """ファイルアップロードと処理ジョブの登録"""
+    reserved_bytes = 0
     try:
-        # ファイルの確認
-        if 'file' not in request.files:
-            return jsonify({'error': 'ファイルが選択されていません'}), 400
-        
-        file = request.files['file']
+        # 上限に達している場合はファイルを受け取る前に断る
+        try:
+            reserved_bytes = admit_upload(request.content_length or 0)
+        except AdmissionRejectedError as e:
+            return rejected_response(str(e), e.status_code, e.retry_after)
         
-        if file.filename == '':
+        # ファイルの確認（本文は request.files で全体を受け取らず、受信しながら読み込む）
+        upload = open_upload(request.stream, request.mimetype, request.mimetype_params.get('boundary'))
+        if upload is None or not upload.filename:
             return jsonify({'error': 'ファイルが選択されていません'}), 400
         
-        # ファイルを保存（日本語ファイル名に対応）
-        # 元のファイル名から拡張子を取得
-        original_filename = file.filename
-        file_ext = os.path.splitext(original_filename)[1] if '.' in original_filename else ''
-        
-        # 安全なファイル名を生成（タイムスタンプを使用）
-        import datetime
-        timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')
-        filename = f"audio_{timestamp}{file_ext}" if file_ext else f"audio_{timestamp}"
+        # 先頭のヘッダーで形式・コーデック・長さを確認し、対応外の音声は残りを受け取る前に断る
+        original_filename = upload.filename
+        header = upload.read_header()
+        audio_format = check_audio_header(header, original_filename, upload.known_size())
         
+        # 受信しながら保存・ハッシュ計算・PCMへの変換を行う（本文全体をメモリに持たない）
+        filename = new_upload_filename(original_filename)
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        saved = save_upload(upload.chunks(), filepath, audio_format)
         
         logger.info(f"ファイルがアップロードされました: {original_filename} -> {filename}")
         
-        # 音声認識
-        logger.info("音声認識を開始...")
-        recognizer = create_voice_recognizer(GOOGLE_APPLICATION_CREDENTIALS)
-        speech_result = recognizer.transcribe_audio(filepath)
-        
-        if not speech_result['success']:
-            return jsonify({'error': f"音声認識エラー: {speech_result['error']}"}), 500
-        
-        transcript = speech_result['text']
-        logger.info(f"音声認識完了: {speech_result['word_count']}語")
-        
-        # テキスト要約
-        logger.info("テキスト要約を開始...")
-        summarizer = create_text_summarizer(OPENAI_API_KEY)
-        summary_result = summarizer.summarize_text(transcript)
-        
-        if not summary_result['success']:
-            return jsonify({'error': f"要約エラー: {summary_result['error']}"}), 500
-        
-        summary_text = summary_result['summary']
-        logger.info("テキスト要約完了")
-        
-        # フォーマット整形
-        logger.info("フォーマット整形を開始...")
-        formatter = create_formatter()
-        format_result = formatter.format_summary(summary_text)
-        
-        if not format_result['success']:
-            formatted_text = summary_text  # 整形に失敗した場合は元のテキストを使用
-            logger.warning("フォーマット整形に失敗しました")
-        else:
-            formatted_text = format_result['formatted_text']
-            logger.info("フォーマット整形完了")
-        
-        # 結果をファイルに保存
-        # ファイル名から拡張子を取得（拡張子がない場合はそのまま使用）
-        if '.' in filename:
-            base_name = filename.rsplit('.', 1)[0]
-        else:
-            base_name = filename
-        output_filename = base_name + '_summary.txt'
-        output_filepath = os.path.join('outputs', output_filename)
-        
-        with open(output_filepath, 'w', encoding='utf-8') as f:
-            f.write(f"【音声ファイル】: {filename}\n")
-            f.write(f"【音声認識結果】\n{transcript}\n\n")
-            f.write(f"【要約結果】\n{formatted_text}\n")
-        
-        return jsonify({
-            'success': True,
-            'transcript': transcript,
-            'summary': formatted_text,
-            'output_file': output_filename
-        })
+        # 確保したバイト数は submit_upload に引き継ぐ
+        reserved_bytes, handed_over = 0, reserved_bytes
+        return submit_upload(filepath, filename, saved['sha256'], handed_over, saved['pcm_path'])
         
+    except UploadRejectedError as e:
+        logger.info(f"アップロードを受け付けませんでした: {e}")
+        return jsonify({'error': str(e)}), e.status_code
+    except Exception as e:
+        logger.error(f"エラー: {e}")
+        return jsonify({'error': str(e)}), 500
+    finally:
+        inflight_bytes.release(reserved_bytes)
+
+
+def tus_response(body=None, status_code: int = 204, session: Optional[Dict[str, Any]] = None):
+    """再開可能なアップロードのレスポンス（受信済みの位置と期限のヘッダー付き）"""
+    response = jsonify(body) if body is not None else Response(status=status_code)
+    response.status_code = status_code
+    response.headers['Tus-Resumable'] = TUS_VERSION
+    response.headers['Cache-Control'] = 'no-store'
+    if session:
+        response.headers['Upload-Offset'] = str(session['offset'])
+        response.headers['Upload-Length'] = str(session['length'])
+        response.headers['Upload-Expires'] = http_date(session['expires_at'])
+    return response
+
+
+@app.route('/uploads', methods=['POST'])
+def create_resumable_upload():
+    """再開可能なアップロードを作成（Upload-Length と Upload-Metadata の filename を指定）"""
+    try:
+        length = int(request.headers.get('Upload-Length', '0'))
+    except ValueError:
+        return tus_response({'error': 'Upload-Length が不正です'}, 400)
+    
+    # Upload-Metadata は「キー base64値」をカンマで区切った形式
+    metadata = {}
+    for item in request.headers.get('Upload-Metadata', '').split(','):
+        key, _, value = item.strip().partition(' ')
+        if key:
+            try:
+                metadata[key] = base64.b64decode(value).decode('utf-8')
+            except (ValueError, UnicodeDecodeError):
+                return tus_response({'error': 'Upload-Metadata が不正です'}, 400)
+    
+    try:
+        session = upload_sessions.create(metadata.get('filename', ''), length)
+    except UploadRejectedError as e:
+        return tus_response({'error': str(e)}, e.status_code)
+    
+    response = tus_response({'success': True, 'upload_id': session['upload_id']}, 201, session)
+    response.headers['Location'] = f"/uploads/{session['upload_id']}"
+    return response
+
+
+@app.route('/uploads/<upload_id>', methods=['HEAD'])
+def resumable_upload_status(upload_id):
+    """受信済みの位置を取得（クライアントはこの位置から続きを送る）"""
+    session = upload_sessions.get(upload_id)
+    if session is None:
+        return tus_response(status_code=404)
+    return tus_response(status_code=200, session=session)
+
+
+@app.route('/uploads/<upload_id>', methods=['PATCH'])
+def append_resumable_upload(upload_id):
+    """Upload-Offset の位置からデータを追記し、最後まで届いたら処理ジョブを登録"""
+    if request.mimetype != 'application/offset+octet-stream':
+        return tus_response({'error': 'Content-Type は application/offset+octet-stream を指定してください'}, 415)
+    try:
+        offset = int(request.headers['Upload-Offset'])
+    except (KeyError, ValueError):
+        return tus_response({'error': 'Upload-Offset が不正です'}, 400)
+    
+    try:
+        session = upload_sessions.append(upload_id, offset, request.stream)
+    except UploadRejectedError as e:
+        logger.info(f"アップロードを受け付けませんでした: {upload_id}: {e}")
+        return tus_response({'error': str(e)}, e.status_code, upload_sessions.get(upload_id))
+    if session['offset'] < session['length']:
+        return tus_response(session=session)
+    
+    # 最後まで届いた場合は処理を受け付ける（上限に達している場合は受信済みのまま再送を待つ）
+    try:
+        reserved_bytes = admit_upload(session['length'])
+    except AdmissionRejectedError as e:
+        response = rejected_response(str(e), e.status_code, e.retry_after)
+        response.headers['Upload-Offset'] = str(session['offset'])
+        return response
+    
+    try:
+        filename = new_upload_filename(session['filename'])
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        audio_hash = upload_sessions.complete(upload_id, filepath)
+    except UploadRejectedError as e:
+        # 同時に届いた最後の送信のうち、他のリクエストが完了させた場合
+        inflight_bytes.release(reserved_bytes)
+        logger.info(f"アップロードを完了できませんでした: {upload_id}: {e}")
+        return tus_response({'error': str(e)}, e.status_code, upload_sessions.get(upload_id))
     except Exception as e:
+        inflight_bytes.release(reserved_bytes)
         logger.error(f"エラー: {e}")
         return jsonify({'error': str(e)}), 500
+    
+    logger.info(f"ファイルがアップロードされました: {session['filename']} -> {filename}")
+    response = submit_upload(filepath, filename, audio_hash, reserved_bytes)
+    if isinstance(response, tuple):
+        response = app.make_response(response)
+    response.headers['Upload-Offset'] = str(session['offset'])
+    response.headers['Tus-Resumable'] = TUS_VERSION
+    return response
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """ジョブの状態と結果を取得"""
+    job = jobs.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'ジョブが見つかりません'}), 404
+    return jsonify(job)
+
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """ジョブの進捗をServer-Sent Eventsで配信（終了時に結果を含む done イベントを送る）"""
+    if jobs.get_job(job_id) is None:
+        return jsonify({'error': 'ジョブが見つかりません'}), 404
+    
+    # 再接続時はブラウザが送る Last-Event-ID の続きから送る
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        last_event_id = 0
+    
+    def generate(after_id):
+        while True:
+            polled = jobs.wait_for_events(job_id, after_id, timeout=SSE_HEARTBEAT_SECONDS)
+            if polled is None:
+                return
+            events, finished = polled
+            if not events:
+                yield ': keepalive\n\n'
+            for event in events:
+                after_id = event['id']
+                yield f"id: {event['id']}\nevent: progress\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+            if finished:
+                job = jobs.get_job(job_id)
+                yield f"event: done\ndata: {json.dumps(job, ensure_ascii=False)}\n\n"
+                return
+    
+    return Response(generate(last_event_id), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+@app.route('/stream', methods=['POST'])
+def start_stream():
+    """ストリーミング認識セッションを開始"""
+    try:
+        session = stream_manager.create_session()
+    except StreamingSessionLimitError as e:
+        return rejected_response(str(e), 503, ADMISSION_RETRY_AFTER_SECONDS)
+    except Exception as e:
+        logger.error(f"ストリーミング認識開始エラー: {e}")
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify({'success': True, 'session_id': session.session_id}), 201
+
+
+@app.route('/stream/<session_id>/chunk', methods=['POST'])
+def stream_chunk(session_id):
+    """録音チャンクを受け取り、現在の認識結果を返す"""
+    session = stream_manager.get_session(session_id)
+    if session is None:
+        return jsonify({'error': 'セッションが見つかりません'}), 404
+    
+    try:
+        chunk = request.get_data()
+        if chunk:
+            session.add_chunk(chunk)
+    except StreamingSessionLimitError as e:
+        return rejected_response(str(e), 503, ADMISSION_RETRY_AFTER_SECONDS)
+    except (ValueError, RuntimeError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(session.get_state())
+
+
+@app.route('/stream/<session_id>')
+def stream_status(session_id):
+    """現在の認識結果（途中結果を含む）を取得"""
+    session = stream_manager.get_session(session_id)
+    if session is None:
+        return jsonify({'error': 'セッションが見つかりません'}), 404
+    return jsonify(session.get_state())
+
+
+@app.route('/stream/<session_id>/stop', methods=['POST'])
+def stop_stream(session_id):
+    """録音終了。確定した認識結果を返し、要約ジョブを登録"""
+    session = stream_manager.get_session(session_id)
+    if session is None:
+        return jsonify({'error': 'セッションが見つかりません'}), 404
+    
+    state = session.stop()
+    stream_manager.remove_session(session_id)
+    
+    if state['error'] or not state['transcript']:
+        return jsonify({'error': state['error'] or '音声認識の結果がありません', 'transcript': state['transcript']}), 500
+    
+    # 要約はバックグラウンドで実行
+    timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    try:
+        job_id = submit_job('transcript', transcript_state(state['transcript'], f"stream_{timestamp}"))
+    except JobQueueFullError as e:
+        return rejected_response(str(e), 503, ADMISSION_RETRY_AFTER_SECONDS, transcript=state['transcript'])
+    
+    return jsonify({
+        'success': True,
+        'transcript': state['transcript'],
+        'job_id': job_id,
+        'status_url': f"/jobs/{job_id}",
+        'events_url': f"/jobs/{job_id}/events"
+    })
+
+
+@app.route('/cache/stats')
+def cache_stats():
+    """処理結果キャッシュの統計情報"""
+    if result_cache is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(result_cache.get_stats(), enabled=True))
+
+
+@app.route('/conversion/stats')
+def conversion_stats():
+    """音声変換の待ち数・変換時間の統計情報"""
+    return jsonify(conversion_pool.get_stats())
+
+
+@app.route('/pipeline/stats')
+def pipeline_stats():
+    """パイプラインの段階ごとの待ち数・平均待ち時間・稼働率"""
+    stats = job_manager.get_stage_stats()
+    if job_store is not None:
+        stats['job_store'] = job_store.get_stats()
+    return jsonify(stats)
+
+
+@app.route('/operations/stats')
+def operations_stats():
+    """非同期認識のOperationの状態ごとの件数"""
+    return jsonify(get_operation_tracker().get_stats())
+
+
+@app.route('/admission/stats')
+def admission_stats():
+    """段階ごとの同時実行数・処理中のバイト数・OpenAIのTPMの状態"""
+    return jsonify(get_admission_stats())
+
+
+@app.route('/uploads/stats')
+def resumable_upload_stats():
+    """受信途中の再開可能なアップロードの件数とバイト数"""
+    return jsonify(upload_sessions.get_stats())
+
+
+@app.route('/summary/stats')
+def summary_stats():
+    """要約APIのトークン数（プロンプトキャッシュ分を含む）と応答時間の統計情報"""
+    return jsonify(summary_usage.get_stats())
 
 
 @app.route('/download/<filename>')
 def download_file(filename):
     """ファイルダウンロード"""
     try:
-        filepath = os.path.join('outputs', secure_filename(filename))
+        filepath = os.path.join(OUTPUT_FOLDER, secure_filename(filename))
         if os.path.exists(filepath):
             return send_file(filepath, as_attachment=True)
         else:
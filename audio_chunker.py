@@ -0,0 +1,70 @@
+"""
+音声分割モジュール
+16kHz・モノラルのPCM音声を無音区間で区切り、同期認識できる長さに分割
+"""
+
+import logging
+from typing import List, Tuple
+import numpy as np
+from configs.speech_config import CHUNK_MAX_SECONDS, CHUNK_MIN_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# 音量を計算するフレーム長（ミリ秒）
+FRAME_MS = 30
+# 無音判定に使う移動平均の長さ（フレーム数、約300ms）
+SMOOTHING_FRAMES = 10
+
+
+def _frame_energy(samples: np.ndarray, frame_size: int) -> np.ndarray:
+    """フレームごとのRMS音量を計算し、移動平均で平滑化"""
+    frame_count = len(samples) // frame_size
+    frames = samples[:frame_count * frame_size].astype(np.float32).reshape(frame_count, frame_size)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    kernel = np.ones(SMOOTHING_FRAMES, dtype=np.float32) / SMOOTHING_FRAMES
+    return np.convolve(rms, kernel, mode='same')
+
+
+def split_on_silence(pcm: bytes, sample_rate: int = 16000,
+                     max_segment_seconds: float = CHUNK_MAX_SECONDS,
+                     min_segment_seconds: float = CHUNK_MIN_SECONDS) -> List[Tuple[int, int]]:
+    """
+    PCM音声を無音の位置で分割
+
+    各区間は max_segment_seconds 以下になり、区切りは
+    min_segment_seconds〜max_segment_seconds の範囲で最も静かな位置を選ぶ
+
+    Args:
+        pcm: 16bitリトルエンディアン・モノラルのPCMデータ
+        sample_rate: サンプリングレート
+        max_segment_seconds: 1区間の最大秒数
+        min_segment_seconds: 1区間の最小秒数
+
+    Returns:
+        (開始サンプル, 終了サンプル) のリスト
+    """
+    samples = np.frombuffer(pcm, dtype='<i2')
+    total = len(samples)
+    max_len = int(max_segment_seconds * sample_rate)
+    if total <= max_len:
+        return [(0, total)]
+
+    frame_size = sample_rate * FRAME_MS // 1000
+    energy = _frame_energy(samples, frame_size)
+    min_frames = int(min_segment_seconds * sample_rate) // frame_size
+    max_frames = max_len // frame_size
+
+    segments = []
+    start_frame = 0
+    total_frames = len(energy)
+    while (total - start_frame * frame_size) > max_len:
+        window = energy[start_frame + min_frames:start_frame + max_frames]
+        cut_frame = start_frame + min_frames + int(np.argmin(window))
+        segments.append((start_frame * frame_size, cut_frame * frame_size))
+        start_frame = cut_frame
+        if start_frame >= total_frames:
+            break
+    segments.append((start_frame * frame_size, total))
+
+    logger.info(f"音声を{len(segments)}区間に分割しました（全体: {total / sample_rate:.1f}秒）")
+    return segments
@@ -0,0 +1,364 @@
+"""
+音声形式判定モジュール
+ファイル先頭のヘッダーからコンテナ・コーデック・サンプリングレートを判定し、
+FFmpegで変換せずにSpeech-to-Textへ渡せるかを調べる
+"""
+
+import os
+import re
+import struct
+import logging
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+# 判定に読み込む先頭バイト数
+HEADER_BYTES = 64 * 1024
+
+# Speech-to-Text がそのまま受け付けるサンプリングレート
+LINEAR16_SAMPLE_RATES = range(8000, 48001)
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+# 録音中に書き出されたWAVの、サイズが確定していない dataチャンクのサイズ
+UNKNOWN_WAV_DATA_SIZES = (0, 0xFFFFFFFF)
+
+# WebM (EBML) の要素ID
+_EBML_MAGIC = b'\x1a\x45\xdf\xa3'
+_WEBM_CLUSTER_ID = b'\x1f\x43\xb6\x75'
+_WEBM_TRACKS_ID = b'\x16\x54\xae\x6b'
+# WebM の CodecID 要素（1バイトのサイズ + 文字列）
+_WEBM_AUDIO_CODEC = re.compile(rb'\x86[\x81-\xbf](A_[A-Z0-9/_]+)')
+
+# ヘッダーに情報がなくコーデックを判定できない場合の値（変換時に判定する）
+UNKNOWN_CODEC = 'unknown'
+
+# WAV の形式コードとコーデック名（FFmpegで変換できるもの）
+_WAV_CODECS = {
+    0x0001: 'pcm', 0x0002: 'adpcm_ms', 0x0003: 'pcm_float', 0x0006: 'alaw',
+    0x0007: 'mulaw', 0x0011: 'adpcm_ima', 0x0031: 'gsm', 0x0055: 'mp3'
+}
+# Ogg の最初のパケットの識別子とコーデック名
+_OGG_CODECS = ((b'OpusHead', 'opus'), (b'\x01vorbis', 'vorbis'), (b'\x7fFLAC', 'flac'), (b'Speex   ', 'speex'))
+# WebM の CodecID とコーデック名
+_WEBM_CODECS = (('A_OPUS', 'opus'), ('A_VORBIS', 'vorbis'), ('A_AAC', 'aac'), ('A_MPEG/L3', 'mp3'),
+                ('A_FLAC', 'flac'), ('A_PCM', 'pcm'))
+# MP4 のサンプルエントリとコーデック名
+_MP4_CODECS = ((b'mp4a', 'aac'), (b'alac', 'alac'), (b'.mp3', 'mp3'), (b'Opus', 'opus'), (b'fLaC', 'flac'))
+
+# MPEG Audio Layer III のビットレート（kbps）とサンプリングレート（バージョンごと）
+_MP3_BITRATES = {
+    'mpeg1': (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    'mpeg2': (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+}
+_MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+# ID3タグの後にフレームを探す範囲
+_MP3_SYNC_SEARCH_BYTES = 4096
+
+
+def _new_format(container: str) -> Dict[str, Any]:
+    """判定結果の辞書を作成"""
+    return {
+        'container': container,
+        'codec': None,
+        'encoding': None,
+        'sample_rate_hertz': None,
+        'channels': None,
+        'bits_per_sample': None,
+        'duration_seconds': None,
+        'data_offset': None,
+        'data_size': None,
+        'pre_skip': 0,
+        'recognizer_ready': False
+    }
+
+
+def _sniff_wav(header: bytes) -> Optional[Dict[str, Any]]:
+    """RIFF/WAVE の fmt チャンクと data チャンクを解析"""
+    fmt = _new_format('wav')
+    pos = 12
+    audio_format = None
+    byte_rate = None
+    while pos + 8 <= len(header):
+        chunk_id = header[pos:pos + 4]
+        chunk_size = struct.unpack('<I', header[pos + 4:pos + 8])[0]
+        body = pos + 8
+        if chunk_id == b'fmt ' and body + 16 <= len(header):
+            audio_format, channels, sample_rate, byte_rate, _, bits = struct.unpack('<HHIIHH', header[body:body + 16])
+            # WAVE_FORMAT_EXTENSIBLE の場合はサブフォーマットの先頭2バイトが実際の形式
+            if audio_format == 0xFFFE and body + 26 <= len(header):
+                audio_format = struct.unpack('<H', header[body + 24:body + 26])[0]
+            fmt['codec'] = _WAV_CODECS.get(audio_format)
+            fmt['channels'] = channels
+            fmt['sample_rate_hertz'] = sample_rate
+            fmt['bits_per_sample'] = bits
+        elif chunk_id == b'data':
+            fmt['data_offset'] = body
+            fmt['data_size'] = chunk_size
+            break
+        pos = body + chunk_size + (chunk_size & 1)
+
+    if audio_format is None:
+        return None
+
+    if audio_format == 1 and fmt['bits_per_sample'] == 16:
+        fmt['encoding'] = 'LINEAR16'
+    if fmt['data_size'] not in (None,) + UNKNOWN_WAV_DATA_SIZES and byte_rate:
+        fmt['duration_seconds'] = fmt['data_size'] / byte_rate
+    fmt['recognizer_ready'] = (
+        fmt['encoding'] == 'LINEAR16'
+        and fmt['channels'] == 1
+        and fmt['sample_rate_hertz'] in LINEAR16_SAMPLE_RATES
+        and fmt['data_offset'] is not None
+    )
+    return fmt
+
+
+def _sniff_flac(header: bytes) -> Optional[Dict[str, Any]]:
+    """FLAC の STREAMINFO ブロックを解析"""
+    # 'fLaC' + ブロックヘッダー(4) + STREAMINFO(34)
+    if len(header) < 42 or header[4] & 0x7F != 0:
+        return None
+    info = header[8:42]
+    packed = int.from_bytes(info[10:18], 'big')
+    sample_rate = packed >> 44
+    channels = ((packed >> 41) & 0x7) + 1
+    bits = ((packed >> 36) & 0x1F) + 1
+    total_samples = packed & 0xFFFFFFFFF
+
+    fmt = _new_format('flac')
+    fmt['codec'] = 'flac'
+    fmt['encoding'] = 'FLAC'
+    fmt['sample_rate_hertz'] = sample_rate
+    fmt['channels'] = channels
+    fmt['bits_per_sample'] = bits
+    if sample_rate and total_samples:
+        fmt['duration_seconds'] = total_samples / sample_rate
+    fmt['recognizer_ready'] = channels == 1 and bits in (16, 24) and sample_rate in LINEAR16_SAMPLE_RATES
+    return fmt
+
+
+def _sniff_ogg(header: bytes) -> Optional[Dict[str, Any]]:
+    """Ogg の最初のページにある OpusHead を解析"""
+    if len(header) < 27:
+        return None
+    segment_count = header[26]
+    packet = 27 + segment_count
+    fmt = _new_format('ogg')
+    fmt['codec'] = next((codec for magic, codec in _OGG_CODECS
+                         if header[packet:packet + len(magic)] == magic), None)
+    if fmt['codec'] != 'opus' or len(header) < packet + 16:
+        # Vorbisなど、Opus以外のOggは変換が必要
+        return fmt
+
+    channels = header[packet + 9]
+    pre_skip, input_rate = struct.unpack('<HI', header[packet + 10:packet + 16])
+    fmt['encoding'] = 'OGG_OPUS'
+    fmt['channels'] = channels
+    fmt['pre_skip'] = pre_skip
+    # Opusは48kHzで復号されるため、元のレートが対応外の場合は48kHzを指定
+    fmt['sample_rate_hertz'] = input_rate if input_rate in OPUS_SAMPLE_RATES else 48000
+    fmt['recognizer_ready'] = channels == 1
+    return fmt
+
+
+def _ebml_float(header: bytes, element_id: bytes) -> Optional[float]:
+    """EBMLのfloat要素（4または8バイト）を検索して値を返す"""
+    for size_byte, size, code in ((b'\x84', 4, '>f'), (b'\x88', 8, '>d')):
+        pos = header.find(element_id + size_byte)
+        if pos >= 0:
+            start = pos + len(element_id) + 1
+            return struct.unpack(code, header[start:start + size])[0]
+    return None
+
+
+def _sniff_webm(header: bytes) -> Optional[Dict[str, Any]]:
+    """WebM の Segment Info / Tracks からコーデックと長さを取得"""
+    # 最初のClusterより前（メタデータ部分）だけを対象にする
+    cluster = header.find(_WEBM_CLUSTER_ID)
+    meta = header if cluster < 0 else header[:cluster]
+
+    fmt = _new_format('webm')
+    codec_ids = [match.decode('ascii') for match in _WEBM_AUDIO_CODEC.findall(meta)]
+    fmt['codec'] = next((codec for prefix, codec in _WEBM_CODECS
+                         if any(codec_id.startswith(prefix) for codec_id in codec_ids)), None)
+    if fmt['codec'] is None and _WEBM_TRACKS_ID not in meta:
+        # Tracks が先頭に含まれない場合は判定できない
+        fmt['codec'] = UNKNOWN_CODEC
+    if b'A_OPUS' not in meta:
+        return fmt
+
+    fmt['encoding'] = 'WEBM_OPUS'
+    channels_pos = meta.find(b'\x9f\x81')
+    fmt['channels'] = meta[channels_pos + 2] if channels_pos >= 0 else None
+    sample_rate = _ebml_float(meta, b'\xb5')
+    fmt['sample_rate_hertz'] = int(sample_rate) if sample_rate and int(sample_rate) in OPUS_SAMPLE_RATES else 48000
+
+    # Duration は TimecodeScale（既定 1ms）単位
+    duration = _ebml_float(meta, b'\x44\x89')
+    if duration:
+        scale_pos = meta.find(b'\x2a\xd7\xb1')
+        scale = 1000000
+        if scale_pos >= 0:
+            length = meta[scale_pos + 3] & 0x0F
+            scale = int.from_bytes(meta[scale_pos + 4:scale_pos + 4 + length], 'big')
+        fmt['duration_seconds'] = duration * scale / 1e9
+
+    fmt['recognizer_ready'] = fmt['channels'] == 1
+    return fmt
+
+
+def _mp3_frame(header: bytes, pos: int) -> Optional[Dict[str, Any]]:
+    """MPEG Audio のフレームヘッダーを解析（不正な値の場合None）"""
+    if pos + 4 > len(header) or header[pos] != 0xFF or header[pos + 1] & 0xE0 != 0xE0:
+        return None
+    version = (header[pos + 1] >> 3) & 0x3
+    layer = (header[pos + 1] >> 1) & 0x3
+    bitrate_index = header[pos + 2] >> 4
+    rate_index = (header[pos + 2] >> 2) & 0x3
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version == 3
+    return {
+        'bitrate': _MP3_BITRATES['mpeg1' if mpeg1 else 'mpeg2'][bitrate_index] * 1000,
+        'sample_rate': _MP3_SAMPLE_RATES[version][rate_index],
+        'channels': 1 if header[pos + 3] >> 6 == 3 else 2,
+        'samples_per_frame': 1152 if mpeg1 else 576,
+        # Xing / Info ヘッダーはサイド情報の直後にある
+        'side_info': (17 if header[pos + 3] >> 6 == 3 else 32) if mpeg1 else (9 if header[pos + 3] >> 6 == 3 else 17)
+    }
+
+
+def _sniff_mp3(header: bytes, total_size: Optional[int]) -> Optional[Dict[str, Any]]:
+    """MP3 の最初のフレームと Xing / VBRI ヘッダーから長さを計算"""
+    start = 0
+    if header[:3] == b'ID3':
+        start = 10 + ((header[6] & 0x7F) << 21 | (header[7] & 0x7F) << 14 | (header[8] & 0x7F) << 7 | (header[9] & 0x7F))
+        if header[5] & 0x10:
+            start += 10
+    # タグの後のパディングを読み飛ばして最初のフレームを探す
+    for pos in range(start, min(len(header), start + _MP3_SYNC_SEARCH_BYTES)):
+        frame = _mp3_frame(header, pos)
+        if frame:
+            break
+    else:
+        return None
+
+    fmt = _new_format('mp3')
+    fmt['codec'] = 'mp3'
+    fmt['sample_rate_hertz'] = frame['sample_rate']
+    fmt['channels'] = frame['channels']
+    fmt['data_offset'] = pos
+
+    # VBRの場合は Xing / Info または VBRI ヘッダーのフレーム数から計算
+    frames = None
+    xing = pos + 4 + frame['side_info']
+    if header[xing:xing + 4] in (b'Xing', b'Info') and header[xing + 7] & 0x1:
+        frames = struct.unpack('>I', header[xing + 8:xing + 12])[0]
+    elif header[pos + 36:pos + 40] == b'VBRI':
+        frames = struct.unpack('>I', header[pos + 50:pos + 54])[0]
+    if frames:
+        fmt['duration_seconds'] = frames * frame['samples_per_frame'] / frame['sample_rate']
+    elif total_size:
+        # CBRの場合はサイズとビットレートから推定
+        fmt['duration_seconds'] = (total_size - pos) * 8 / frame['bitrate']
+    return fmt
+
+
+def _sniff_mp4(header: bytes) -> Optional[Dict[str, Any]]:
+    """MP4 / M4A の moov ボックス（先頭にある場合）から長さとコーデックを取得"""
+    fmt = _new_format('mp4')
+    fmt['codec'] = UNKNOWN_CODEC
+    pos = 0
+    while pos + 8 <= len(header):
+        size, box_type = struct.unpack('>I4s', header[pos:pos + 8])
+        if size == 1:
+            size = struct.unpack('>Q', header[pos + 8:pos + 16])[0]
+        elif size == 0:
+            size = len(header) - pos
+        if size < 8:
+            break
+        if box_type == b'moov':
+            moov = header[pos:pos + size]
+            mvhd = moov.find(b'mvhd')
+            if mvhd >= 0:
+                # version 1 は作成・更新日時と長さが64bit
+                if moov[mvhd + 4] == 1:
+                    timescale, duration = struct.unpack('>IQ', moov[mvhd + 24:mvhd + 36])
+                else:
+                    timescale, duration = struct.unpack('>II', moov[mvhd + 16:mvhd + 24])
+                if timescale:
+                    fmt['duration_seconds'] = duration / timescale
+            codec = next((codec for entry, codec in _MP4_CODECS if entry in moov), None)
+            # moov 全体が含まれていてコーデックが見つからない場合は音声トラックがない
+            fmt['codec'] = codec or (None if pos + size <= len(header) else UNKNOWN_CODEC)
+            break
+        pos += size
+    return fmt
+
+
+def sniff_audio_header(header: bytes, total_size: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    先頭バイトから音声形式を判定
+
+    Args:
+        header: ファイル先頭のバイト列（64KB程度）
+        total_size: ファイル全体のバイト数（CBRのMP3の長さの推定に使用）
+
+    Returns:
+        判定結果の辞書（判定できない場合None）
+    """
+    try:
+        if header[:4] == b'RIFF' and header[8:12] == b'WAVE':
+            return _sniff_wav(header)
+        if header[:4] == b'fLaC':
+            return _sniff_flac(header)
+        if header[:4] == b'OggS':
+            return _sniff_ogg(header)
+        if header[:4] == _EBML_MAGIC:
+            return _sniff_webm(header)
+        if header[4:8] == b'ftyp':
+            return _sniff_mp4(header)
+        if header[:3] == b'ID3' or _mp3_frame(header, 0):
+            return _sniff_mp3(header, total_size)
+    except (struct.error, IndexError) as e:
+        logger.warning(f"音声ヘッダーの解析に失敗しました: {e}")
+    return None
+
+
+def _ogg_duration(file_path: str, pre_skip: int) -> Optional[float]:
+    """Oggの最後のページのグラニュール位置から長さを計算"""
+    size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        f.seek(max(0, size - HEADER_BYTES))
+        tail = f.read()
+    pos = tail.rfind(b'OggS')
+    if pos < 0 or pos + 14 > len(tail):
+        return None
+    granule = struct.unpack('<q', tail[pos + 6:pos + 14])[0]
+    # Opusのグラニュール位置は常に48kHz単位
+    return max(0, granule - pre_skip) / 48000 if granule > 0 else None
+
+
+def probe_audio_file(file_path: str) -> Optional[Dict[str, Any]]:
+    """
+    音声ファイルの形式を判定
+
+    Args:
+        file_path: 音声ファイルのパス
+
+    Returns:
+        判定結果の辞書（判定できない場合None）
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            header = f.read(HEADER_BYTES)
+        fmt = sniff_audio_header(header, os.path.getsize(file_path))
+        if fmt and fmt['encoding'] == 'OGG_OPUS':
+            fmt['duration_seconds'] = _ogg_duration(file_path, fmt['pre_skip'])
+        if fmt:
+            logger.info(f"音声形式: {fmt['container']}/{fmt['codec']}, "
+                        f"{fmt['sample_rate_hertz']}Hz, {fmt['channels']}ch, 変換不要: {fmt['recognizer_ready']}")
+        return fmt
+    except OSError as e:
+        logger.warning(f"音声形式の判定に失敗しました: {e}")
+        return None
@@ -0,0 +1,197 @@
+"""
+外部API呼び出しの再試行・ヘッジングモジュール
+一時的なエラーはジッター付きの指数バックオフで再試行し、応答が遅い場合は
+同じリクエストをもう1つ送って先に返った方を使う（いずれも全体の期限内で行う）
+"""
+
+import time
+import queue
+import random
+import logging
+import threading
+from collections import deque
+from typing import Optional, Callable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class DeadlineExceededError(Exception):
+    """全体の期限内に呼び出しが完了しなかった場合の例外"""
+
+
+class LatencyTracker:
+    """直近の応答時間を保持し、パーセンタイルを計算するクラス"""
+
+    def __init__(self, window: int = 200):
+        """
+        初期化
+
+        Args:
+            window: 保持する応答時間の件数
+        """
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        """応答時間を記録"""
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percent: float, min_samples: int = 1) -> Optional[float]:
+        """
+        応答時間のパーセンタイルを取得
+
+        Args:
+            percent: パーセンタイル（0〜100）
+            min_samples: 計算に必要な最小件数
+
+        Returns:
+            応答時間の秒数（件数が足りない場合None）
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples or len(samples) < min_samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * percent / 100))
+        return samples[index]
+
+
+def backoff_delay(attempt: int, base_seconds: float, max_seconds: float) -> float:
+    """
+    再試行までの待ち時間（full jitter の指数バックオフ）
+
+    Args:
+        attempt: 失敗した回数（1から）
+        base_seconds: 1回目の待ち時間の上限
+        max_seconds: 待ち時間の上限
+
+    Returns:
+        待ち時間の秒数
+    """
+    return random.uniform(0, min(max_seconds, base_seconds * (2 ** (attempt - 1))))
+
+
+def call_with_retries(func: Callable[[float], T], deadline: float, max_attempts: int,
+                      is_retryable: Callable[[Exception], bool],
+                      base_seconds: float = 0.5, max_seconds: float = 8.0,
+                      retry_after: Optional[Callable[[Exception], Optional[float]]] = None,
+                      name: str = 'call') -> T:
+    """
+    一時的なエラーを再試行しながら関数を呼び出す
+
+    Args:
+        func: 呼び出す関数（期限までの残り秒数を受け取る）
+        deadline: 全体の期限（time.monotonic() の値）
+        max_attempts: 最大試行回数
+        is_retryable: 再試行できるエラーかどうかを判定する関数
+        base_seconds: バックオフの基準秒数
+        max_seconds: バックオフの上限秒数
+        retry_after: エラーからサーバー指定の待ち時間（Retry-After）を取得する関数
+        name: ログに出力する名前
+
+    Returns:
+        関数の戻り値
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceededError(f"{name}: 期限内に完了しませんでした（{attempt - 1}回試行）")
+        try:
+            return func(remaining)
+        except Exception as e:
+            if attempt >= max_attempts or not is_retryable(e):
+                raise
+            delay = backoff_delay(attempt, base_seconds, max_seconds)
+            server_delay = retry_after(e) if retry_after else None
+            if server_delay is not None:
+                delay = max(delay, server_delay)
+            # 待っている間に期限を過ぎる場合は再試行しない
+            if time.monotonic() + delay >= deadline:
+                raise
+            logger.warning(f"{name}: {e} のため{delay:.1f}秒後に再試行します（{attempt}/{max_attempts}）")
+            time.sleep(delay)
+
+
+def hedged_call(func: Callable[[float], T], deadline: float, hedge_after: Optional[float],
+                discard: Optional[Callable[[T], None]] = None, name: str = 'call',
+                acquire_hedge: Optional[Callable[[], Optional[Callable[[], None]]]] = None) -> T:
+    """
+    hedge_after 秒以内に応答がない場合に同じ呼び出しをもう1つ開始し、先に成功した方を返す
+
+    Args:
+        func: 呼び出す関数（期限までの残り秒数を受け取る）
+        deadline: 全体の期限（time.monotonic() の値）
+        hedge_after: 2つ目の呼び出しを開始するまでの秒数（Noneの場合はヘッジしない）
+        discard: 使わなかった方の結果を後片付けする関数（ストリームを閉じるなど）
+        name: ログに出力する名前
+        acquire_hedge: 2つ目の呼び出しの前に呼び、同時実行数・レート制限の枠を確保する関数
+                       （解放する関数を返す。Noneを返した場合はヘッジしない）
+
+    Returns:
+        先に成功した呼び出しの戻り値
+    """
+    results = queue.Queue()
+
+    def run(index: int, release: Optional[Callable[[], None]] = None):
+        try:
+            results.put((index, func(max(0.001, deadline - time.monotonic())), None))
+        except Exception as e:
+            results.put((index, None, e))
+        finally:
+            if release is not None:
+                release()
+
+    threading.Thread(target=run, args=(0,), name=f"{name}-0", daemon=True).start()
+    launched = 1
+    errors = []
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceededError(f"{name}: 期限内に応答がありませんでした")
+        waiting_for_hedge = launched == 1 and hedge_after is not None and not errors
+        try:
+            index, value, error = results.get(timeout=min(remaining, hedge_after) if waiting_for_hedge else remaining)
+        except queue.Empty:
+            if waiting_for_hedge:
+                release = acquire_hedge() if acquire_hedge is not None else None
+                if acquire_hedge is not None and release is None:
+                    # 枠に空きがない場合は、負荷を増やさないよう1つ目の応答を待つ
+                    logger.info(f"{name}: 同時実行数・レート制限に空きがないためヘッジしません")
+                    hedge_after = None
+                    continue
+                logger.info(f"{name}: {hedge_after:.1f}秒以内に応答がないため、同じリクエストをもう1つ送信します")
+                threading.Thread(target=run, args=(1, release), name=f"{name}-1", daemon=True).start()
+                launched = 2
+                continue
+            raise DeadlineExceededError(f"{name}: 期限内に応答がありませんでした")
+
+        if error is None:
+            if launched == 2 and discard is not None:
+                # 負けた方の結果が届いたら後片付けする
+                threading.Thread(target=_discard_loser, args=(results, len(errors), discard),
+                                 name=f"{name}-discard", daemon=True).start()
+            if index == 1:
+                logger.info(f"{name}: 2つ目のリクエストが先に応答しました")
+            return value
+
+        errors.append(error)
+        if len(errors) >= launched:
+            raise errors[0]
+
+
+def _discard_loser(results: queue.Queue, finished: int, discard: Callable):
+    """ヘッジで使わなかった方の結果を待って後片付け"""
+    if finished >= 1:
+        return
+    try:
+        _, value, error = results.get(timeout=600)
+        if error is None:
+            discard(value)
+    except queue.Empty:
+        pass
+    except Exception as e:
+        logger.warning(f"ヘッジの後片付けに失敗しました: {e}")
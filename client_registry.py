@@ -0,0 +1,188 @@
+"""
+APIクライアント管理モジュール
+Speech-to-Text / OpenAI / Cloud Storage のクライアントをプロセス内で共有
+"""
+
+import os
+import logging
+import threading
+from typing import Optional, Dict, Any
+import httpx
+import google.auth
+from google.oauth2 import service_account
+from google.auth.exceptions import DefaultCredentialsError
+from google.auth.transport.requests import AuthorizedSession
+from google.cloud import speech, storage
+from google.cloud.speech_v1.services.speech.transports import SpeechGrpcTransport
+from openai import OpenAI
+from requests.adapters import HTTPAdapter
+from config import (
+    GOOGLE_APPLICATION_CREDENTIALS,
+    OPENAI_API_KEY,
+    OPENAI_MAX_CONNECTIONS,
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    OPENAI_TIMEOUT_SECONDS,
+    GCS_HTTP_POOL_SIZE,
+    SPEECH_GRPC_KEEPALIVE_MS
+)
+
+# ログ設定
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 作成済みクライアント（種類と認証情報ごとに1つ）
+_clients: Dict[tuple, Any] = {}
+_lock = threading.Lock()
+
+_CLOUD_PLATFORM_SCOPE = 'https://www.googleapis.com/auth/cloud-platform'
+
+
+def _get_or_create(key: tuple, factory):
+    """クライアントを取得（未作成の場合はロックを取って1度だけ作成）"""
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = factory()
+            _clients[key] = client
+    return client
+
+
+def _load_google_credentials(credentials_path: Optional[str]):
+    """
+    Google Cloud認証情報を読み込む
+
+    環境変数 GOOGLE_APPLICATION_CREDENTIALS は書き換えず、
+    ファイルがない場合はアプリケーションデフォルト認証情報を使用する
+    """
+    if credentials_path and os.path.exists(credentials_path):
+        logger.info(f"認証情報を読み込みます: {credentials_path}")
+        return service_account.Credentials.from_service_account_file(
+            credentials_path, scopes=[_CLOUD_PLATFORM_SCOPE]
+        )
+
+    if credentials_path:
+        logger.warning(f"認証情報ファイルが見つかりません。デフォルト認証情報を使用します: {credentials_path}")
+    credentials, _ = google.auth.default(scopes=[_CLOUD_PLATFORM_SCOPE])
+    return credentials
+
+
+def has_google_credentials(credentials_path: Optional[str] = GOOGLE_APPLICATION_CREDENTIALS) -> bool:
+    """
+    Google Cloudの認証情報（ファイルまたはアプリケーションデフォルト認証情報）が設定されているか確認
+
+    Args:
+        credentials_path: Google Cloud認証情報のパス
+
+    Returns:
+        認証情報を読み込める場合True
+    """
+    if credentials_path and os.path.exists(credentials_path):
+        return True
+    try:
+        google.auth.default(scopes=[_CLOUD_PLATFORM_SCOPE])
+    except DefaultCredentialsError:
+        return False
+    return True
+
+
+def get_speech_client(credentials_path: Optional[str] = GOOGLE_APPLICATION_CREDENTIALS) -> speech.SpeechClient:
+    """
+    共有の Speech-to-Text クライアントを取得
+
+    Args:
+        credentials_path: Google Cloud認証情報のパス
+
+    Returns:
+        SpeechClientインスタンス
+    """
+    def factory():
+        credentials = _load_google_credentials(credentials_path)
+        # 1本のgRPCチャネルを使い回し、keepaliveで接続を維持する
+        channel = SpeechGrpcTransport.create_channel(
+            credentials=credentials,
+            options=[
+                ('grpc.keepalive_time_ms', SPEECH_GRPC_KEEPALIVE_MS),
+                ('grpc.keepalive_permit_without_calls', 1),
+                ('grpc.max_send_message_length', -1),
+                ('grpc.max_receive_message_length', -1),
+            ]
+        )
+        client = speech.SpeechClient(transport=SpeechGrpcTransport(channel=channel))
+        logger.info("共有の Google Cloud Speech クライアントを作成しました")
+        return client
+
+    return _get_or_create(('speech', credentials_path), factory)
+
+
+def get_openai_client(api_key: Optional[str] = None) -> OpenAI:
+    """
+    共有の OpenAI クライアントを取得
+
+    Args:
+        api_key: OpenAI APIキー
+
+    Returns:
+        OpenAIインスタンス
+    """
+    api_key = api_key or OPENAI_API_KEY
+    if not api_key:
+        raise ValueError("OpenAI APIキーが設定されていません")
+
+    def factory():
+        # keep-alive接続をプールして再利用する
+        http_client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS
+            ),
+            timeout=OPENAI_TIMEOUT_SECONDS
+        )
+        client = OpenAI(api_key=api_key, http_client=http_client)
+        logger.info(f"共有の OpenAI クライアントを作成しました (最大接続数: {OPENAI_MAX_CONNECTIONS})")
+        return client
+
+    return _get_or_create(('openai', api_key), factory)
+
+
+def get_storage_client(credentials_path: Optional[str] = GOOGLE_APPLICATION_CREDENTIALS) -> storage.Client:
+    """
+    共有の Cloud Storage クライアントを取得
+
+    Args:
+        credentials_path: Google Cloud認証情報のパス
+
+    Returns:
+        storage.Clientインスタンス
+    """
+    def factory():
+        credentials = _load_google_credentials(credentials_path)
+        session = AuthorizedSession(credentials)
+        adapter = HTTPAdapter(pool_connections=GCS_HTTP_POOL_SIZE, pool_maxsize=GCS_HTTP_POOL_SIZE)
+        session.mount('https://', adapter)
+        client = storage.Client(
+            project=getattr(credentials, 'project_id', None),
+            credentials=credentials,
+            _http=session
+        )
+        logger.info(f"共有の Cloud Storage クライアントを作成しました (接続プール: {GCS_HTTP_POOL_SIZE})")
+        return client
+
+    return _get_or_create(('storage', credentials_path), factory)
+
+
+def close_clients():
+    """作成済みのクライアントを閉じる"""
+    with _lock:
+        for key, client in _clients.items():
+            try:
+                if key[0] == 'speech':
+                    client.transport.close()
+                else:
+                    client.close()
+            except Exception as e:
+                logger.warning(f"クライアント終了エラー: {e}")
+        _clients.clear()
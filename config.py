@@ -43,3 +43,103 @@ OUTPUT_FOLDER = os.path.join(_script_dir, 'outputs')
 
 # Google Cloud Storage 設定
 GCS_BUCKET_NAME = os.getenv('GCS_BUCKET_NAME', 'voice-summary-audio')
+
+# バックグラウンドジョブ設定
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))  # 段階に分けないジョブの同時処理数
+JOB_MAX_QUEUE = int(os.getenv('JOB_MAX_QUEUE', '20'))  # 処理待ちの上限
+JOB_RETENTION_SECONDS = int(os.getenv('JOB_RETENTION_SECONDS', '3600'))  # 終了ジョブの保持時間
+
+# APIクライアントの接続設定（プロセス内で共有）
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', '20'))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', '10'))
+OPENAI_TIMEOUT_SECONDS = float(os.getenv('OPENAI_TIMEOUT_SECONDS', '120'))
+GCS_HTTP_POOL_SIZE = int(os.getenv('GCS_HTTP_POOL_SIZE', '10'))
+SPEECH_GRPC_KEEPALIVE_MS = int(os.getenv('SPEECH_GRPC_KEEPALIVE_MS', '30000'))
+
+# 要約モデル
+SUMMARY_MODEL = os.getenv('SUMMARY_MODEL', 'gpt-4o')
+SUMMARY_MAX_TOKENS = int(os.getenv('SUMMARY_MAX_TOKENS', '2000'))
+
+# 音声認識結果の長さによる要約モデルの振り分け（短い報告は軽量なモデル・簡潔なプロンプトで要約）
+SUMMARY_SHORT_MAX_CHARS = int(os.getenv('SUMMARY_SHORT_MAX_CHARS', '300'))  # 0で無効
+SUMMARY_SHORT_MAX_WORDS = int(os.getenv('SUMMARY_SHORT_MAX_WORDS', '80'))
+SUMMARY_SHORT_MODEL = os.getenv('SUMMARY_SHORT_MODEL', 'gpt-4o-mini')
+SUMMARY_SHORT_MAX_TOKENS = int(os.getenv('SUMMARY_SHORT_MAX_TOKENS', '600'))
+SUMMARY_MEDIUM_MAX_CHARS = int(os.getenv('SUMMARY_MEDIUM_MAX_CHARS', '3000'))  # 0で無効
+SUMMARY_MEDIUM_MODEL = os.getenv('SUMMARY_MEDIUM_MODEL', SUMMARY_MODEL)
+SUMMARY_MEDIUM_MAX_TOKENS = int(os.getenv('SUMMARY_MEDIUM_MAX_TOKENS', '1200'))
+
+# 要約APIの再試行・ヘッジ設定
+SUMMARY_DEADLINE_SECONDS = float(os.getenv('SUMMARY_DEADLINE_SECONDS', '180'))  # 再試行を含めた1回の要約の期限
+SUMMARY_MAX_ATTEMPTS = int(os.getenv('SUMMARY_MAX_ATTEMPTS', '3'))  # 一時的なエラーの最大試行回数
+SUMMARY_RETRY_BASE_SECONDS = float(os.getenv('SUMMARY_RETRY_BASE_SECONDS', '0.5'))  # バックオフの基準秒数
+SUMMARY_RETRY_MAX_SECONDS = float(os.getenv('SUMMARY_RETRY_MAX_SECONDS', '8'))  # バックオフの上限秒数
+SUMMARY_HEDGE_ENABLED = os.getenv('SUMMARY_HEDGE_ENABLED', 'True').lower() == 'true'  # 応答が遅い場合に同じリクエストをもう1つ送る
+SUMMARY_HEDGE_PERCENTILE = float(os.getenv('SUMMARY_HEDGE_PERCENTILE', '95'))  # 直近の応答時間のこのパーセンタイルを超えたらヘッジ
+SUMMARY_HEDGE_MIN_SECONDS = float(os.getenv('SUMMARY_HEDGE_MIN_SECONDS', '2'))  # ヘッジするまでの最小秒数
+SUMMARY_HEDGE_MIN_SAMPLES = int(os.getenv('SUMMARY_HEDGE_MIN_SAMPLES', '20'))  # ヘッジに必要な応答時間の記録数
+
+# 長い音声認識結果の分割要約（分割した部分を並列に要約して結合）
+SUMMARY_CHUNK_MAX_TOKENS = int(os.getenv('SUMMARY_CHUNK_MAX_TOKENS', '6000'))  # 1回の要約に渡す最大トークン数（推定）
+SUMMARY_CHUNK_WORKERS = int(os.getenv('SUMMARY_CHUNK_WORKERS', '4'))  # 同時に要約する部分の数
+
+# 処理結果キャッシュ設定（同じ音声の再アップロード時に再処理しない）
+CACHE_FOLDER = os.getenv('CACHE_FOLDER', os.path.join(_script_dir, 'cache'))
+RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', 'True').lower() == 'true'
+RESULT_CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', str(50 * 1024 * 1024)))  # 50MB
+RESULT_CACHE_MAX_AGE_SECONDS = int(os.getenv('RESULT_CACHE_MAX_AGE_SECONDS', str(30 * 24 * 3600)))  # 30日
+
+# 音声変換（FFmpeg）の同時実行設定
+CONVERSION_WORKERS = int(os.getenv('CONVERSION_WORKERS', str(os.cpu_count() or 1)))  # 既定はCPUコア数
+CONVERSION_MAX_QUEUE = int(os.getenv('CONVERSION_MAX_QUEUE', '20'))  # 変換待ちの上限
+CONVERSION_TIMEOUT_SECONDS = float(os.getenv('CONVERSION_TIMEOUT_SECONDS', '300'))  # 1件あたりのタイムアウト
+FFMPEG_THREADS = int(os.getenv('FFMPEG_THREADS', '0'))  # 0の場合は自動（コア数 / 同時実行数）
+
+# ストリーミング認識（録音中に認識）の設定
+STREAM_MAX_SESSIONS = int(os.getenv('STREAM_MAX_SESSIONS', '10'))  # 同時に実行できる録音数
+STREAM_IDLE_TIMEOUT_SECONDS = float(os.getenv('STREAM_IDLE_TIMEOUT_SECONDS', '30'))  # チャンクが届かない場合に破棄するまでの秒数
+STREAM_FINAL_TIMEOUT_SECONDS = float(os.getenv('STREAM_FINAL_TIMEOUT_SECONDS', '10'))  # 録音終了後に確定結果を待つ秒数
+STREAM_RESTART_SECONDS = float(os.getenv('STREAM_RESTART_SECONDS', '270'))  # Speech APIのストリーミングの上限（約5分）の前に認識を開き直すまでの秒数
+
+# 受付制御（処理段階ごとの同時実行数・処理中のバイト数・OpenAIのTPM）
+STT_MAX_CONCURRENT = int(os.getenv('STT_MAX_CONCURRENT', '16'))  # Speech-to-Text の同時リクエスト数
+LLM_MAX_CONCURRENT = int(os.getenv('LLM_MAX_CONCURRENT', '8'))  # 要約APIの同時リクエスト数
+INFLIGHT_MAX_BYTES = int(os.getenv('INFLIGHT_MAX_BYTES', str(500 * 1024 * 1024)))  # 処理中の音声の合計バイト数
+OPENAI_TPM_LIMIT = int(os.getenv('OPENAI_TPM_LIMIT', '30000'))  # OpenAIのトークン毎分の上限（0で制限なし）
+STAGE_WAIT_TIMEOUT_SECONDS = float(os.getenv('STAGE_WAIT_TIMEOUT_SECONDS', '120'))  # 同時実行数の空きを待つ最大秒数
+ADMISSION_MAX_TPM_WAIT_SECONDS = float(os.getenv('ADMISSION_MAX_TPM_WAIT_SECONDS', '30'))  # TPMの待ちがこれを超える場合は429
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv('ADMISSION_RETRY_AFTER_SECONDS', '10'))  # 503の Retry-After
+
+# パイプラインの段階ごとのワーカー数（変換はCPU、音声認識・要約はAPIの応答待ちが中心）
+PIPELINE_STAGE_WORKERS = {
+    'convert': int(os.getenv('PIPELINE_CONVERT_WORKERS', str(CONVERSION_WORKERS))),  # 変換・無音除去
+    'recognize': int(os.getenv('PIPELINE_RECOGNIZE_WORKERS', str(STT_MAX_CONCURRENT))),  # 音声認識
+    'summarize': int(os.getenv('PIPELINE_SUMMARIZE_WORKERS', str(LLM_MAX_CONCURRENT))),  # 要約
+    'format': int(os.getenv('PIPELINE_FORMAT_WORKERS', '2')),  # フォーマット整形
+    'persist': int(os.getenv('PIPELINE_PERSIST_WORKERS', '2'))  # 結果の保存
+}
+
+# 永続ジョブキュー（sqlite の場合は worker.py が別プロセスで処理）
+JOB_BACKEND = os.getenv('JOB_BACKEND', 'memory')  # 'memory' / 'sqlite'
+JOB_STORE_PATH = os.getenv('JOB_STORE_PATH', os.path.join(CACHE_FOLDER, 'jobs.sqlite3'))
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', '60'))  # ワーカーが応答しない場合に他のワーカーが引き継ぐまでの秒数
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))  # 中断されたジョブを再実行する回数の上限
+WORKER_CONCURRENCY = int(os.getenv('WORKER_CONCURRENCY', '2'))  # 1つのワーカープロセスで同時に処理するジョブ数
+WORKER_POLL_SECONDS = float(os.getenv('WORKER_POLL_SECONDS', '1'))  # ジョブがない場合の確認間隔
+
+# 非同期認識（long_running_recognize）のOperationの保存先（再起動後に再開する）
+OPERATION_STORE_PATH = os.getenv('OPERATION_STORE_PATH', os.path.join(CACHE_FOLDER, 'operations.sqlite3'))
+OPERATION_RETENTION_SECONDS = int(os.getenv('OPERATION_RETENTION_SECONDS', str(24 * 3600)))  # 終了したOperationの結果を保持する秒数（中断したジョブの再開に使う）
+
+# GCS経由の非同期認識の一時ファイル（内容のハッシュで名前を付け、同じ音声は再アップロードしない）
+GCS_STAGING_PREFIX = os.getenv('GCS_STAGING_PREFIX', 'staging/')
+GCS_UPLOAD_CHUNK_BYTES = int(os.getenv('GCS_UPLOAD_CHUNK_BYTES', str(8 * 1024 * 1024)))  # 再開可能アップロードの単位（256KBの倍数）
+GCS_COMPOSITE_THRESHOLD_BYTES = int(os.getenv('GCS_COMPOSITE_THRESHOLD_BYTES', str(64 * 1024 * 1024)))  # これ以上は分割して並列にアップロード
+GCS_COMPOSITE_PARTS = int(os.getenv('GCS_COMPOSITE_PARTS', '8'))  # 並列アップロードの分割数（最大32）
+GCS_STAGING_TTL_SECONDS = int(os.getenv('GCS_STAGING_TTL_SECONDS', str(24 * 3600)))  # これより古い一時ファイルを削除（0で無効）
+GCS_SWEEP_INTERVAL_SECONDS = int(os.getenv('GCS_SWEEP_INTERVAL_SECONDS', '3600'))  # 古い一時ファイルを確認する間隔
+
+# 再開可能なアップロード（通信が切れても続きから送れる）
+RESUMABLE_UPLOAD_FOLDER = os.getenv('RESUMABLE_UPLOAD_FOLDER', os.path.join(UPLOAD_FOLDER, 'partial'))  # 受信途中のファイル
+RESUMABLE_STORE_PATH = os.getenv('RESUMABLE_STORE_PATH', os.path.join(CACHE_FOLDER, 'uploads.sqlite3'))
+RESUMABLE_UPLOAD_TTL_SECONDS = int(os.getenv('RESUMABLE_UPLOAD_TTL_SECONDS', str(24 * 3600)))  # 更新がないまま過ぎたら破棄
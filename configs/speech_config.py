@@ -22,3 +22,30 @@ MAX_AUDIO_SIZE_MB = 100
 
 # 音声ファイルの最大長（秒）
 MAX_AUDIO_DURATION_SECONDS = 3600  # 1時間
+
+# 変換後のPCMのサンプリングレート
+PCM_SAMPLE_RATE = 16000
+
+# 認識方法の振り分け（音声の長さで事前に決定）
+INLINE_MAX_SECONDS = 55  # これ以下はファイルをそのまま同期認識
+INLINE_MAX_BYTES = 10 * 1024 * 1024  # 同期認識で送れる最大サイズ（10MB）
+CHUNKED_MAX_SECONDS = 1800  # これ以下は分割認識、超える場合はGCS経由の非同期認識
+
+# GCS経由の非同期認識でアップロードする形式（'flac': 可逆, 'ogg_opus': 最小, 'pcm': 無圧縮）
+GCS_UPLOAD_FORMAT = 'flac'
+
+# GCS経由の非同期認識の完了待ち
+LONG_RUNNING_POLL_SECONDS = 5  # 進捗率（progress_percent）を取得する間隔
+LONG_RUNNING_TIMEOUT_SECONDS = 600  # 完了を待つ最大秒数
+
+# 長時間音声の分割認識の設定
+CHUNKED_RECOGNITION_ENABLED = True  # 無音区間で分割して並列に同期認識する
+CHUNK_MAX_SECONDS = 55  # 1区間の最大秒数（同期認識の上限60秒未満）
+CHUNK_MIN_SECONDS = 15  # 1区間の最小秒数
+CHUNK_RECOGNITION_WORKERS = 8  # 同時に認識する区間数
+
+# 音声区間検出（VAD）の設定
+VAD_ENABLED = True  # 認識前に長い無音・雑音区間を除去する
+VAD_MIN_SILENCE_SECONDS = 2.0  # これより長い無音区間だけを除去
+VAD_PADDING_SECONDS = 0.3  # 音声区間の前後に残す秒数
+VAD_THRESHOLD_DB = 12.0  # 雑音レベルからこのdB以上大きい区間を音声とみなす
@@ -4,12 +4,147 @@ MP3等をWAV形式に変換
 """
 
 import os
+import mmap
+import time
 import logging
+import threading
 import subprocess
 import tempfile
+from typing import Optional, List, Dict, Any
+from config import CONVERSION_WORKERS, CONVERSION_MAX_QUEUE, CONVERSION_TIMEOUT_SECONDS, FFMPEG_THREADS
 
 logger = logging.getLogger(__name__)
 
+
+class ConversionQueueFullError(Exception):
+    """変換待ちが上限に達した場合の例外"""
+
+
+class ConversionPool:
+    """FFmpeg変換の同時実行数を制限するクラス"""
+    
+    def __init__(self, max_workers: int = CONVERSION_WORKERS, max_queue: int = CONVERSION_MAX_QUEUE,
+                 timeout_seconds: float = CONVERSION_TIMEOUT_SECONDS, ffmpeg_threads: int = FFMPEG_THREADS):
+        """
+        初期化
+        
+        Args:
+            max_workers: 同時に実行するffmpegプロセス数
+            max_queue: 実行待ちにできる変換数（超えた場合は即座にエラー）
+            timeout_seconds: 1件あたりの変換タイムアウト（待ち時間を含まない）
+            ffmpeg_threads: ffmpegの -threads（0の場合はCPUコア数を同時実行数で割った値）
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout_seconds = timeout_seconds
+        self.ffmpeg_threads = ffmpeg_threads or max(1, (os.cpu_count() or 1) // max_workers)
+        self._slots = threading.Semaphore(max_workers)
+        self._lock = threading.Lock()
+        self._stats = {
+            'queued': 0,
+            'running': 0,
+            'completed': 0,
+            'failed': 0,
+            'timeouts': 0,
+            'rejected': 0,
+            'total_wait_seconds': 0.0,
+            'total_conversion_seconds': 0.0,
+            'max_conversion_seconds': 0.0
+        }
+        logger.info(f"変換プールを初期化しました (同時実行数: {max_workers}, ffmpegスレッド数: {self.ffmpeg_threads})")
+    
+    def run(self, cmd: List[str], **io_kwargs) -> subprocess.CompletedProcess:
+        """
+        空きを待ってffmpegを実行
+        
+        Args:
+            cmd: 実行するコマンド（'-threads' はここで追加する）
+            **io_kwargs: subprocess.run に渡す入出力の引数
+            
+        Returns:
+            実行結果
+        """
+        with self._lock:
+            if self._stats['queued'] >= self.max_queue:
+                self._stats['rejected'] += 1
+                raise ConversionQueueFullError("音声変換の待ちが上限に達しています")
+            self._stats['queued'] += 1
+        
+        queued_at = time.monotonic()
+        self._slots.acquire()
+        started_at = time.monotonic()
+        with self._lock:
+            self._stats['queued'] -= 1
+            self._stats['running'] += 1
+            self._stats['total_wait_seconds'] += started_at - queued_at
+        
+        succeeded = False
+        try:
+            result = subprocess.run(self.with_threads(cmd), capture_output=True, check=True,
+                                    timeout=self.timeout_seconds, **io_kwargs)
+            succeeded = True
+            return result
+        except subprocess.TimeoutExpired:
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise
+        finally:
+            self.release(started_at, succeeded)
+    
+    def with_threads(self, cmd: List[str]) -> List[str]:
+        """ffmpegのコマンドに -threads を追加"""
+        return cmd[:1] + ['-threads', str(self.ffmpeg_threads)] + cmd[1:]
+    
+    def try_acquire(self) -> Optional[float]:
+        """
+        空きがある場合だけ実行枠を確保（待たない）
+        
+        Returns:
+            確保した時刻（release に渡す）。空きがない場合None
+        """
+        if not self._slots.acquire(blocking=False):
+            return None
+        with self._lock:
+            self._stats['running'] += 1
+        return time.monotonic()
+    
+    def release(self, started_at: float, succeeded: bool):
+        """
+        実行枠を解放して統計に反映
+        
+        Args:
+            started_at: 実行枠を確保した時刻
+            succeeded: 変換に成功したか
+        """
+        elapsed = time.monotonic() - started_at
+        self._slots.release()
+        with self._lock:
+            self._stats['running'] -= 1
+            self._stats['completed' if succeeded else 'failed'] += 1
+            self._stats['total_conversion_seconds'] += elapsed
+            self._stats['max_conversion_seconds'] = max(self._stats['max_conversion_seconds'], elapsed)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        変換の統計情報を取得
+        
+        Returns:
+            待ち数・実行中の数・平均変換時間などの辞書
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        finished = stats['completed'] + stats['failed']
+        stats['max_workers'] = self.max_workers
+        stats['max_queue'] = self.max_queue
+        stats['avg_wait_seconds'] = stats['total_wait_seconds'] / finished if finished else 0.0
+        stats['avg_conversion_seconds'] = stats['total_conversion_seconds'] / finished if finished else 0.0
+        return stats
+
+
+# プロセス内で共有する変換プール
+conversion_pool = ConversionPool()
+
+
 def convert_to_wav(input_file: str, output_file: str = None) -> str:
     """
     音声ファイルをWAV形式に変換（モノラル、16000Hzに変換）
@@ -22,10 +157,10 @@ def convert_to_wav(input_file: str, output_file: str = None) -> str:
         変換後のファイルパス
     """
     if output_file is None:
-        # 一時ファイルとして作成
-        temp_dir = tempfile.gettempdir()
+        # 一時ファイルとして作成（同名のアップロードと衝突しないよう一意な名前にする）
         base_name = os.path.splitext(os.path.basename(input_file))[0]
-        output_file = os.path.join(temp_dir, f"{base_name}.wav")
+        fd, output_file = tempfile.mkstemp(prefix=f"{base_name}_", suffix='.wav')
+        os.close(fd)
     
     try:
         # FFmpegを使用して直接変換
@@ -47,18 +182,18 @@ def convert_to_wav(input_file: str, output_file: str = None) -> str:
         
         logger.info(f"実行コマンド: {' '.join(cmd)}")
         
-        # FFmpegを実行
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            check=True
-        )
+        # FFmpegを実行（他の変換と同じく同時実行数・待ち数・タイムアウトの範囲で）
+        result = conversion_pool.run(cmd, stdin=subprocess.DEVNULL, text=True)
         
         logger.info(f"音声ファイルを変換しました: {input_file} -> {output_file}")
         logger.info(f"FFmpeg出力: {result.stderr}")
         return output_file
         
+    except ConversionQueueFullError:
+        raise
+    except subprocess.TimeoutExpired:
+        logger.error(f"FFmpegの変換がタイムアウトしました（{conversion_pool.timeout_seconds}秒）")
+        return input_file
     except subprocess.CalledProcessError as e:
         logger.error(f"FFmpeg実行エラー: {e}")
         logger.error(f"FFmpegエラー出力: {e.stderr}")
@@ -69,3 +204,260 @@ def convert_to_wav(input_file: str, output_file: str = None) -> str:
     except Exception as e:
         logger.error(f"音声ファイル変換エラー: {e}。元のファイルを使用します")
         return input_file
+
+
+# 変換先の形式（ffmpegの出力オプションと Speech-to-Text のエンコーディング）
+TARGET_FORMATS = {
+    # ヘッダーなしの16bitリトルエンディアンPCM（分割認識・インライン認識用）
+    'pcm': {
+        'args': ['-f', 's16le', '-acodec', 'pcm_s16le'],
+        'encoding': 'LINEAR16',
+        'extension': '.pcm'
+    },
+    # 可逆圧縮（PCMの約半分のサイズ）
+    'flac': {
+        'args': ['-f', 'flac', '-acodec', 'flac', '-compression_level', '5'],
+        'encoding': 'FLAC',
+        'extension': '.flac'
+    },
+    # 非可逆圧縮（音声向け設定で最も小さい）
+    'ogg_opus': {
+        'args': ['-f', 'ogg', '-acodec', 'libopus', '-b:a', '32k', '-application', 'voip'],
+        'encoding': 'OGG_OPUS',
+        'extension': '.ogg'
+    }
+}
+
+# 標準入力にPCMを渡す場合の入力オプション
+PCM_INPUT_ARGS = ['-f', 's16le', '-ac', '1']
+
+
+def convert_audio(input_file: Optional[str] = None, input_bytes: Optional[bytes] = None,
+                  target: str = 'pcm', sample_rate: int = 16000,
+                  input_args: Optional[List[str]] = None) -> Optional[memoryview]:
+    """
+    音声をモノラルの指定形式に変換（一時ファイルを使わずパイプで入出力）
+    
+    Args:
+        input_file: 入力ファイルのパス
+        input_bytes: 入力音声のバイトデータ（指定時は標準入力から渡す）
+        target: 変換先の形式（'pcm' / 'flac' / 'ogg_opus'）
+        sample_rate: 出力のサンプリングレート
+        input_args: 入力側のffmpegオプション（ヘッダーなしPCMを渡す場合など）
+        
+    Returns:
+        変換後のデータ（変換できない場合None）
+        
+    Raises:
+        ConversionQueueFullError: 変換待ちが上限に達している場合
+    """
+    source = 'pipe:0' if input_bytes is not None else input_file
+    
+    cmd = ['ffmpeg', '-hide_banner', '-loglevel', 'error']
+    cmd += input_args or []
+    cmd += ['-i', source, '-ac', '1', '-ar', str(sample_rate)]
+    cmd += TARGET_FORMATS[target]['args']
+    cmd.append('pipe:1')
+    
+    if input_bytes is not None:
+        io_kwargs = {'input': input_bytes}
+    else:
+        io_kwargs = {'stdin': subprocess.DEVNULL}
+    
+    try:
+        logger.info(f"FFmpegを使用して{target}に変換開始: {input_file or '(バイトデータ)'}")
+        result = conversion_pool.run(cmd, **io_kwargs)
+        # bytesをコピーせずにmemoryviewで渡す
+        return memoryview(result.stdout)
+        
+    except ConversionQueueFullError:
+        raise
+    except subprocess.TimeoutExpired:
+        logger.error(f"FFmpegの変換がタイムアウトしました（{conversion_pool.timeout_seconds}秒）")
+    except subprocess.CalledProcessError as e:
+        logger.error(f"FFmpeg実行エラー: {e}")
+        logger.error(f"FFmpegエラー出力: {e.stderr.decode('utf-8', errors='replace')}")
+    except FileNotFoundError:
+        logger.error("FFmpegが見つかりません。FFmpegをインストールしてください")
+    except Exception as e:
+        logger.error(f"音声ファイル変換エラー: {e}")
+    return None
+
+
+def convert_to_pcm(input_file: Optional[str] = None, input_bytes: Optional[bytes] = None,
+                   sample_rate: int = 16000) -> Optional[memoryview]:
+    """
+    音声をモノラル・16bitのPCMに変換（一時ファイルを使わずパイプで入出力）
+    
+    Args:
+        input_file: 入力ファイルのパス
+        input_bytes: 入力音声のバイトデータ（指定時は標準入力から渡す）
+        sample_rate: 出力のサンプリングレート
+        
+    Returns:
+        PCMデータ（変換できない場合None）
+    """
+    return convert_audio(input_file, input_bytes, target='pcm', sample_rate=sample_rate)
+
+
+def encode_pcm(pcm: memoryview, target: str, sample_rate: int = 16000) -> Optional[memoryview]:
+    """
+    PCMを圧縮形式にエンコード
+    
+    Args:
+        pcm: 16bitリトルエンディアン・モノラルのPCMデータ
+        target: 変換先の形式（'flac' / 'ogg_opus'）
+        sample_rate: PCMのサンプリングレート
+        
+    Returns:
+        エンコード後のデータ（変換できない場合None）
+    """
+    return convert_audio(input_bytes=pcm, target=target, sample_rate=sample_rate,
+                         input_args=PCM_INPUT_ARGS + ['-ar', str(sample_rate)])
+
+
+class StreamingConversion:
+    """受信中の音声をffmpegの標準入力に渡し、PCMをファイルに書き出す変換"""
+    
+    def __init__(self, output_path: str, sample_rate: int, started_at: float):
+        """
+        初期化（ConversionPool の実行枠を確保してから作成する）
+        
+        Args:
+            output_path: PCMの書き出し先
+            sample_rate: 出力のサンプリングレート
+            started_at: 実行枠を確保した時刻
+        """
+        self.output_path = output_path
+        self.failed = False
+        self._started_at = started_at
+        self._stderr = tempfile.TemporaryFile()
+        cmd = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0',
+               '-ac', '1', '-ar', str(sample_rate)] + TARGET_FORMATS['pcm']['args'] + ['-y', output_path]
+        self._process = subprocess.Popen(conversion_pool.with_threads(cmd), stdin=subprocess.PIPE,
+                                         stdout=subprocess.DEVNULL, stderr=self._stderr)
+    
+    def feed(self, chunk: bytes):
+        """
+        受信したデータをffmpegに渡す（変換に失敗した後は何もしない）
+        
+        Args:
+            chunk: 受信したデータ
+        """
+        if self.failed:
+            return
+        try:
+            self._process.stdin.write(chunk)
+        except OSError as e:
+            # ffmpegが途中で終了した場合は、受信後に保存したファイルから変換する
+            logger.warning(f"受信中の変換を中止しました: {e}")
+            self.failed = True
+    
+    def finish(self) -> Optional[str]:
+        """
+        入力を閉じて変換の終了を待つ
+        
+        Returns:
+            PCMファイルのパス（変換できなかった場合None）
+        """
+        succeeded = False
+        try:
+            try:
+                self._process.stdin.close()
+            except OSError:
+                self.failed = True
+            returncode = self._process.wait(timeout=conversion_pool.timeout_seconds)
+            succeeded = returncode == 0 and not self.failed
+            if not succeeded:
+                self._stderr.seek(0)
+                logger.warning(f"受信中の変換に失敗しました: {self._stderr.read().decode('utf-8', errors='replace')}")
+        except subprocess.TimeoutExpired:
+            logger.error(f"FFmpegの変換がタイムアウトしました（{conversion_pool.timeout_seconds}秒）")
+            self._process.kill()
+            self._process.wait()
+        finally:
+            self._close(succeeded)
+        return self.output_path if succeeded else None
+    
+    def abort(self):
+        """変換を中止してPCMファイルを削除"""
+        self._process.kill()
+        self._process.wait()
+        self._close(False)
+    
+    def _close(self, succeeded: bool):
+        """実行枠を解放し、失敗した場合は書き出し途中のファイルを削除"""
+        self._stderr.close()
+        conversion_pool.release(self._started_at, succeeded)
+        if not succeeded and os.path.exists(self.output_path):
+            os.remove(self.output_path)
+
+
+def start_streaming_conversion(output_path: str, sample_rate: int = 16000) -> Optional[StreamingConversion]:
+    """
+    受信しながら変換を開始（ffmpegに空きがない場合は受信後の変換に任せる）
+    
+    Args:
+        output_path: PCMの書き出し先
+        sample_rate: 出力のサンプリングレート
+        
+    Returns:
+        StreamingConversionインスタンス（開始できない場合None）
+    """
+    started_at = conversion_pool.try_acquire()
+    if started_at is None:
+        return None
+    try:
+        return StreamingConversion(output_path, sample_rate, started_at)
+    except OSError as e:
+        logger.error(f"FFmpegを起動できません: {e}")
+        conversion_pool.release(started_at, False)
+        return None
+
+
+def map_file(file_path: str, offset: int = 0, size: Optional[int] = None) -> memoryview:
+    """
+    ファイルをメモリに読み込まずにマップする（読んだ部分だけがメモリに載る）
+    
+    Args:
+        file_path: ファイルのパス
+        offset: 先頭から読み飛ばすバイト数
+        size: 使用するバイト数（省略時は末尾まで）
+        
+    Returns:
+        ファイル内容のmemoryview
+    """
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(b'')
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    end = None if size is None else offset + size
+    return memoryview(mapped)[offset:end]
+
+
+def probe_duration(input_file: str) -> Optional[float]:
+    """
+    ffprobeで音声の長さを取得
+    
+    Args:
+        input_file: 入力ファイルのパス
+        
+    Returns:
+        長さの秒数（取得できない場合None）
+    """
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1',
+        input_file
+    ]
+    
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True, timeout=30)
+        return float(result.stdout.strip())
+    except FileNotFoundError:
+        logger.warning("ffprobeが見つかりません。音声の長さを取得できません")
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, ValueError) as e:
+        logger.warning(f"音声の長さを取得できません: {e}")
+    return None
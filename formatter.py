@@ -111,6 +111,33 @@ class TextFormatter:
         
         return parsed
     
+    def merge_summaries(self, summaries: List[str]) -> str:
+        """
+        分割して要約した複数の要約を1つにまとめる
+        
+        Args:
+            summaries: 要約テキストのリスト（音声の順）
+            
+        Returns:
+            まとめた要約テキスト
+        """
+        merged = self._parse_summary('')
+        documents = []
+        for summary in summaries:
+            parsed = self._parse_summary(summary)
+            for category, items in parsed['business_content'].items():
+                for item in items:
+                    # 部分の境目で同じ作業が重複して抽出された場合は1つにする
+                    if item not in merged['business_content'][category]:
+                        merged['business_content'][category].append(item)
+            for line in parsed['documents'].splitlines():
+                line = line.strip()
+                if line and not line.startswith('以下') and line not in documents:
+                    documents.append(line)
+        merged['documents'] = '\n'.join(documents)
+        merged['end'] = 'ー以上ー'
+        return self._format_to_text(merged)
+    
     def _extract_subsection(self, text: str, pattern: str) -> List[str]:
         """
         サブセクションの項目を抽出
@@ -139,12 +166,13 @@ class TextFormatter:
         
         return items
     
-    def _format_to_text(self, data: Dict[str, Any]) -> str:
+    def _format_to_text(self, data: Dict[str, Any], partial: bool = False) -> str:
         """
         構造化されたデータをテキストに整形
         
         Args:
             data: 構造化されたデータ
+            partial: 生成途中の要約の場合True（まだ現れていない提出書類と「ー以上ー」を出力しない）
             
         Returns:
             整形されたテキスト
@@ -182,6 +210,9 @@ class TextFormatter:
                 if item:  # 空でない場合のみ追加
                     lines.append(f"  {i}) {item}")
         
+        if partial and not data['documents']:
+            return '\n'.join(lines)
+        
         # 2. 提出書類
         lines.append("")
         lines.append(self.sections['documents']['title'])
@@ -191,6 +222,9 @@ class TextFormatter:
                 lines.append('以下の書類を2部提出した。')
             lines.append(data['documents'])
         
+        if partial:
+            return '\n'.join(lines)
+        
         # ー以上ー
         lines.append("")
         lines.append(self.sections['end'])
@@ -219,6 +253,59 @@ class TextFormatter:
         return formatted
 
 
+class IncrementalFormatter:
+    """生成途中の要約を行単位で整形するクラス（ストリーミング要約用）"""
+    
+    def __init__(self, formatter: Optional[TextFormatter] = None):
+        """
+        初期化
+        
+        Args:
+            formatter: 整形に使うTextFormatter（省略時は新規作成）
+        """
+        self.formatter = formatter or TextFormatter()
+        self._buffer = []
+        self._complete_length = 0
+        self._last_output = ''
+    
+    def feed(self, delta: str) -> Optional[str]:
+        """
+        生成された差分テキストを追加
+        
+        Args:
+            delta: 差分テキスト
+            
+        Returns:
+            行が確定して整形結果が変わった場合は整形済みテキスト、それ以外はNone
+        """
+        self._buffer.append(delta)
+        if '\n' not in delta:
+            return None
+        
+        # 書きかけの行は項目が途中で切れるため、改行まで確定した部分だけを整形する
+        text = ''.join(self._buffer)
+        complete_length = text.rfind('\n') + 1
+        if complete_length == self._complete_length:
+            return None
+        self._complete_length = complete_length
+        
+        parsed = self.formatter._parse_summary(text[:complete_length])
+        output = self.formatter._format_to_text(parsed, partial=True)
+        if output == self._last_output:
+            return None
+        self._last_output = output
+        return output
+    
+    def finish(self) -> Dict[str, Any]:
+        """
+        生成完了後に全体を整形
+        
+        Returns:
+            format_summary と同じ形式の結果
+        """
+        return self.formatter.format_summary(''.join(self._buffer))
+
+
 def create_formatter() -> TextFormatter:
     """
     フォーマッターオブジェクトを作成
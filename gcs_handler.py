@@ -3,44 +3,67 @@ Google Cloud Storage ハンドラーモジュール
 長時間音声対応のためのGCS連携
 """
 
+import io
 import os
+import time
+import hashlib
 import logging
-from typing import Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple, Union, Callable
 from google.cloud import storage
 from config import GOOGLE_APPLICATION_CREDENTIALS, GCS_BUCKET_NAME
+from config import GCS_STAGING_PREFIX, GCS_UPLOAD_CHUNK_BYTES, GCS_COMPOSITE_THRESHOLD_BYTES, GCS_COMPOSITE_PARTS
+from config import GCS_STAGING_TTL_SECONDS, GCS_SWEEP_INTERVAL_SECONDS
+from client_registry import get_storage_client, has_google_credentials
 
 # ログ設定
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# ハッシュ計算時の読み込み単位
+HASH_CHUNK_SIZE = 1024 * 1024
+# 再開可能アップロードの単位は256KBの倍数である必要がある
+_RESUMABLE_UNIT = 256 * 1024
+# 一括削除で1回のバッチに含める数（GCSの上限は100）
+_BATCH_SIZE = 100
+
+
+def _content_hash(source: Union[str, bytes, memoryview]) -> str:
+    """ファイルパスまたはデータのSHA-256を計算"""
+    sha256 = hashlib.sha256()
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                sha256.update(chunk)
+    else:
+        sha256.update(source)
+    return sha256.hexdigest()
+
 
 class GCSHandler:
     """Google Cloud Storage ハンドラークラス"""
 
-    def __init__(self, bucket_name: str = GCS_BUCKET_NAME):
+    def __init__(self, bucket_name: str = GCS_BUCKET_NAME, client: Optional[storage.Client] = None):
         """
         初期化
 
         Args:
             bucket_name: GCSバケット名
+            client: 使用するstorage.Client（省略時はプロセス共有のクライアント）
         """
         self.bucket_name = bucket_name
-        self.client = None
+        self.client = client
         self.bucket = None
         self._initialize_client()
 
     def _initialize_client(self):
-        """Google Cloud Storage クライアントを初期化"""
+        """Google Cloud Storage クライアントを取得（プロセス内で共有）"""
         try:
-            # 認証情報を設定
-            if GOOGLE_APPLICATION_CREDENTIALS:
-                if os.path.exists(GOOGLE_APPLICATION_CREDENTIALS):
-                    os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = GOOGLE_APPLICATION_CREDENTIALS
-                    logger.info(f"GCS認証情報を設定: {GOOGLE_APPLICATION_CREDENTIALS}")
-
-            self.client = storage.Client()
+            if self.client is None:
+                self.client = get_storage_client(GOOGLE_APPLICATION_CREDENTIALS)
             self.bucket = self.client.bucket(self.bucket_name)
-            logger.info(f"Google Cloud Storage クライアントを初期化しました (バケット: {self.bucket_name})")
+            logger.info(f"Google Cloud Storage バケットを使用します (バケット: {self.bucket_name})")
 
         except Exception as e:
             logger.error(f"GCSクライアント初期化エラー: {e}")
@@ -75,6 +98,155 @@ class GCSHandler:
             logger.error(f"GCSアップロードエラー: {e}")
             raise
 
+    def upload_bytes(self, data, gcs_file_name: str, content_type: str = 'application/octet-stream') -> str:
+        """
+        メモリ上のデータをGCSにアップロード（ローカルファイルを作らない）
+
+        Args:
+            data: アップロードするデータ（bytes / memoryview）
+            gcs_file_name: GCS上のファイル名
+            content_type: Content-Type
+
+        Returns:
+            GCS URI (gs://bucket-name/file-name)
+        """
+        try:
+            blob = self.bucket.blob(gcs_file_name)
+            blob.upload_from_file(io.BytesIO(data), size=len(data), content_type=content_type)
+
+            gcs_uri = f"gs://{self.bucket_name}/{gcs_file_name}"
+            logger.info(f"データをGCSにアップロードしました: {gcs_uri}")
+
+            return gcs_uri
+
+        except Exception as e:
+            logger.error(f"GCSアップロードエラー: {e}")
+            raise
+
+    @staticmethod
+    def staging_name(source: Union[str, bytes, memoryview], extension: str = '') -> str:
+        """
+        非同期認識用の一時ファイルのオブジェクト名（内容のハッシュ）を取得
+
+        Args:
+            source: ローカルファイルのパス、またはデータ（bytes / memoryview）
+            extension: オブジェクト名の拡張子
+
+        Returns:
+            オブジェクト名
+        """
+        return f"{GCS_STAGING_PREFIX}{_content_hash(source)}{extension}"
+
+    def upload_staging(self, source: Union[str, bytes, memoryview], extension: str = '',
+                       content_type: str = 'application/octet-stream',
+                       gcs_file_name: Optional[str] = None) -> Tuple[str, str]:
+        """
+        非同期認識用の一時ファイルを内容のハッシュで名前を付けてアップロード
+
+        同じ内容のオブジェクトが既にある場合（再試行・同じ音声の再処理）はアップロードしない。
+        大きいデータは再開可能アップロード、GCS_COMPOSITE_THRESHOLD_BYTES 以上は分割して並列にアップロードする
+
+        Args:
+            source: ローカルファイルのパス、またはアップロードするデータ（bytes / memoryview）
+            extension: オブジェクト名の拡張子
+            content_type: Content-Type
+            gcs_file_name: staging_name() で取得済みのオブジェクト名（省略時は計算する）
+
+        Returns:
+            (GCS URI, オブジェクト名)
+        """
+        gcs_file_name = gcs_file_name or self.staging_name(source, extension)
+        gcs_uri = f"gs://{self.bucket_name}/{gcs_file_name}"
+        if self.file_exists(gcs_file_name):
+            logger.info(f"同じ内容のファイルがGCSにあるためアップロードを省略します: {gcs_uri}")
+            return gcs_uri, gcs_file_name
+
+        size = os.path.getsize(source) if isinstance(source, str) else len(source)
+        started = time.monotonic()
+        try:
+            if size >= GCS_COMPOSITE_THRESHOLD_BYTES and GCS_COMPOSITE_PARTS > 1:
+                self._upload_composite(source, size, gcs_file_name, content_type)
+            else:
+                blob = self.bucket.blob(gcs_file_name, chunk_size=self._chunk_size(size))
+                with self._open_range(source, 0, size) as stream:
+                    blob.upload_from_file(stream, size=size, content_type=content_type)
+        except Exception as e:
+            logger.error(f"GCSアップロードエラー: {e}")
+            raise
+
+        logger.info(f"ファイルをGCSにアップロードしました: {gcs_uri} "
+                    f"({size / (1024 * 1024):.2f}MB, {time.monotonic() - started:.1f}秒)")
+        return gcs_uri, gcs_file_name
+
+    @staticmethod
+    def _chunk_size(size: int) -> Optional[int]:
+        """再開可能アップロードの単位（小さいデータは1回のリクエストで送るためNone）"""
+        if size <= GCS_UPLOAD_CHUNK_BYTES:
+            return None
+        return max(_RESUMABLE_UNIT, GCS_UPLOAD_CHUNK_BYTES // _RESUMABLE_UNIT * _RESUMABLE_UNIT)
+
+    @staticmethod
+    def _open_range(source: Union[str, bytes, memoryview], start: int, size: int) -> io.IOBase:
+        """ファイルまたはデータの一部を読み込み用のストリームとして開く"""
+        if isinstance(source, str):
+            f = open(source, 'rb')
+            f.seek(start)
+            return f
+        return io.BytesIO(memoryview(source)[start:start + size])
+
+    def _upload_composite(self, source: Union[str, bytes, memoryview], size: int, gcs_file_name: str,
+                          content_type: str):
+        """分割した部分を並列にアップロードし、1つのオブジェクトに結合（部分は結合後に削除）"""
+        parts = min(GCS_COMPOSITE_PARTS, 32)
+        part_size = -(-size // parts)
+        ranges = [(start, min(part_size, size - start)) for start in range(0, size, part_size)]
+        part_blobs = [self.bucket.blob(f"{gcs_file_name}.part{index:02d}") for index in range(len(ranges))]
+
+        def upload_part(index: int):
+            start, length = ranges[index]
+            with self._open_range(source, start, length) as stream:
+                part_blobs[index].upload_from_file(stream, size=length, content_type=content_type)
+
+        try:
+            with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix='gcs-upload') as executor:
+                list(executor.map(upload_part, range(len(ranges))))
+            destination = self.bucket.blob(gcs_file_name)
+            destination.content_type = content_type
+            destination.compose(part_blobs)
+            logger.info(f"{len(ranges)}個に分割して並列にアップロードしました: {gcs_file_name}")
+        finally:
+            self._delete_blobs(part_blobs)
+
+    def _delete_blobs(self, blobs):
+        """複数のオブジェクトをバッチで削除（存在しないものは無視）"""
+        for start in range(0, len(blobs), _BATCH_SIZE):
+            try:
+                with self.client.batch(raise_exception=False):
+                    for blob in blobs[start:start + _BATCH_SIZE]:
+                        blob.delete()
+            except Exception as e:
+                logger.warning(f"GCSファイルの一括削除エラー: {e}")
+
+    def sweep_staging(self, max_age_seconds: int = GCS_STAGING_TTL_SECONDS) -> int:
+        """
+        古い一時ファイル（認識が中断されて残ったものなど）をまとめて削除
+
+        Args:
+            max_age_seconds: 作成からこの秒数を過ぎたものを削除
+
+        Returns:
+            削除した数
+        """
+        threshold = time.time() - max_age_seconds
+        stale = [
+            blob for blob in self.client.list_blobs(self.bucket, prefix=GCS_STAGING_PREFIX)
+            if blob.time_created is not None and blob.time_created.timestamp() < threshold
+        ]
+        if stale:
+            self._delete_blobs(stale)
+            logger.info(f"古い一時ファイルをGCSから{len(stale)}件削除しました")
+        return len(stale)
+
     def delete_file(self, gcs_file_name: str):
         """
         GCSからファイルを削除
@@ -108,6 +280,44 @@ class GCSHandler:
             return False
 
 
+_sweeper: Optional[threading.Thread] = None
+_sweeper_lock = threading.Lock()
+
+
+def start_staging_sweeper(interval_seconds: int = GCS_SWEEP_INTERVAL_SECONDS,
+                          max_age_seconds: int = GCS_STAGING_TTL_SECONDS,
+                          should_sweep: Optional[Callable[[], bool]] = None):
+    """
+    古い一時ファイルを定期的に削除するスレッドを開始（プロセス内で1つ）
+
+    Args:
+        interval_seconds: 確認する間隔
+        max_age_seconds: 作成からこの秒数を過ぎたものを削除（0、バケット・認証情報が未設定の場合は削除しない）
+        should_sweep: 削除の前に呼び、Falseの場合はその回を省略する関数（複数プロセスで1つだけが削除する場合）
+    """
+    global _sweeper
+    if max_age_seconds <= 0 or not GCS_BUCKET_NAME:
+        return
+
+    def sweep_loop():
+        # GCSを使わない構成（認証情報なし）では削除するものがないため終了
+        if not has_google_credentials(GOOGLE_APPLICATION_CREDENTIALS):
+            logger.info("Google Cloudの認証情報が設定されていないため、GCSの一時ファイルの定期削除は行いません")
+            return
+        while True:
+            try:
+                if should_sweep is None or should_sweep():
+                    GCSHandler().sweep_staging(max_age_seconds)
+            except Exception as e:
+                logger.warning(f"GCSの一時ファイルの削除に失敗しました: {e}")
+            time.sleep(interval_seconds)
+
+    with _sweeper_lock:
+        if _sweeper is None:
+            _sweeper = threading.Thread(target=sweep_loop, name='gcs-sweeper', daemon=True)
+            _sweeper.start()
+
+
 def create_gcs_handler(bucket_name: str = None) -> GCSHandler:
     """
     GCSハンドラーオブジェクトを作成
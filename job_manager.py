@@ -0,0 +1,462 @@
+"""
+ジョブ管理モジュール
+アップロードされた音声の処理をバックグラウンドで実行
+処理は段階（変換 → 音声認識 → 要約 → 整形 → 保存）ごとに別々のワーカープールで実行し、
+あるジョブの要約中に別のジョブの変換を進められるようにする
+"""
+
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Callable, List, Tuple
+from config import JOB_WORKERS, JOB_MAX_QUEUE, JOB_RETENTION_SECONDS, PIPELINE_STAGE_WORKERS
+
+# ログ設定
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFullError(Exception):
+    """ジョブキューが満杯の場合の例外"""
+
+
+class StageSuspended:
+    """段階の処理を外部の完了通知（非同期認識など）まで中断することを示す戻り値"""
+
+    def __init__(self, subscribe: Callable[[Callable[[Optional[Dict[str, Any]]], None]], None]):
+        """
+        初期化
+
+        Args:
+            subscribe: 再開用の関数を受け取り、完了時にその段階の戻り値（次の段階に進む場合None）で呼ぶよう登録する関数
+        """
+        self.subscribe = subscribe
+
+    def wait(self, poll_seconds: Optional[float] = None,
+             on_poll: Optional[Callable[[], None]] = None) -> Optional[Dict[str, Any]]:
+        """
+        完了まで現在のスレッドで待つ
+
+        Args:
+            poll_seconds: 待つ間に on_poll を呼ぶ間隔（省略時は完了まで待つだけ）
+            on_poll: 待つ間に定期的に呼ぶ関数（リースの延長など。例外を送出すると待つのをやめる）
+
+        Returns:
+            段階の戻り値
+        """
+        done = threading.Event()
+        holder = {}
+
+        def resume(result: Optional[Dict[str, Any]]):
+            holder['result'] = result
+            done.set()
+
+        self.subscribe(resume)
+        while not done.wait(poll_seconds):
+            if on_poll is not None:
+                on_poll()
+        return holder['result']
+
+
+# 段階の処理関数 (report, state) -> 結果の辞書（次の段階に進む場合None、中断する場合StageSuspended）
+StageFunc = Callable[[Callable[..., None], Dict[str, Any]], Any]
+
+
+class StagePool:
+    """1つの処理段階のワーカープール（待ち時間と稼働率を記録）"""
+
+    def __init__(self, name: str, max_workers: int):
+        """
+        初期化
+
+        Args:
+            name: 処理段階の名前
+            max_workers: この段階を同時に実行する数
+        """
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"stage-{name}")
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+        # 実行中の処理の開始時刻の合計（稼働時間の計算用）
+        self._running_started_sum = 0.0
+        self._stats = {
+            'queued': 0,
+            'running': 0,
+            'completed': 0,
+            'total_wait_seconds': 0.0,
+            'max_wait_seconds': 0.0,
+            'busy_seconds': 0.0
+        }
+
+    def submit(self, func: Callable[..., None], *args):
+        """
+        処理を登録（空きワーカーがなければ待ち行列に入る）
+
+        Args:
+            func: 実行する関数
+            *args: 関数に渡す引数
+        """
+        queued_at = time.monotonic()
+        with self._lock:
+            self._stats['queued'] += 1
+
+        def run():
+            started_at = time.monotonic()
+            with self._lock:
+                wait = started_at - queued_at
+                self._stats['queued'] -= 1
+                self._stats['running'] += 1
+                self._stats['total_wait_seconds'] += wait
+                self._stats['max_wait_seconds'] = max(self._stats['max_wait_seconds'], wait)
+                self._running_started_sum += started_at
+            try:
+                func(*args)
+            finally:
+                with self._lock:
+                    self._stats['running'] -= 1
+                    self._stats['completed'] += 1
+                    self._stats['busy_seconds'] += time.monotonic() - started_at
+                    self._running_started_sum -= started_at
+
+        try:
+            self._executor.submit(run)
+        except Exception:
+            with self._lock:
+                self._stats['queued'] -= 1
+            raise
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        待ち数・実行中の数・平均待ち時間・稼働率を取得
+
+        Returns:
+            統計情報の辞書（稼働率は起動からの全ワーカーの時間に対する処理時間の割合）
+        """
+        now = time.monotonic()
+        with self._lock:
+            stats = dict(self._stats)
+            busy = stats['busy_seconds'] + stats['running'] * now - self._running_started_sum
+        started = stats['completed'] + stats['running']
+        stats['max_workers'] = self.max_workers
+        stats['avg_wait_seconds'] = stats['total_wait_seconds'] / started if started else 0.0
+        stats['utilization'] = round(busy / (self.max_workers * max(now - self._started_at, 1e-9)), 4)
+        return stats
+
+    def shutdown(self, wait: bool = True):
+        """ワーカープールを停止"""
+        self._executor.shutdown(wait=wait)
+
+
+class JobManager:
+    """バックグラウンドジョブ管理クラス"""
+
+    def __init__(self, max_workers: int = JOB_WORKERS, max_queue: int = JOB_MAX_QUEUE,
+                 retention_seconds: int = JOB_RETENTION_SECONDS,
+                 stage_workers: Optional[Dict[str, int]] = None):
+        """
+        初期化
+
+        Args:
+            max_workers: 段階に分けないジョブ（submit）を同時に処理する数
+            max_queue: 処理待ちにできるジョブ数
+            retention_seconds: 終了したジョブを保持する秒数
+            stage_workers: 段階ごとのワーカー数（省略時は PIPELINE_STAGE_WORKERS）
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retention_seconds = retention_seconds
+        self.stage_workers = dict(PIPELINE_STAGE_WORKERS if stage_workers is None else stage_workers)
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        # 進捗イベントの履歴（SSEで途中から接続したクライアントにも送るため保持）
+        self._events: Dict[str, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        # 実行中＋待機中のジョブ数を制限する
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._pools: Dict[str, StagePool] = {}
+        self._pools_lock = threading.Lock()
+        logger.info(f"JobManagerを初期化しました (ワーカー数: {max_workers}, 最大待機数: {max_queue}, "
+                    f"段階ごとのワーカー数: {self.stage_workers})")
+
+    def submit(self, func: Callable[..., Dict[str, Any]], *args, **kwargs) -> str:
+        """
+        ジョブを登録（1つの関数を1つの段階として実行）
+
+        Args:
+            func: 実行する関数（第1引数に進捗通知用のコールバックを受け取る）
+            *args: 関数に渡す引数
+            **kwargs: 関数に渡すキーワード引数
+
+        Returns:
+            ジョブID
+        """
+        return self.submit_stages([('job', lambda report, state: func(report, *args, **kwargs))])
+
+    def submit_stages(self, stages: List[Tuple[str, StageFunc]], state: Optional[Dict[str, Any]] = None,
+                      on_finish: Optional[Callable[[], None]] = None) -> str:
+        """
+        段階に分けたジョブを登録（各段階はその段階のワーカープールで順に実行）
+
+        Args:
+            stages: (段階名, 処理関数) のリスト。処理関数は (report, state) を受け取り、
+                    次の段階に進む場合はNone、ジョブを終える場合は結果の辞書を返す
+            state: 段階間で受け渡す辞書
+            on_finish: ジョブの終了時（成功・失敗とも）に呼ぶ関数
+
+        Returns:
+            ジョブID
+        """
+        if not self._slots.acquire(blocking=False):
+            raise JobQueueFullError("処理待ちのジョブが上限に達しています")
+
+        self._purge_expired()
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self.jobs[job_id] = {
+                'job_id': job_id,
+                'status': 'queued',
+                'stage': 'queued',
+                'progress': 0,
+                'message': '処理待ち',
+                'result': None,
+                'partial': None,
+                'error': None,
+                'timings': {},
+                'created_at': now,
+                'updated_at': now
+            }
+            self._events[job_id] = []
+            self._append_event(job_id)
+
+        try:
+            self._pool(stages[0][0]).submit(self._run_stage, job_id, stages, 0, state or {}, on_finish)
+        except Exception:
+            self._slots.release()
+            with self._lock:
+                self.jobs.pop(job_id, None)
+                self._events.pop(job_id, None)
+            raise
+
+        logger.info(f"ジョブを登録しました: {job_id}")
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        ジョブの状態を取得
+
+        Args:
+            job_id: ジョブID
+
+        Returns:
+            ジョブ情報の辞書（存在しない場合None）
+        """
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return dict(job, timings=dict(job['timings'])) if job else None
+    
+    def wait_for_events(self, job_id: str, after_id: int = 0,
+                        timeout: float = 15.0) -> Optional[Tuple[List[Dict[str, Any]], bool]]:
+        """
+        指定したID以降の進捗イベントを取得（新しいイベントがなければ最大timeout秒待つ）
+
+        Args:
+            job_id: ジョブID
+            after_id: 受信済みの最後のイベントID
+            timeout: 待機する最大秒数
+
+        Returns:
+            (イベントのリスト, ジョブが終了したかどうか)（ジョブが存在しない場合None）
+        """
+        with self._changed:
+            self._changed.wait_for(
+                lambda: job_id not in self.jobs or len(self._events[job_id]) > after_id,
+                timeout=timeout
+            )
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            events = self._events[job_id][after_id:]
+            return events, job['status'] in ('completed', 'failed')
+
+    def update_progress(self, job_id: str, stage: str, progress: int, message: str = '',
+                        partial: Optional[Dict[str, Any]] = None):
+        """
+        ジョブの進捗を更新
+
+        Args:
+            job_id: ジョブID
+            stage: 処理段階
+            progress: 進捗率（0〜100）
+            message: 表示用メッセージ
+            partial: 途中結果（生成途中の要約など、省略時は前回の値を維持）
+        """
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            self._record_timing(job)
+            job['stage'] = stage
+            job['progress'] = progress
+            job['message'] = message
+            if partial is not None:
+                job['partial'] = partial
+            job['updated_at'] = time.time()
+            self._append_event(job_id, partial)
+    
+    def _record_timing(self, job: Dict[str, Any]):
+        """直前の段階に要した秒数を加算（ロック取得済みで呼ぶ）"""
+        now = time.time()
+        stage = job['stage']
+        job['timings'][stage] = round(job['timings'].get(stage, 0.0) + now - job['updated_at'], 3)
+    
+    def _append_event(self, job_id: str, partial: Optional[Dict[str, Any]] = None):
+        """現在の状態を進捗イベントとして記録し、待機中のSSE接続に通知（ロック取得済みで呼ぶ）"""
+        job = self.jobs[job_id]
+        events = self._events[job_id]
+        event = {
+            'id': len(events) + 1,
+            'status': job['status'],
+            'stage': job['stage'],
+            'progress': job['progress'],
+            'message': job['message'],
+            'elapsed': round(time.time() - job['created_at'], 3)
+        }
+        if partial is not None:
+            event['partial'] = partial
+        events.append(event)
+        self._changed.notify_all()
+
+    def _pool(self, stage: str) -> StagePool:
+        """段階のワーカープールを取得（初回に作成）"""
+        with self._pools_lock:
+            pool = self._pools.get(stage)
+            if pool is None:
+                pool = StagePool(stage, self.stage_workers.get(stage, self.max_workers))
+                self._pools[stage] = pool
+            return pool
+
+    def _run_stage(self, job_id: str, stages: List[Tuple[str, StageFunc]], index: int,
+                   state: Dict[str, Any], on_finish: Optional[Callable[[], None]]):
+        """段階のワーカーで1つの段階を実行し、次の段階のプールに渡す"""
+        name, func = stages[index]
+        with self._lock:
+            job = self.jobs[job_id]
+            self._record_timing(job)
+            job['stage'] = name
+            job['updated_at'] = time.time()
+            if index == 0:
+                job['status'] = 'running'
+                job['message'] = '処理を開始しました'
+                self._append_event(job_id)
+
+        def report(stage: str, progress: int, message: str = '', partial: Optional[Dict[str, Any]] = None):
+            self.update_progress(job_id, stage, progress, message, partial)
+
+        try:
+            result = func(report, state)
+            if isinstance(result, StageSuspended):
+                # 完了通知を待つ間はワーカーを解放し、通知を受けたスレッドから続きを登録する
+                result.subscribe(lambda resumed: self._advance(job_id, stages, index, state, on_finish, resumed))
+                return
+            self._advance(job_id, stages, index, state, on_finish, result)
+
+        except Exception as e:
+            logger.error(f"ジョブ実行エラー: {job_id}: {e}")
+            self._finish(job_id, {'success': False, 'error': str(e)}, on_finish)
+
+    def _advance(self, job_id: str, stages: List[Tuple[str, StageFunc]], index: int, state: Dict[str, Any],
+                 on_finish: Optional[Callable[[], None]], result: Optional[Dict[str, Any]]):
+        """段階の戻り値に応じて次の段階のプールに渡すか、ジョブを終了"""
+        try:
+            if result is None and index + 1 < len(stages):
+                # 次の段階の空きを待つ時間は「<段階名>_queued」として記録
+                next_stage = stages[index + 1][0]
+                with self._lock:
+                    job = self.jobs[job_id]
+                    self._record_timing(job)
+                    job['stage'] = f"{next_stage}_queued"
+                    job['updated_at'] = time.time()
+                self._pool(next_stage).submit(self._run_stage, job_id, stages, index + 1, state, on_finish)
+                return
+            self._finish(job_id, result or {'success': False, 'error': '処理結果がありません'}, on_finish)
+
+        except Exception as e:
+            logger.error(f"ジョブ実行エラー: {job_id}: {e}")
+            self._finish(job_id, {'success': False, 'error': str(e)}, on_finish)
+
+    def _finish(self, job_id: str, result: Dict[str, Any], on_finish: Optional[Callable[[], None]]):
+        """ジョブの結果を記録し、枠を解放"""
+        try:
+            with self._lock:
+                job = self.jobs[job_id]
+                self._record_timing(job)
+                if result.get('success'):
+                    job['status'] = 'completed'
+                    job['stage'] = 'completed'
+                    job['progress'] = 100
+                    job['message'] = '完了'
+                    job['result'] = result
+                else:
+                    job['status'] = 'failed'
+                    job['error'] = result.get('error')
+                    job['message'] = job['error'] or ''
+                job['updated_at'] = time.time()
+                self._append_event(job_id)
+                timings = ', '.join(f"{stage}={seconds:.1f}s" for stage, seconds in job['timings'].items())
+            logger.info(f"ジョブが終了しました: {job_id} ({self.jobs[job_id]['status']}) [{timings}]")
+        finally:
+            self._slots.release()
+            if on_finish is not None:
+                try:
+                    on_finish()
+                except Exception as e:
+                    logger.warning(f"ジョブ終了時の処理でエラー: {job_id}: {e}")
+
+    def get_stage_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        段階ごとのワーカープールの統計情報を取得
+
+        Returns:
+            段階名をキーとした待ち数・平均待ち時間・稼働率などの辞書
+        """
+        with self._pools_lock:
+            pools = dict(self._pools)
+        return {name: pool.get_stats() for name, pool in pools.items()}
+
+    def _purge_expired(self):
+        """保持期間を過ぎた終了済みジョブを削除"""
+        threshold = time.time() - self.retention_seconds
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self.jobs.items()
+                if job['status'] in ('completed', 'failed') and job['updated_at'] < threshold
+            ]
+            for job_id in expired:
+                del self.jobs[job_id]
+                del self._events[job_id]
+
+    def shutdown(self, wait: bool = True):
+        """全段階のワーカープールを停止"""
+        with self._pools_lock:
+            pools = list(self._pools.values())
+        for pool in pools:
+            pool.shutdown(wait=wait)
+
+
+def create_job_manager(max_workers: int = JOB_WORKERS, max_queue: int = JOB_MAX_QUEUE) -> JobManager:
+    """
+    ジョブ管理オブジェクトを作成
+
+    Args:
+        max_workers: 同時に処理するジョブ数
+        max_queue: 処理待ちにできるジョブ数
+
+    Returns:
+        JobManagerインスタンス
+    """
+    return JobManager(max_workers, max_queue)
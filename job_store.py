@@ -0,0 +1,386 @@
+"""
+永続ジョブキューモジュール
+ジョブと段階ごとの途中経過をディスク（SQLite）に保存し、worker.py が別プロセスで処理する
+（Webとワーカーを別々に増やせ、再起動しても処理済みの段階からやり直せる）
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Iterator, List, Tuple
+from job_manager import JobQueueFullError
+from config import (
+    JOB_STORE_PATH,
+    JOB_WORKERS,
+    JOB_MAX_QUEUE,
+    JOB_RETENTION_SECONDS,
+    JOB_LEASE_SECONDS,
+    JOB_MAX_ATTEMPTS
+)
+
+# ログ設定
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# SSE配信時に更新を確認する間隔（秒）
+EVENT_POLL_SECONDS = 0.5
+
+
+class LeaseLostError(Exception):
+    """ジョブのリースが期限切れで他のワーカーに引き継がれた場合の例外"""
+
+
+class JobStore:
+    """SQLiteに保存するジョブキュー（複数プロセスで共有可能）"""
+
+    def __init__(self, db_path: Optional[str] = None, max_pending: int = JOB_WORKERS + JOB_MAX_QUEUE,
+                 lease_seconds: float = JOB_LEASE_SECONDS, max_attempts: int = JOB_MAX_ATTEMPTS,
+                 retention_seconds: int = JOB_RETENTION_SECONDS):
+        """
+        初期化
+
+        Args:
+            db_path: ジョブDBのパス
+            max_pending: 処理中＋待機中にできるジョブ数
+            lease_seconds: ワーカーが延長しない場合にリースが切れるまでの秒数
+            max_attempts: 1つのジョブを実行する回数の上限
+            retention_seconds: 終了したジョブを保持する秒数
+        """
+        self.db_path = db_path or JOB_STORE_PATH
+        self.max_pending = max_pending
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retention_seconds = retention_seconds
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._initialize_db()
+
+    @contextmanager
+    def _connect(self, write: bool = True) -> Iterator[sqlite3.Connection]:
+        """
+        DB接続を作成（操作ごとに接続し、終了時にコミットして閉じる）
+
+        Args:
+            write: 更新する場合True（読み取りのみの場合は書き込みロックを取らない）
+        """
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            # 更新時は取得と更新の間に他のプロセスが割り込まないよう書き込みロックを先に取る
+            # （読み取りはWALにより書き込み中でも待たずに行える）
+            conn.execute('BEGIN IMMEDIATE' if write else 'BEGIN')
+            try:
+                yield conn
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        finally:
+            conn.close()
+
+    def _initialize_db(self):
+        """テーブルを作成"""
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    pipeline TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    next_stage INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    progress INTEGER NOT NULL DEFAULT 0,
+                    message TEXT NOT NULL DEFAULT '',
+                    partial TEXT,
+                    result TEXT,
+                    error TEXT,
+                    timings TEXT NOT NULL DEFAULT '{}',
+                    version INTEGER NOT NULL DEFAULT 1,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_expires_at REAL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)')
+
+    def enqueue(self, pipeline: str, state: Dict[str, Any]) -> str:
+        """
+        ジョブを登録
+
+        Args:
+            pipeline: 処理段階の種類（pipeline.PIPELINES のキー）
+            state: 段階間で受け渡す辞書（JSONに変換できる値のみ）
+
+        Returns:
+            ジョブID
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            self._purge_expired(conn, now)
+            pending = conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+            if pending >= self.max_pending:
+                raise JobQueueFullError("処理待ちのジョブが上限に達しています")
+            conn.execute(
+                "INSERT INTO jobs (job_id, pipeline, state, status, stage, message, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'queued', 'queued', '処理待ち', ?, ?)",
+                (job_id, pipeline, json.dumps(state, ensure_ascii=False), now, now)
+            )
+        logger.info(f"ジョブを登録しました: {job_id} ({pipeline})")
+        return job_id
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """
+        処理待ちのジョブ、またはリースが切れたジョブを1件取得してリースを設定
+
+        Args:
+            worker_id: ワーカーID
+
+        Returns:
+            'job_id'・'pipeline'・'state'・'next_stage' を含む辞書（ジョブがない場合None）
+        """
+        now = time.time()
+        with self._connect() as conn:
+            while True:
+                row = conn.execute(
+                    "SELECT job_id, pipeline, state, next_stage, attempts FROM jobs "
+                    "WHERE status = 'queued' OR (status = 'running' AND lease_expires_at < ?) "
+                    "ORDER BY created_at LIMIT 1", (now,)
+                ).fetchone()
+                if row is None:
+                    return None
+                job_id, pipeline, state, next_stage, attempts = row
+
+                if attempts >= self.max_attempts:
+                    # 処理中に何度もワーカーが停止したジョブは失敗にする
+                    self._update(conn, job_id, now, status='failed', message='処理が繰り返し中断されたため失敗しました',
+                                 error='処理が繰り返し中断されたため失敗しました', lease_owner=None)
+                    logger.warning(f"ジョブの再実行回数が上限に達しました: {job_id}")
+                    continue
+
+                self._update(conn, job_id, now, status='running', attempts=attempts + 1, lease_owner=worker_id,
+                             lease_expires_at=now + self.lease_seconds,
+                             message='処理を開始しました' if attempts == 0 else '中断された処理を再開しました')
+                if attempts:
+                    logger.info(f"中断されたジョブを再開します: {job_id} (段階 {next_stage} から, {attempts + 1}回目)")
+                return {'job_id': job_id, 'pipeline': pipeline, 'state': json.loads(state), 'next_stage': next_stage}
+
+    def renew_lease(self, job_id: str, worker_id: str):
+        """
+        リースを延長
+
+        Args:
+            job_id: ジョブID
+            worker_id: ワーカーID
+
+        Raises:
+            LeaseLostError: 他のワーカーに引き継がれていた場合
+        """
+        with self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE job_id = ? AND lease_owner = ? AND status = 'running'",
+                (time.time() + self.lease_seconds, job_id, worker_id)
+            ).rowcount
+        if not updated:
+            raise LeaseLostError(f"ジョブのリースが失われました: {job_id}")
+
+    def release_lease(self, job_id: str, worker_id: str):
+        """
+        リースを手放す（ワーカーの停止時に、期限切れを待たずに他のワーカーが再開できるようにする）
+
+        Args:
+            job_id: ジョブID
+            worker_id: ワーカーID
+        """
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET lease_expires_at = 0 WHERE job_id = ? AND lease_owner = ? "
+                         "AND status = 'running'", (job_id, worker_id))
+
+    def update_progress(self, job_id: str, worker_id: str, stage: str, progress: int, message: str = '',
+                        partial: Optional[Dict[str, Any]] = None):
+        """
+        ジョブの進捗を更新（リースも延長）
+
+        Args:
+            job_id: ジョブID
+            worker_id: ワーカーID
+            stage: 処理段階
+            progress: 進捗率（0〜100）
+            message: 表示用メッセージ
+            partial: 途中結果（省略時は前回の値を維持）
+        """
+        now = time.time()
+        fields = {'stage': stage, 'progress': progress, 'message': message, 'lease_expires_at': now + self.lease_seconds}
+        if partial is not None:
+            fields['partial'] = json.dumps(partial, ensure_ascii=False)
+        with self._connect() as conn:
+            self._owned(conn, job_id, worker_id)
+            self._update(conn, job_id, now, **fields)
+
+    def checkpoint(self, job_id: str, worker_id: str, next_stage: int, state: Dict[str, Any]) -> bool:
+        """
+        段階の終了時に途中経過を保存（再起動後はこの段階から再開）
+
+        Args:
+            job_id: ジョブID
+            worker_id: ワーカーID
+            next_stage: 次に実行する段階の番号
+            state: 段階間で受け渡す辞書
+
+        Returns:
+            保存した場合True（JSONにできない値を含む場合は保存せず、再起動後は前回保存した段階から再開する）
+        """
+        try:
+            serialized = json.dumps(state, ensure_ascii=False)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"途中経過を保存できませんでした: {job_id} (段階 {next_stage}): {e}")
+            return False
+        with self._connect() as conn:
+            self._owned(conn, job_id, worker_id)
+            self._update(conn, job_id, time.time(), next_stage=next_stage, state=serialized)
+        return True
+
+    def finish(self, job_id: str, worker_id: str, result: Dict[str, Any]):
+        """
+        ジョブの結果を保存
+
+        Args:
+            job_id: ジョブID
+            worker_id: ワーカーID
+            result: 処理結果の辞書
+        """
+        now = time.time()
+        if result.get('success'):
+            fields = {'status': 'completed', 'stage': 'completed', 'progress': 100, 'message': '完了',
+                      'result': json.dumps(result, ensure_ascii=False)}
+        else:
+            fields = {'status': 'failed', 'error': result.get('error'), 'message': result.get('error') or ''}
+        with self._connect() as conn:
+            self._owned(conn, job_id, worker_id)
+            self._update(conn, job_id, now, lease_owner=None, lease_expires_at=None, state='{}', **fields)
+        logger.info(f"ジョブが終了しました: {job_id} ({fields['status']})")
+
+    def _owned(self, conn: sqlite3.Connection, job_id: str, worker_id: str):
+        """ワーカーがリースを持っているか確認"""
+        row = conn.execute('SELECT lease_owner FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        if row is None or row[0] != worker_id:
+            raise LeaseLostError(f"ジョブのリースが失われました: {job_id}")
+
+    def _update(self, conn: sqlite3.Connection, job_id: str, now: float, **fields):
+        """ジョブを更新し、段階が変わった場合は直前の段階の所要秒数を加算"""
+        stage, timings, updated_at = conn.execute(
+            'SELECT stage, timings, updated_at FROM jobs WHERE job_id = ?', (job_id,)
+        ).fetchone()
+        if 'stage' in fields or 'status' in fields:
+            timings = json.loads(timings)
+            timings[stage] = round(timings.get(stage, 0.0) + now - updated_at, 3)
+            fields['timings'] = json.dumps(timings)
+            fields['updated_at'] = now
+        columns = ', '.join(f"{name} = ?" for name in fields)
+        conn.execute(f"UPDATE jobs SET {columns}, version = version + 1 WHERE job_id = ?",
+                     (*fields.values(), job_id))
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        ジョブの状態を取得（JobManager.get_job と同じ形式）
+
+        Args:
+            job_id: ジョブID
+
+        Returns:
+            ジョブ情報の辞書（存在しない場合None）
+        """
+        with self._connect(write=False) as conn:
+            row = conn.execute(
+                'SELECT job_id, status, stage, progress, message, result, partial, error, timings, '
+                'created_at, updated_at, version FROM jobs WHERE job_id = ?', (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            'job_id': row[0],
+            'status': row[1],
+            'stage': row[2],
+            'progress': row[3],
+            'message': row[4],
+            'result': json.loads(row[5]) if row[5] else None,
+            'partial': json.loads(row[6]) if row[6] else None,
+            'error': row[7],
+            'timings': json.loads(row[8]),
+            'created_at': row[9],
+            'updated_at': row[10],
+            'version': row[11]
+        }
+
+    def wait_for_events(self, job_id: str, after_id: int = 0,
+                        timeout: float = 15.0) -> Optional[Tuple[List[Dict[str, Any]], bool]]:
+        """
+        指定した版より新しい状態を進捗イベントとして取得（JobManager.wait_for_events と同じ形式）
+
+        途中の更新は保存しないため、イベントは最新の状態の1件のみ
+
+        Args:
+            job_id: ジョブID
+            after_id: 受信済みの最後のイベントID（版）
+            timeout: 待機する最大秒数
+
+        Returns:
+            (イベントのリスト, ジョブが終了したかどうか)（ジョブが存在しない場合None）
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get_job(job_id)
+            if job is None:
+                return None
+            finished = job['status'] in ('completed', 'failed')
+            if job['version'] > after_id:
+                event = {
+                    'id': job['version'],
+                    'status': job['status'],
+                    'stage': job['stage'],
+                    'progress': job['progress'],
+                    'message': job['message'],
+                    'elapsed': round(job['updated_at'] - job['created_at'], 3)
+                }
+                if job['partial'] is not None:
+                    event['partial'] = job['partial']
+                return [event], finished
+            if finished or time.monotonic() >= deadline:
+                return [], finished
+            time.sleep(EVENT_POLL_SECONDS)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        状態ごとのジョブ数を取得
+
+        Returns:
+            'queued'・'running'・'completed'・'failed' の件数の辞書
+        """
+        with self._connect(write=False) as conn:
+            counts = dict(conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+        return {status: counts.get(status, 0) for status in ('queued', 'running', 'completed', 'failed')}
+
+    def _purge_expired(self, conn: sqlite3.Connection, now: float):
+        """保持期間を過ぎた終了済みジョブを削除"""
+        conn.execute(
+            "DELETE FROM jobs WHERE status IN ('completed', 'failed') AND updated_at < ?",
+            (now - self.retention_seconds,)
+        )
+
+
+def create_job_store(db_path: Optional[str] = None) -> JobStore:
+    """
+    永続ジョブキューオブジェクトを作成
+
+    Args:
+        db_path: ジョブDBのパス（省略時は JOB_STORE_PATH）
+
+    Returns:
+        JobStoreインスタンス
+    """
+    return JobStore(db_path)
@@ -0,0 +1,439 @@
+"""
+非同期認識の追跡モジュール
+long_running_recognize のOperationを名前でディスク（SQLite）に保存し、1つのスレッドでまとめてポーリングする
+（待機中にジョブのスレッドを使わず、再起動後も完了を待ち続け、終了時は必ずGCSの一時ファイルを削除する）
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Iterator, List, Callable
+from google.cloud import speech
+from google.longrunning import operations_pb2
+from configs.speech_config import LONG_RUNNING_POLL_SECONDS, LONG_RUNNING_TIMEOUT_SECONDS
+from client_registry import get_speech_client
+from gcs_handler import GCSHandler
+from config import GOOGLE_APPLICATION_CREDENTIALS, OPERATION_STORE_PATH, OPERATION_RETENTION_SECONDS
+
+# ログ設定
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def response_to_result(response: speech.LongRunningRecognizeResponse) -> Dict[str, Any]:
+    """
+    非同期認識の結果を音声認識結果の辞書に変換
+
+    Args:
+        response: LongRunningRecognizeResponse
+
+    Returns:
+        変換結果の辞書
+    """
+    result = {
+        'success': False,
+        'text': '',
+        'confidence': 0.0,
+        'error': None,
+        'word_count': 0
+    }
+    alternatives = [res.alternatives[0] for res in response.results if res.alternatives]
+    if not alternatives:
+        result['error'] = "音声認識の結果がありません"
+        logger.warning("音声認識の結果がありません")
+        return result
+
+    # 全ての結果を結合
+    result['text'] = ' '.join(alt.transcript for alt in alternatives)
+    result['confidence'] = sum(alt.confidence for alt in alternatives) / len(alternatives)
+    result['success'] = True
+    result['word_count'] = len(result['text'].split())
+    logger.info(f"長時間音声認識完了: {result['word_count']}語, 平均信頼度: {result['confidence']:.2f}")
+    return result
+
+
+class OperationTracker:
+    """非同期認識のOperationを保存・ポーリングするクラス"""
+
+    def __init__(self, db_path: Optional[str] = None, client: Optional[speech.SpeechClient] = None,
+                 poll_seconds: float = LONG_RUNNING_POLL_SECONDS,
+                 timeout_seconds: float = LONG_RUNNING_TIMEOUT_SECONDS,
+                 retention_seconds: int = OPERATION_RETENTION_SECONDS):
+        """
+        初期化
+
+        Args:
+            db_path: Operationを保存するDBのパス
+            client: 使用するSpeechClient（省略時はプロセス共有のクライアント）
+            poll_seconds: ポーリング間隔
+            timeout_seconds: 開始からこの秒数を過ぎても完了しない場合は失敗とする
+            retention_seconds: 終了したOperationの結果を保持する秒数
+        """
+        self.db_path = db_path or OPERATION_STORE_PATH
+        self.client = client
+        self.poll_seconds = poll_seconds
+        self.timeout_seconds = timeout_seconds
+        self.retention_seconds = retention_seconds
+        # Operation名ごとの完了通知・進捗通知のコールバック
+        self._subscribers: Dict[str, List[Dict[str, Callable]]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        # 複数のプロセスが同じDBを使う場合に、ポーリングを行うプロセスを1つに決めるためのID
+        self.owner_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.poll_lease_seconds = max(30.0, poll_seconds * 3)
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._initialize_db()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """DB接続を作成（操作ごとに接続し、終了時にコミットして閉じる）"""
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _initialize_db(self):
+        """テーブルを作成"""
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS operations (
+                    name TEXT PRIMARY KEY,
+                    gcs_object TEXT,
+                    status TEXT NOT NULL,
+                    progress INTEGER NOT NULL DEFAULT 0,
+                    result TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_operations_status ON operations (status)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_operations_updated_at ON operations (updated_at)')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS leases (
+                    role TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+
+    def hold_lease(self, role: str, lease_seconds: float) -> bool:
+        """
+        役割のリースを取得または延長（複数のプロセスのうち1つだけが処理を行う）
+
+        Args:
+            role: 役割の名前（'poller'・'sweeper' など）
+            lease_seconds: 延長しない場合に他のプロセスが引き継ぐまでの秒数
+
+        Returns:
+            このプロセスがリースを持っている場合True
+        """
+        now = time.time()
+        with self._connect() as conn:
+            updated = conn.execute(
+                'INSERT INTO leases (role, owner, expires_at) VALUES (?, ?, ?) '
+                'ON CONFLICT (role) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at '
+                'WHERE leases.owner = excluded.owner OR leases.expires_at < ?',
+                (role, self.owner_id, now + lease_seconds, now)
+            ).rowcount
+        return updated > 0
+
+    def reserve(self, gcs_object: str) -> str:
+        """
+        GCSオブジェクトを使う認識を開始する前に参照を記録
+
+        内容が同じ音声は同じオブジェクトを使うため、アップロード（または既存のオブジェクトの確認）から
+        track() までの間に、他の認識の終了でオブジェクトが削除されないようにする
+
+        Args:
+            gcs_object: 使用するGCSオブジェクト名
+
+        Returns:
+            track() または release() に渡す予約名
+        """
+        reservation = f"pending/{uuid.uuid4().hex}"
+        now = time.time()
+        with self._connect() as conn:
+            # 開始前のまま停止したプロセスの予約と、保持期間を過ぎた終了済みのOperationを削除
+            conn.execute("DELETE FROM operations WHERE status = 'pending' AND created_at < ?",
+                         (now - self.timeout_seconds,))
+            conn.execute("DELETE FROM operations WHERE status IN ('succeeded', 'failed') AND updated_at < ?",
+                         (now - self.retention_seconds,))
+            conn.execute(
+                "INSERT INTO operations (name, gcs_object, status, created_at, updated_at) "
+                "VALUES (?, ?, 'pending', ?, ?)", (reservation, gcs_object, now, now)
+            )
+        return reservation
+
+    def release(self, reservation: Optional[str], gcs_object: Optional[str] = None):
+        """
+        認識を開始できなかった場合に予約を取り消す
+
+        Args:
+            reservation: reserve() の予約名
+            gcs_object: 指定した場合、他の認識が参照していなければ削除するGCSオブジェクト名
+        """
+        if reservation:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM operations WHERE name = ? AND status = 'pending'", (reservation,))
+        if gcs_object and not self._object_in_use(gcs_object):
+            try:
+                GCSHandler().delete_file(gcs_object)
+            except Exception as e:
+                logger.warning(f"GCSファイル削除エラー: {e}")
+
+    def track(self, name: str, gcs_object: Optional[str] = None, reservation: Optional[str] = None):
+        """
+        開始したOperationを保存してポーリングを開始
+
+        Args:
+            name: Operation名
+            gcs_object: 終了時に削除するGCSオブジェクト名
+            reservation: reserve() の予約名（Operationの保存と同時に取り消す）
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO operations (name, gcs_object, status, created_at, updated_at) "
+                "VALUES (?, ?, 'running', ?, ?)", (name, gcs_object, now, now)
+            )
+            if reservation:
+                conn.execute("DELETE FROM operations WHERE name = ? AND status = 'pending'", (reservation,))
+        logger.info(f"非同期認識を追跡します: {name}")
+        self._ensure_polling()
+
+    def subscribe(self, name: str, on_done: Callable[[Dict[str, Any]], None],
+                  on_progress: Optional[Callable[[int], None]] = None):
+        """
+        Operationの完了時に呼ぶコールバックを登録（終了済み・保存されていない場合はすぐに呼ぶ）
+
+        Args:
+            name: Operation名
+            on_done: 完了時に音声認識結果の辞書を受け取る関数（ポーリングのスレッドで呼ばれる）
+            on_progress: 進捗率（0〜100）が変わった時に呼ぶ関数
+        """
+        with self._lock:
+            row = self._get(name)
+            running = row is not None and row['status'] == 'running'
+            if running:
+                self._subscribers.setdefault(name, []).append({'on_done': on_done, 'on_progress': on_progress})
+        if running:
+            self._ensure_polling()
+            return
+        # 保存されていない（DBが消えた・別の環境で開始した）Operationは完了を待てないため失敗とする
+        on_done(row['result'] if row is not None and row['result'] else self._missing_result(name))
+
+    def wait(self, name: str, on_progress: Optional[Callable[[int], None]] = None) -> Dict[str, Any]:
+        """
+        Operationの完了を待つ（同期的に結果が必要な場合）
+
+        Args:
+            name: Operation名
+            on_progress: 進捗率（0〜100）が変わった時に呼ぶ関数
+
+        Returns:
+            音声認識結果の辞書
+        """
+        done = threading.Event()
+        holder = {}
+
+        def on_done(result: Dict[str, Any]):
+            holder['result'] = result
+            done.set()
+
+        self.subscribe(name, on_done, on_progress)
+        done.wait()
+        return holder['result']
+
+    def resume(self) -> int:
+        """
+        前回の起動時に完了しなかったOperationのポーリングを再開
+
+        Returns:
+            再開したOperationの数
+        """
+        with self._connect() as conn:
+            count = conn.execute("SELECT COUNT(*) FROM operations WHERE status = 'running'").fetchone()[0]
+        if count:
+            logger.info(f"未完了の非同期認識{count}件のポーリングを再開します")
+            self._ensure_polling()
+        return count
+
+    def _get(self, name: str) -> Optional[Dict[str, Any]]:
+        """保存されたOperationを取得"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT status, result FROM operations WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            return None
+        return {'status': row[0], 'result': json.loads(row[1]) if row[1] else None}
+
+    @staticmethod
+    def _missing_result(name: str) -> Dict[str, Any]:
+        """追跡していないOperationの結果"""
+        return {
+            'success': False,
+            'text': '',
+            'confidence': 0.0,
+            'error': f"非同期認識が見つかりません: {name}",
+            'word_count': 0
+        }
+
+    def _ensure_polling(self):
+        """ポーリングのスレッドが動いていなければ開始"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._poll_loop, name='operation-poller', daemon=True)
+                self._thread.start()
+
+    def _poll_loop(self):
+        """未完了のOperationがなくなるまで定期的に状態を取得"""
+        while True:
+            with self._connect() as conn:
+                running = conn.execute(
+                    "SELECT name, gcs_object, progress, created_at FROM operations WHERE status = 'running'"
+                ).fetchall()
+            self._notify_finished_elsewhere({row[0] for row in running})
+            if not running:
+                with self._lock:
+                    # 停止直前に追加されたものがないか確認してから終了
+                    with self._connect() as conn:
+                        remaining = conn.execute("SELECT COUNT(*) FROM operations WHERE status = 'running'").fetchone()[0]
+                    if not remaining and not self._subscribers:
+                        self._thread = None
+                        return
+                continue
+            # APIへの問い合わせとGCSの一時ファイルの削除は、リースを持つ1つのプロセスだけが行う
+            if self.hold_lease('poller', self.poll_lease_seconds):
+                for name, gcs_object, progress, created_at in running:
+                    try:
+                        self._poll(name, gcs_object, progress, created_at)
+                    except Exception as e:
+                        logger.warning(f"非同期認識の状態取得に失敗しました: {name}: {e}")
+            time.sleep(self.poll_seconds)
+
+    def _notify_finished_elsewhere(self, running: set):
+        """他のプロセスが終了させたOperationを待っているコールバックに結果を渡す"""
+        with self._lock:
+            names = [name for name in self._subscribers if name not in running]
+        for name in names:
+            row = self._get(name)
+            self._notify(name, row['result'] if row is not None and row['result'] else self._missing_result(name))
+
+    def _poll(self, name: str, gcs_object: Optional[str], progress: int, created_at: float):
+        """1つのOperationの状態を取得し、完了していれば結果を保存"""
+        if time.time() - created_at > self.timeout_seconds:
+            self._finish(name, gcs_object, 'failed', {
+                'success': False, 'text': '', 'confidence': 0.0, 'word_count': 0,
+                'error': f"非同期認識が{self.timeout_seconds:.0f}秒以内に完了しませんでした"
+            })
+            return
+
+        if self.client is None:
+            self.client = get_speech_client(GOOGLE_APPLICATION_CREDENTIALS)
+        operation = self.client.get_operation(operations_pb2.GetOperationRequest(name=name))
+
+        if operation.metadata.value:
+            percent = speech.LongRunningRecognizeMetadata.deserialize(operation.metadata.value).progress_percent
+            if percent != progress:
+                logger.info(f"非同期認識の進捗: {percent}%")
+                with self._connect() as conn:
+                    conn.execute('UPDATE operations SET progress = ?, updated_at = ? WHERE name = ?',
+                                 (percent, time.time(), name))
+                with self._lock:
+                    subscribers = list(self._subscribers.get(name, []))
+                for subscriber in subscribers:
+                    if subscriber['on_progress'] is not None:
+                        subscriber['on_progress'](percent)
+
+        if not operation.done:
+            return
+        if operation.HasField('error'):
+            self._finish(name, gcs_object, 'failed', {
+                'success': False, 'text': '', 'confidence': 0.0, 'word_count': 0,
+                'error': f"音声認識エラー: {operation.error.message}"
+            })
+            return
+        response = speech.LongRunningRecognizeResponse.deserialize(operation.response.value)
+        result = response_to_result(response)
+        self._finish(name, gcs_object, 'succeeded' if result['success'] else 'failed', result)
+
+    def _finish(self, name: str, gcs_object: Optional[str], status: str, result: Dict[str, Any]):
+        """結果を保存し、GCSの一時ファイルを削除して待機中のコールバックを呼ぶ"""
+        with self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE operations SET status = ?, result = ?, updated_at = ? WHERE name = ? AND status = 'running'",
+                (status, json.dumps(result, ensure_ascii=False), time.time(), name)
+            ).rowcount
+        if updated:
+            logger.info(f"非同期認識が終了しました: {name} ({status})")
+            # 成功・失敗・タイムアウトのいずれでも一時ファイルは不要
+            # （内容が同じ音声は同じオブジェクトを使うため、実行中の認識が参照している場合は残す）
+            if gcs_object and not self._object_in_use(gcs_object):
+                try:
+                    GCSHandler().delete_file(gcs_object)
+                except Exception as e:
+                    logger.warning(f"GCSファイル削除エラー: {e}")
+        self._notify(name, result)
+
+    def _notify(self, name: str, result: Dict[str, Any]):
+        """Operationを待っているコールバックに結果を渡す"""
+        with self._lock:
+            subscribers = self._subscribers.pop(name, [])
+        for subscriber in subscribers:
+            try:
+                subscriber['on_done'](result)
+            except Exception as e:
+                logger.error(f"非同期認識の完了通知でエラー: {name}: {e}")
+
+    def _object_in_use(self, gcs_object: str) -> bool:
+        """実行中・開始前の他のOperationがGCSオブジェクトを参照しているか"""
+        # 開始前のまま停止したプロセスの予約は、タイムアウトを過ぎたら参照とみなさない
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM operations WHERE gcs_object = ? "
+                "AND (status = 'running' OR (status = 'pending' AND created_at >= ?)) LIMIT 1",
+                (gcs_object, time.time() - self.timeout_seconds)
+            ).fetchone()
+        return row is not None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        状態ごとのOperation数を取得
+
+        Returns:
+            'running'・'succeeded'・'failed' の件数と待機中のコールバック数の辞書
+        """
+        with self._connect() as conn:
+            counts = dict(conn.execute('SELECT status, COUNT(*) FROM operations GROUP BY status').fetchall())
+        with self._lock:
+            waiting = sum(len(subscribers) for subscribers in self._subscribers.values())
+        stats = {status: counts.get(status, 0) for status in ('running', 'succeeded', 'failed')}
+        stats['waiting'] = waiting
+        return stats
+
+
+# プロセス内で共有するインスタンス
+_tracker: Optional[OperationTracker] = None
+_tracker_lock = threading.Lock()
+
+
+def get_operation_tracker() -> OperationTracker:
+    """
+    プロセス内で共有する OperationTracker を取得（初回に作成）
+
+    Returns:
+        OperationTrackerインスタンス
+    """
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = OperationTracker()
+        return _tracker
@@ -0,0 +1,298 @@
+"""
+音声要約パイプラインモジュール
+変換 → 音声認識 → テキスト要約 → フォーマット整形 → 結果保存 の各段階を定義
+（JobManager.submit_stages で段階ごとのワーカープールに流す）
+"""
+
+import os
+import logging
+from typing import Optional, Dict, Any, Callable
+from voice_recognizer import create_voice_recognizer
+from convert_audio import map_file
+from operation_tracker import get_operation_tracker
+from job_manager import StageSuspended
+from text_summarizer import create_text_summarizer
+from formatter import IncrementalFormatter, create_formatter
+from result_cache import create_result_cache
+from config import GOOGLE_APPLICATION_CREDENTIALS, OPENAI_API_KEY, OUTPUT_FOLDER
+
+# ログ設定
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 変換済みの音声データを持つ prepared のキー（途中経過の保存時はファイルに書き出す）
+PREPARED_DATA_KEYS = ('pcm', 'data')
+
+
+def _failed(state: Dict[str, Any], error: str) -> Dict[str, Any]:
+    """失敗した場合の処理結果"""
+    return {
+        'success': False,
+        'transcript': state.get('transcript', ''),
+        'summary': '',
+        'output_file': '',
+        'error': error
+    }
+
+
+def _recognizer_for(report: Callable[..., None]):
+    """進捗を通知する音声認識オブジェクトを作成（非同期認識は完了を待たずにOperation名を返す）"""
+    # 音声認識内の進捗（0〜100）をジョブ全体の10〜55%に割り当てる
+    return create_voice_recognizer(
+        GOOGLE_APPLICATION_CREDENTIALS,
+        progress_callback=lambda stage, progress, message: report(stage, 10 + progress * 45 // 100, message),
+        defer_long_running=True
+    )
+
+
+def convert_stage(report: Callable[..., None], state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """変換段階: 音声ファイルを認識できる形に変換（FFmpeg・無音除去、CPU中心）"""
+    report('converting', 10, '音声を変換中...')
+    logger.info("音声の変換を開始...")
+    pcm_path = state.pop('pcm_path', None)
+    prepared = _recognizer_for(report).prepare_audio(state['filepath'], pcm_path)
+    if pcm_path and os.path.exists(pcm_path):
+        # マップ済みのPCMは削除後も読める（再実行時は元のファイルから変換する）
+        os.remove(pcm_path)
+    if not prepared['success']:
+        return _failed(state, f"音声認識エラー: {prepared['error']}")
+    state['prepared'] = prepared
+    return None
+
+
+def recognize_stage(report: Callable[..., None], state: Dict[str, Any]) -> Any:
+    """音声認識段階: 変換済みの音声を Speech-to-Text で認識（API待ち中心、進捗は認識方法ごとに通知）"""
+    recognizer = _recognizer_for(report)
+    if state.get('operation'):
+        # 再開したジョブ: 開始済みの非同期認識の完了を待つ（音声認識をやり直さない）
+        return _await_operation(recognizer, state)
+
+    logger.info("音声認識を開始...")
+    # 変換済みの音声は認識後に不要になるため state から外す
+    speech_result = recognizer.recognize_prepared(_restore_prepared(state.pop('prepared')))
+    _remove_spilled(state)
+    if speech_result.get('pending_operation'):
+        state['operation'] = speech_result['pending_operation']
+        return _await_operation(recognizer, state)
+    return _recognized(state, speech_result)
+
+
+def _spill_path(state: Dict[str, Any], key: str) -> str:
+    """変換済みの音声データを書き出すファイルのパス（Webとワーカーが共有するアップロード先に置く）"""
+    return f"{state['filepath']}.prepared.{key}"
+
+
+def _restore_prepared(prepared: Dict[str, Any]) -> Dict[str, Any]:
+    """保存した途中経過から再開した場合、書き出した音声データをマップし直す"""
+    for key in PREPARED_DATA_KEYS:
+        path = prepared.pop(f'{key}_path', None)
+        if path is not None:
+            prepared[key] = map_file(path)
+    return prepared
+
+
+def _remove_spilled(state: Dict[str, Any]):
+    """認識が終わった音声データのファイルを削除（マップ済みのデータは削除後も読める）"""
+    for key in PREPARED_DATA_KEYS:
+        path = _spill_path(state, key)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def checkpoint_state(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    途中経過として保存できる（JSONにできる）形の state を作成
+
+    変換済みの音声データ（memoryview）はファイルに書き出し、パスと変換時の情報だけを残す
+
+    Args:
+        state: 段階間で受け渡す辞書（変更しない）
+
+    Returns:
+        保存用の辞書
+    """
+    prepared = state.get('prepared')
+    if not prepared:
+        return state
+    saved = dict(prepared)
+    for key in PREPARED_DATA_KEYS:
+        data = saved.pop(key, None)
+        if data is None:
+            continue
+        path = _spill_path(state, key)
+        with open(path, 'wb') as f:
+            f.write(data)
+        saved[f'{key}_path'] = path
+    return dict(state, prepared=saved)
+
+
+def _await_operation(recognizer, state: Dict[str, Any]) -> StageSuspended:
+    """非同期認識の完了まで段階を中断（待機中はワーカーのスレッドを使わない）"""
+    tracker = get_operation_tracker()
+
+    def subscribe(resume: Callable[[Optional[Dict[str, Any]]], None]):
+        tracker.subscribe(state['operation'], lambda speech_result: resume(_recognized(state, speech_result)),
+                          on_progress=recognizer.report_long_running_progress)
+
+    return StageSuspended(subscribe)
+
+
+def _recognized(state: Dict[str, Any], speech_result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """音声認識結果を state に設定（失敗した場合は処理結果を返す）"""
+    if not speech_result['success']:
+        return _failed(state, f"音声認識エラー: {speech_result['error']}")
+
+    state['transcript'] = speech_result['text']
+    state['word_count'] = speech_result['word_count']
+    logger.info(f"音声認識完了: {speech_result['word_count']}語")
+    return None
+
+
+def summarize_stage(report: Callable[..., None], state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """要約段階: 音声認識結果を要約（生成された行から順に整形し、途中結果として通知）"""
+    report('summarizing', 60, '要約を生成中...')
+    logger.info("テキスト要約を開始...")
+    summarizer = create_text_summarizer(OPENAI_API_KEY)
+    incremental = IncrementalFormatter(create_formatter())
+    updates = [0]
+
+    def on_delta(delta: str):
+        partial_text = incremental.feed(delta)
+        if partial_text is not None:
+            updates[0] += 1
+            report('summarizing', min(84, 60 + updates[0]), '要約を生成中...', partial={'summary': partial_text})
+
+    def on_chunk(done: int, total: int):
+        report('summarizing', 60 + 24 * done // total, f"要約を生成中（{done}/{total}）...")
+
+    # 長い場合は分割して並列に要約
+    summary_result = summarizer.summarize_long_text(state['transcript'], on_delta=on_delta, on_chunk=on_chunk,
+                                                   word_count=state.get('word_count'))
+
+    if not summary_result['success']:
+        return _failed(state, f"要約エラー: {summary_result['error']}")
+
+    state['summary_text'] = summary_result['summary']
+    state['summary_usage'] = summary_result.get('usage')
+    logger.info("テキスト要約完了")
+    return None
+
+
+def format_stage(report: Callable[..., None], state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """整形段階: 要約をフォーマットに従って整形"""
+    report('formatting', 85, 'フォーマットを整形中...')
+    logger.info("フォーマット整形を開始...")
+    format_result = create_formatter().format_summary(state['summary_text'])
+
+    if not format_result['success']:
+        state['formatted_text'] = state['summary_text']  # 整形に失敗した場合は元のテキストを使用
+        logger.warning("フォーマット整形に失敗しました")
+    else:
+        state['formatted_text'] = format_result['formatted_text']
+        logger.info("フォーマット整形完了")
+    return None
+
+
+def persist_stage(report: Callable[..., None], state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """保存段階: 結果をファイルとキャッシュに保存"""
+    report('writing', 95, '結果を保存中...')
+    output_filename = write_output(state['filename'], state['transcript'], state['formatted_text'])
+
+    result = {
+        'success': True,
+        'transcript': state['transcript'],
+        'summary': state['formatted_text'],
+        'output_file': output_filename,
+        'error': None,
+        'summary_usage': state.get('summary_usage')
+    }
+
+    # 同じ音声の再アップロードに備えてキャッシュに保存
+    if state.get('cache_key'):
+        try:
+            cache = create_result_cache()
+            if cache:
+                cache.put(state['cache_key'], result)
+        except Exception as e:
+            logger.warning(f"キャッシュ保存エラー: {e}")
+
+    return result
+
+
+# 音声ファイルの処理段階（JobManager.submit_stages に渡す）
+AUDIO_STAGES = [
+    ('convert', convert_stage),
+    ('recognize', recognize_stage),
+    ('summarize', summarize_stage),
+    ('format', format_stage),
+    ('persist', persist_stage)
+]
+# 音声認識済みのテキスト（ストリーミング認識の結果など）の処理段階
+TRANSCRIPT_STAGES = AUDIO_STAGES[2:]
+# 永続ジョブキューに保存する処理段階の種類
+PIPELINES = {
+    'audio': AUDIO_STAGES,
+    'transcript': TRANSCRIPT_STAGES
+}
+
+
+def audio_state(filepath: str, filename: str, cache_key: Optional[str] = None,
+                pcm_path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    AUDIO_STAGES に渡す初期状態を作成
+
+    Args:
+        filepath: アップロードされた音声ファイルのパス
+        filename: 保存時のファイル名
+        cache_key: 処理結果キャッシュのキー（省略時はキャッシュしない）
+        pcm_path: アップロードの受信中に変換したPCMファイルのパス（ある場合は変換を省略）
+
+    Returns:
+        段階間で受け渡す辞書
+    """
+    return {'filepath': filepath, 'filename': filename, 'cache_key': cache_key, 'pcm_path': pcm_path}
+
+
+def transcript_state(transcript: str, filename: str, cache_key: Optional[str] = None,
+                     word_count: Optional[int] = None) -> Dict[str, Any]:
+    """
+    TRANSCRIPT_STAGES に渡す初期状態を作成
+
+    Args:
+        transcript: 音声認識結果
+        filename: 保存時のファイル名
+        cache_key: 処理結果キャッシュのキー（省略時はキャッシュしない）
+        word_count: 音声認識結果の語数（要約モデルの振り分けに使用）
+
+    Returns:
+        段階間で受け渡す辞書
+    """
+    return {'transcript': transcript, 'filename': filename, 'cache_key': cache_key, 'word_count': word_count}
+
+
+def write_output(filename: str, transcript: str, formatted_text: str) -> str:
+    """
+    要約結果をテキストファイルに保存
+
+    Args:
+        filename: 音声ファイル名
+        transcript: 音声認識結果
+        formatted_text: 整形済みの要約結果
+
+    Returns:
+        出力ファイル名
+    """
+    # ファイル名から拡張子を取得（拡張子がない場合はそのまま使用）
+    if '.' in filename:
+        base_name = filename.rsplit('.', 1)[0]
+    else:
+        base_name = filename
+    output_filename = base_name + '_summary.txt'
+    output_filepath = os.path.join(OUTPUT_FOLDER, output_filename)
+
+    with open(output_filepath, 'w', encoding='utf-8') as f:
+        f.write(f"【音声ファイル】: {filename}\n")
+        f.write(f"【音声認識結果】\n{transcript}\n\n")
+        f.write(f"【要約結果】\n{formatted_text}\n")
+
+    return output_filename
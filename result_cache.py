@@ -0,0 +1,212 @@
+"""
+処理結果キャッシュモジュール
+同じ音声・同じ設定の処理結果をディスク（SQLite）に保存し、再処理を省略
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Iterator
+from configs.speech_config import SPEECH_CONFIG, PCM_SAMPLE_RATE, GCS_UPLOAD_FORMAT
+from configs.speech_config import INLINE_MAX_SECONDS, INLINE_MAX_BYTES, CHUNKED_MAX_SECONDS
+from configs.speech_config import CHUNKED_RECOGNITION_ENABLED, CHUNK_MAX_SECONDS, CHUNK_MIN_SECONDS
+from configs.speech_config import VAD_ENABLED, VAD_MIN_SILENCE_SECONDS, VAD_PADDING_SECONDS, VAD_THRESHOLD_DB
+from text_summarizer import SUMMARY_PROMPT_VERSION, SUMMARY_ROUTES
+from config import (
+    CACHE_FOLDER,
+    SUMMARY_MODEL,
+    RESULT_CACHE_ENABLED,
+    RESULT_CACHE_MAX_BYTES,
+    RESULT_CACHE_MAX_AGE_SECONDS
+)
+
+# ログ設定
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# 音声認識結果に影響する設定（無音除去・認識方法の振り分け・分割認識）
+RECOGNITION_SETTINGS = {
+    'pcm_sample_rate': PCM_SAMPLE_RATE,
+    'inline_max_seconds': INLINE_MAX_SECONDS,
+    'inline_max_bytes': INLINE_MAX_BYTES,
+    'chunked_enabled': CHUNKED_RECOGNITION_ENABLED,
+    'chunked_max_seconds': CHUNKED_MAX_SECONDS,
+    'chunk_max_seconds': CHUNK_MAX_SECONDS,
+    'chunk_min_seconds': CHUNK_MIN_SECONDS,
+    'gcs_upload_format': GCS_UPLOAD_FORMAT,
+    'vad_enabled': VAD_ENABLED,
+    'vad_min_silence_seconds': VAD_MIN_SILENCE_SECONDS,
+    'vad_padding_seconds': VAD_PADDING_SECONDS,
+    'vad_threshold_db': VAD_THRESHOLD_DB
+}
+
+
+class ResultCache:
+    """処理結果キャッシュクラス（gunicornの複数ワーカーで共有可能）"""
+
+    def __init__(self, db_path: Optional[str] = None, max_bytes: int = RESULT_CACHE_MAX_BYTES,
+                 max_age_seconds: int = RESULT_CACHE_MAX_AGE_SECONDS):
+        """
+        初期化
+
+        Args:
+            db_path: キャッシュDBのパス
+            max_bytes: キャッシュ全体の最大サイズ（バイト）
+            max_age_seconds: エントリの最大保持秒数
+        """
+        self.db_path = db_path or os.path.join(CACHE_FOLDER, 'results.sqlite3')
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._initialize_db()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """DB接続を作成（操作ごとに接続し、終了時にコミットして閉じる）"""
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _initialize_db(self):
+        """テーブルを作成"""
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    transcript TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    output_file TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries (last_access)')
+            conn.execute('CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            conn.execute("INSERT OR IGNORE INTO stats (name, value) VALUES ('hits', 0), ('misses', 0), ('evictions', 0)")
+
+    @staticmethod
+    def make_key(audio_hash: str) -> str:
+        """
+        キャッシュキーを作成
+
+        Args:
+            audio_hash: 音声ファイルのSHA-256
+
+        Returns:
+            音声・認識設定（無音除去・振り分けを含む）・プロンプト版・モデル（振り分け設定を含む）から作成したキー
+        """
+        material = json.dumps({
+            'audio': audio_hash,
+            'speech_config': SPEECH_CONFIG,
+            'recognition': RECOGNITION_SETTINGS,
+            'prompt_version': SUMMARY_PROMPT_VERSION,
+            'model': SUMMARY_MODEL,
+            'summary_routes': SUMMARY_ROUTES
+        }, sort_keys=True)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        キャッシュから結果を取得
+
+        Args:
+            key: キャッシュキー
+
+        Returns:
+            処理結果の辞書（存在しない場合None）
+        """
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT transcript, summary, output_file, created_at FROM entries WHERE key = ?', (key,)
+            ).fetchone()
+
+            if row is None or row[3] < now - self.max_age_seconds:
+                conn.execute("UPDATE stats SET value = value + 1 WHERE name = 'misses'")
+                return None
+
+            conn.execute('UPDATE entries SET last_access = ? WHERE key = ?', (now, key))
+            conn.execute("UPDATE stats SET value = value + 1 WHERE name = 'hits'")
+
+        logger.info(f"キャッシュヒット: {key[:12]}")
+        return {
+            'success': True,
+            'transcript': row[0],
+            'summary': row[1],
+            'output_file': row[2],
+            'error': None,
+            'cached': True
+        }
+
+    def put(self, key: str, result: Dict[str, Any]):
+        """
+        処理結果をキャッシュに保存
+
+        Args:
+            key: キャッシュキー
+            result: 処理結果の辞書
+        """
+        now = time.time()
+        size = len(result['transcript'].encode('utf-8')) + len(result['summary'].encode('utf-8'))
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, result['transcript'], result['summary'], result['output_file'], size, now, now)
+            )
+            self._evict(conn, now)
+        logger.info(f"キャッシュに保存しました: {key[:12]}")
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """期限切れのエントリと、サイズ上限を超えた分を古い順に削除"""
+        evicted = conn.execute('DELETE FROM entries WHERE created_at < ?', (now - self.max_age_seconds,)).rowcount
+
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total > self.max_bytes:
+            for key, size in conn.execute('SELECT key, size FROM entries ORDER BY last_access').fetchall():
+                if total <= self.max_bytes:
+                    break
+                conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+                total -= size
+                evicted += 1
+
+        if evicted:
+            conn.execute("UPDATE stats SET value = value + ? WHERE name = 'evictions'", (evicted,))
+            logger.info(f"キャッシュから{evicted}件を削除しました")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        キャッシュの統計情報を取得
+
+        Returns:
+            ヒット数・ミス数・エントリ数などの辞書
+        """
+        with self._connect() as conn:
+            stats = dict(conn.execute('SELECT name, value FROM stats').fetchall())
+            entries, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        lookups = stats.get('hits', 0) + stats.get('misses', 0)
+        stats['entries'] = entries
+        stats['total_bytes'] = total
+        stats['hit_rate'] = stats.get('hits', 0) / lookups if lookups else 0.0
+        return stats
+
+
+def create_result_cache() -> Optional[ResultCache]:
+    """
+    処理結果キャッシュオブジェクトを作成
+
+    Returns:
+        ResultCacheインスタンス（キャッシュ無効時はNone）
+    """
+    if not RESULT_CACHE_ENABLED:
+        return None
+    return ResultCache()
@@ -0,0 +1,356 @@
+"""
+再開可能なアップロードモジュール
+tus 方式（作成 → オフセット付きの PATCH で追記 → HEAD で受信済みの位置を確認）で
+音声ファイルを分割して受け取り、通信が切れた場合は受信済みの位置から続きを受け付ける
+"""
+
+import os
+import time
+import uuid
+import shutil
+import hashlib
+import sqlite3
+import logging
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Iterator, IO
+from werkzeug.exceptions import ClientDisconnected
+from audio_probe import HEADER_BYTES
+from upload_stream import UploadRejectedError, check_audio_header, MAX_AUDIO_BYTES, READ_CHUNK_SIZE
+from configs.speech_config import SUPPORTED_AUDIO_FORMATS, MAX_AUDIO_SIZE_MB
+from config import RESUMABLE_UPLOAD_FOLDER, RESUMABLE_STORE_PATH, RESUMABLE_UPLOAD_TTL_SECONDS
+
+# ログ設定
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# ハッシュ計算時の読み込み単位
+HASH_CHUNK_SIZE = 1024 * 1024
+# 書き込み中のリクエストが応答しない場合に、他のリクエストが書き込めるようになるまでの秒数
+WRITE_CLAIM_SECONDS = 60
+
+
+class ResumableUploadStore:
+    """受信途中のアップロードを保存するクラス（受信済みの位置はSQLite、データはファイル）"""
+
+    def __init__(self, db_path: Optional[str] = None, folder: Optional[str] = None,
+                 ttl_seconds: int = RESUMABLE_UPLOAD_TTL_SECONDS):
+        """
+        初期化
+
+        Args:
+            db_path: アップロードの状態を保存するDBのパス
+            folder: 受信途中のファイルの保存先
+            ttl_seconds: 更新がないままこの秒数を過ぎたアップロードは破棄する
+        """
+        self.db_path = db_path or RESUMABLE_STORE_PATH
+        self.folder = folder or RESUMABLE_UPLOAD_FOLDER
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        os.makedirs(self.folder, exist_ok=True)
+        self._initialize_db()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """DB接続を作成（操作ごとに接続し、終了時にコミットして閉じる）"""
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _initialize_db(self):
+        """テーブルを作成"""
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS uploads (
+                    upload_id TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    length INTEGER NOT NULL,
+                    offset INTEGER NOT NULL DEFAULT 0,
+                    checked INTEGER NOT NULL DEFAULT 0,
+                    writer TEXT,
+                    writer_expires_at REAL,
+                    completed INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_uploads_updated_at ON uploads (updated_at)')
+            # 以前のバージョンで作成したテーブルに列を追加
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(uploads)')}
+            for column, definition in (('writer', 'TEXT'), ('writer_expires_at', 'REAL'),
+                                       ('completed', 'INTEGER NOT NULL DEFAULT 0')):
+                if column not in columns:
+                    conn.execute(f'ALTER TABLE uploads ADD COLUMN {column} {definition}')
+
+    def _part_path(self, upload_id: str) -> str:
+        """受信途中のファイルのパス"""
+        return os.path.join(self.folder, upload_id)
+
+    def _session(self, row: sqlite3.Row) -> Dict[str, Any]:
+        """DBの行をアップロードの状態の辞書に変換"""
+        return {
+            'upload_id': row['upload_id'],
+            'filename': row['filename'],
+            'length': row['length'],
+            'offset': row['offset'],
+            'expires_at': row['updated_at'] + self.ttl_seconds
+        }
+
+    def create(self, filename: str, length: int) -> Dict[str, Any]:
+        """
+        アップロードを作成
+
+        Args:
+            filename: 元のファイル名
+            length: ファイル全体のバイト数
+
+        Returns:
+            アップロードの状態の辞書
+
+        Raises:
+            UploadRejectedError: 対応外の形式、または大きすぎる場合
+        """
+        self.purge_expired()
+        extension = os.path.splitext(filename)[1].lower().lstrip('.')
+        if extension not in SUPPORTED_AUDIO_FORMATS:
+            raise UploadRejectedError(f"サポートされていないファイル形式です（対応形式: {', '.join(SUPPORTED_AUDIO_FORMATS)}）")
+        if length <= 0:
+            raise UploadRejectedError("ファイルサイズが指定されていません", 400)
+        if length > MAX_AUDIO_BYTES:
+            raise UploadRejectedError(f"ファイルサイズが大きすぎます（最大{MAX_AUDIO_SIZE_MB}MB）", 413)
+
+        upload_id = uuid.uuid4().hex
+        now = time.time()
+        open(self._part_path(upload_id), 'wb').close()
+        with self._connect() as conn:
+            conn.execute('INSERT INTO uploads (upload_id, filename, length, created_at, updated_at) '
+                         'VALUES (?, ?, ?, ?, ?)', (upload_id, filename, length, now, now))
+        logger.info(f"再開可能なアップロードを作成しました: {upload_id} ({filename}, {length / (1024 * 1024):.2f}MB)")
+        return {'upload_id': upload_id, 'filename': filename, 'length': length, 'offset': 0,
+                'expires_at': now + self.ttl_seconds}
+
+    def get(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        """
+        アップロードの状態を取得
+
+        Args:
+            upload_id: アップロードID
+
+        Returns:
+            アップロードの状態の辞書（存在しない・期限切れの場合None）
+        """
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM uploads WHERE upload_id = ? AND updated_at >= ? AND completed = 0',
+                               (upload_id, time.time() - self.ttl_seconds)).fetchone()
+        return self._session(row) if row else None
+
+    def _claim_write(self, upload_id: str, offset: int) -> Optional[str]:
+        """
+        指定の位置への書き込みを1つのリクエストだけに許可（位置の確認と書き込みの間に他が割り込まない）
+
+        Returns:
+            書き込みの権利を表すID（位置が一致しない・他のリクエストが書き込み中の場合None）
+        """
+        writer = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            claimed = conn.execute(
+                'UPDATE uploads SET writer = ?, writer_expires_at = ? '
+                'WHERE upload_id = ? AND offset = ? AND completed = 0 '
+                'AND (writer IS NULL OR writer_expires_at < ?)',
+                (writer, now + WRITE_CLAIM_SECONDS, upload_id, offset, now)
+            ).rowcount
+        return writer if claimed else None
+
+    def _renew_write(self, upload_id: str, writer: str):
+        """書き込みの権利を延長（時間のかかる受信で他のリクエストに奪われないように）"""
+        with self._connect() as conn:
+            conn.execute('UPDATE uploads SET writer_expires_at = ? WHERE upload_id = ? AND writer = ?',
+                         (time.time() + WRITE_CLAIM_SECONDS, upload_id, writer))
+
+    def _release_write(self, upload_id: str, writer: str, new_offset: Optional[int] = None) -> bool:
+        """
+        書き込みの権利を解放（new_offset を指定した場合は受信済みの位置も進める）
+
+        Returns:
+            権利を持ったまま解放できた場合True（期限切れで他のリクエストに奪われていた場合False）
+        """
+        with self._connect() as conn:
+            if new_offset is None:
+                updated = conn.execute(
+                    'UPDATE uploads SET writer = NULL, writer_expires_at = NULL WHERE upload_id = ? AND writer = ?',
+                    (upload_id, writer)).rowcount
+            else:
+                updated = conn.execute(
+                    'UPDATE uploads SET offset = ?, updated_at = ?, writer = NULL, writer_expires_at = NULL '
+                    'WHERE upload_id = ? AND writer = ?', (new_offset, time.time(), upload_id, writer)).rowcount
+        return updated > 0
+
+    def append(self, upload_id: str, offset: int, stream: IO[bytes]) -> Dict[str, Any]:
+        """
+        受信したデータを指定の位置に追記（通信が途中で切れた場合も受信できた分は保存する）
+
+        Args:
+            upload_id: アップロードID
+            offset: クライアントが送るデータの開始位置
+            stream: リクエスト本文のストリーム
+
+        Returns:
+            追記後のアップロードの状態の辞書
+
+        Raises:
+            UploadRejectedError: 存在しない（404）、位置が一致しない（409）、
+                                 サイズを超える（413）、または対応外の音声の場合
+        """
+        session = self.get(upload_id)
+        if session is None:
+            raise UploadRejectedError("アップロードが見つかりません（期限切れの可能性があります）", 404)
+        if offset != session['offset']:
+            raise UploadRejectedError(f"送信位置が一致しません（受信済み: {session['offset']}バイト）", 409)
+        # 同じ位置への送信が同時に届いた場合、書き込めるのは権利を得た1つだけ
+        writer = self._claim_write(upload_id, offset)
+        if writer is None:
+            raise UploadRejectedError("同じアップロードへの送信が処理中です", 409)
+
+        written = 0
+        remaining = session['length'] - offset
+        renewed_at = time.monotonic()
+        try:
+            with open(self._part_path(upload_id), 'r+b') as f:
+                f.seek(offset)
+                try:
+                    while True:
+                        chunk = stream.read(READ_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        if written + len(chunk) > remaining:
+                            raise UploadRejectedError("ファイルサイズを超えるデータが送られました", 413)
+                        f.write(chunk)
+                        written += len(chunk)
+                        if time.monotonic() - renewed_at > WRITE_CLAIM_SECONDS / 3:
+                            self._renew_write(upload_id, writer)
+                            renewed_at = time.monotonic()
+                except ClientDisconnected:
+                    logger.info(f"アップロードの途中で切断されました: {upload_id} (+{written}バイト)")
+                # 受信済みの位置は、データがディスクに書かれてから進める
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException:
+            self._release_write(upload_id, writer)
+            raise
+
+        if not self._release_write(upload_id, writer, offset + written):
+            raise UploadRejectedError("書き込みの期限が切れたため、受信済みの位置から送り直してください", 409)
+        session['offset'] = offset + written
+        session['expires_at'] = time.time() + self.ttl_seconds
+        self._check_header(session)
+        return session
+
+    def _check_header(self, session: Dict[str, Any]):
+        """先頭のヘッダーが届いた時点で形式・長さを確認し、対応外の音声はその場で破棄"""
+        if session['offset'] < min(HEADER_BYTES, session['length']):
+            return
+        with self._connect() as conn:
+            row = conn.execute('SELECT checked FROM uploads WHERE upload_id = ?', (session['upload_id'],)).fetchone()
+        if row is None or row['checked']:
+            return
+
+        with open(self._part_path(session['upload_id']), 'rb') as f:
+            header = f.read(HEADER_BYTES)
+        try:
+            check_audio_header(header, session['filename'], session['length'])
+        except UploadRejectedError:
+            self.delete(session['upload_id'])
+            raise
+        with self._connect() as conn:
+            conn.execute('UPDATE uploads SET checked = 1 WHERE upload_id = ?', (session['upload_id'],))
+
+    def complete(self, upload_id: str, filepath: str) -> str:
+        """
+        受信が終わったファイルを保存先に移動し、アップロードを削除
+
+        Args:
+            upload_id: アップロードID
+            filepath: 保存先のパス
+
+        Returns:
+            ファイル内容のSHA-256（16進数）
+
+        Raises:
+            UploadRejectedError: 最後まで受信していない、または他のリクエストが完了させた場合（409）
+        """
+        # 最後の送信が同時に届いた場合、ファイルを移動するのは1つだけ
+        with self._connect() as conn:
+            claimed = conn.execute(
+                'UPDATE uploads SET completed = 1 WHERE upload_id = ? AND completed = 0 '
+                'AND offset = length AND writer IS NULL', (upload_id,)
+            ).rowcount
+        if not claimed:
+            raise UploadRejectedError("アップロードは既に完了しているか、受信が終わっていません", 409)
+
+        part_path = self._part_path(upload_id)
+        hasher = hashlib.sha256()
+        try:
+            with open(part_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                    hasher.update(chunk)
+            shutil.move(part_path, filepath)
+        except Exception:
+            # 移動できなかった場合は再度完了させられるように戻す
+            with self._connect() as conn:
+                conn.execute('UPDATE uploads SET completed = 0 WHERE upload_id = ?', (upload_id,))
+            raise
+        with self._connect() as conn:
+            conn.execute('DELETE FROM uploads WHERE upload_id = ?', (upload_id,))
+        logger.info(f"再開可能なアップロードが完了しました: {upload_id} -> {os.path.basename(filepath)}")
+        return hasher.hexdigest()
+
+    def delete(self, upload_id: str):
+        """アップロードと受信途中のファイルを削除"""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM uploads WHERE upload_id = ?', (upload_id,))
+        part_path = self._part_path(upload_id)
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+    def purge_expired(self) -> int:
+        """
+        更新がないまま期限を過ぎたアップロードを削除
+
+        Returns:
+            削除した数
+        """
+        with self._connect() as conn:
+            expired = [row['upload_id'] for row in conn.execute(
+                'SELECT upload_id FROM uploads WHERE updated_at < ?', (time.time() - self.ttl_seconds,))]
+        for upload_id in expired:
+            self.delete(upload_id)
+        if expired:
+            logger.info(f"期限切れの再開可能なアップロードを{len(expired)}件削除しました")
+        return len(expired)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        受信途中のアップロードの統計情報を取得
+
+        Returns:
+            件数と受信済み・全体のバイト数の辞書
+        """
+        with self._connect() as conn:
+            row = conn.execute('SELECT COUNT(*) AS count, COALESCE(SUM(offset), 0) AS received, '
+                               'COALESCE(SUM(length), 0) AS total FROM uploads').fetchone()
+        return {'uploads': row['count'], 'received_bytes': row['received'], 'total_bytes': row['total']}
+
+
+def create_resumable_upload_store() -> ResumableUploadStore:
+    """
+    再開可能なアップロードの保存オブジェクトを作成
+
+    Returns:
+        ResumableUploadStoreインスタンス
+    """
+    return ResumableUploadStore()
@@ -0,0 +1,307 @@
+"""
+ストリーミング音声認識モジュール
+ブラウザの MediaRecorder から届く Opus チャンクを録音中に Speech-to-Text へ送り、
+途中結果と確定結果を保持する
+"""
+
+import time
+import uuid
+import queue
+import logging
+import threading
+from typing import Optional, Dict, Any, Iterator
+from google.cloud import speech
+from google.cloud.speech import RecognitionConfig, StreamingRecognitionConfig, StreamingRecognizeRequest
+from configs.speech_config import SPEECH_CONFIG
+from audio_probe import sniff_audio_header
+from client_registry import get_speech_client
+from admission import stt_limiter
+from config import (
+    GOOGLE_APPLICATION_CREDENTIALS,
+    STREAM_MAX_SESSIONS,
+    STREAM_IDLE_TIMEOUT_SECONDS,
+    STREAM_FINAL_TIMEOUT_SECONDS,
+    STREAM_RESTART_SECONDS
+)
+
+# ログ設定
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 認識を開き直す位置の目印（WebMのCluster、OggのPageの先頭）
+RESTART_MARKERS = {'WEBM_OPUS': b'\x1f\x43\xb6\x75', 'OGG_OPUS': b'OggS'}
+
+
+def _container_header(encoding: str, chunk: bytes) -> Optional[bytes]:
+    """
+    最初のチャンクから音声データより前のヘッダー部分を取り出す（開き直した認識の先頭に送る）
+
+    Args:
+        encoding: WEBM_OPUS または OGG_OPUS
+        chunk: 最初に届いたチャンク
+
+    Returns:
+        ヘッダーのバイト列（見つからない場合None）
+    """
+    marker = RESTART_MARKERS[encoding]
+    if encoding == 'WEBM_OPUS':
+        # EBMLヘッダー・Segment・Tracks の後、最初の Cluster の前まで
+        position = chunk.find(marker)
+        return chunk[:position] if position > 0 else None
+    # OpusHead と OpusTags の2ページの後、3ページ目の前まで
+    position = -1
+    for _ in range(3):
+        position = chunk.find(marker, position + 1)
+        if position < 0:
+            return None
+    return chunk[:position]
+
+
+class StreamingSessionLimitError(Exception):
+    """同時に実行できるセッション数を超えた場合の例外"""
+
+
+class StreamingSession:
+    """1回の録音に対応するストリーミング認識セッション"""
+
+    def __init__(self, client: speech.SpeechClient, idle_timeout_seconds: float = STREAM_IDLE_TIMEOUT_SECONDS,
+                 restart_seconds: float = STREAM_RESTART_SECONDS):
+        """
+        初期化
+
+        Args:
+            client: 使用するSpeechClient
+            idle_timeout_seconds: チャンクが届かない場合に認識を終了するまでの秒数
+            restart_seconds: 認識を開き直すまでの秒数（Speech APIのストリーミングは約5分まで）
+        """
+        self.session_id = uuid.uuid4().hex
+        self.client = client
+        self.idle_timeout_seconds = idle_timeout_seconds
+        self.restart_seconds = restart_seconds
+        self.finals = []
+        self.interim = ''
+        self.error = None
+        self.received_bytes = 0
+        self.updated_at = time.time()
+        self._audio = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._done = threading.Event()
+        self._encoding = None
+        self._header = None
+        self._carry = None
+        self._finished = False
+
+    def add_chunk(self, chunk: bytes):
+        """
+        録音チャンクを追加（最初のチャンクのヘッダーから形式を判定して認識を開始）
+
+        Args:
+            chunk: MediaRecorder が出力したチャンク
+        """
+        if self._done.is_set():
+            raise RuntimeError(self.error or "セッションは終了しています")
+
+        if self._thread is None:
+            audio_format = sniff_audio_header(chunk)
+            if not audio_format or audio_format['encoding'] not in ('WEBM_OPUS', 'OGG_OPUS'):
+                raise ValueError("ストリーミング認識はWebM/OggのOpus音声のみ対応しています")
+            self._start(audio_format['encoding'], audio_format['sample_rate_hertz'], audio_format['channels'] or 1)
+            self._header = _container_header(audio_format['encoding'], chunk)
+
+        self.received_bytes += len(chunk)
+        self.updated_at = time.time()
+        self._audio.put(chunk)
+
+    def _start(self, encoding: str, sample_rate: int, channels: int):
+        """認識スレッドを開始（録音中は音声認識の同時実行数を1つ使う）"""
+        if not stt_limiter.try_acquire():
+            raise StreamingSessionLimitError("音声認識の同時実行数が上限に達しています")
+        self._encoding = encoding
+        config_dict = dict(SPEECH_CONFIG)
+        config_dict['encoding'] = encoding
+        config_dict['sample_rate_hertz'] = sample_rate
+        config_dict['audio_channel_count'] = channels
+        self._streaming_config = StreamingRecognitionConfig(
+            config=RecognitionConfig(**config_dict),
+            interim_results=True
+        )
+        self._thread = threading.Thread(target=self._run, name=f"stream-{self.session_id[:8]}", daemon=True)
+        self._thread.start()
+        logger.info(f"ストリーミング認識を開始しました: {self.session_id} ({encoding}, {sample_rate}Hz)")
+
+    def _requests(self, header: Optional[bytes], restart_at: float) -> Iterator[StreamingRecognizeRequest]:
+        """
+        キューに届いたチャンクをリクエストとして送る
+
+        Noneが届いた場合・チャンクが届かないまま idle_timeout_seconds を過ぎた場合は録音を終了する。
+        restart_at を過ぎた後は、次の目印（Cluster・Page）の手前で送るのをやめて認識を開き直す
+        """
+        if header is not None:
+            yield StreamingRecognizeRequest(audio_content=header)
+        while True:
+            if self._carry is not None:
+                chunk, self._carry = self._carry, None
+            else:
+                try:
+                    chunk = self._audio.get(timeout=self.idle_timeout_seconds)
+                except queue.Empty:
+                    self.error = f"{self.idle_timeout_seconds:.0f}秒間録音チャンクが届かないため、ストリーミング認識を終了しました"
+                    logger.info(f"{self.error}: {self.session_id}")
+                    self._finished = True
+                    return
+            if chunk is None:
+                self._finished = True
+                return
+            if time.monotonic() >= restart_at:
+                if self._header is None:
+                    # ヘッダーを取り出せない形式は開き直せないため、上限の前に終了する
+                    self.error = "ストリーミング認識の上限（約5分）に達したため終了しました"
+                    logger.info(f"{self.error}: {self.session_id}")
+                    self._finished = True
+                    return
+                position = chunk.find(RESTART_MARKERS[self._encoding])
+                if position >= 0:
+                    if position:
+                        yield StreamingRecognizeRequest(audio_content=chunk[:position])
+                    self._carry = chunk[position:]
+                    return
+            yield StreamingRecognizeRequest(audio_content=chunk)
+
+    def _run(self):
+        """認識結果を受け取り、途中結果と確定結果を更新（上限の前に認識を開き直して続ける）"""
+        header = None
+        try:
+            while True:
+                requests = self._requests(header, time.monotonic() + self.restart_seconds)
+                responses = self.client.streaming_recognize(config=self._streaming_config, requests=requests)
+                for response in responses:
+                    for res in response.results:
+                        if not res.alternatives:
+                            continue
+                        with self._lock:
+                            if res.is_final:
+                                self.finals.append(res.alternatives[0].transcript)
+                                self.interim = ''
+                            else:
+                                self.interim = res.alternatives[0].transcript
+                    self.updated_at = time.time()
+                if self._finished:
+                    break
+                header = self._header
+                logger.info(f"ストリーミング認識の上限の前に認識を開き直します: {self.session_id}")
+        except Exception as e:
+            self.error = f"ストリーミング認識エラー: {e}"
+            logger.error(self.error)
+        finally:
+            stt_limiter.release()
+            self._done.set()
+
+    def stop(self, timeout: float = STREAM_FINAL_TIMEOUT_SECONDS) -> Dict[str, Any]:
+        """
+        録音終了を通知し、確定結果を待つ
+
+        Args:
+            timeout: 確定結果を待つ最大秒数
+
+        Returns:
+            最終的な状態の辞書
+        """
+        self._audio.put(None)
+        if self._thread is not None:
+            self._done.wait(timeout)
+        else:
+            self._done.set()
+        return self.get_state()
+
+    def get_state(self) -> Dict[str, Any]:
+        """
+        現在の認識結果を取得
+
+        Returns:
+            確定済みテキスト・途中結果・エラーなどの辞書
+        """
+        with self._lock:
+            return {
+                'session_id': self.session_id,
+                'transcript': ''.join(self.finals),
+                'interim': self.interim,
+                'finished': self._done.is_set(),
+                'received_bytes': self.received_bytes,
+                'error': self.error
+            }
+
+
+class StreamingSessionManager:
+    """ストリーミング認識セッションの管理クラス"""
+
+    def __init__(self, max_sessions: int = STREAM_MAX_SESSIONS,
+                 idle_timeout_seconds: float = STREAM_IDLE_TIMEOUT_SECONDS):
+        """
+        初期化
+
+        Args:
+            max_sessions: 同時に実行できるセッション数
+            idle_timeout_seconds: チャンクが届かないセッションを破棄するまでの秒数
+        """
+        self.max_sessions = max_sessions
+        self.idle_timeout_seconds = idle_timeout_seconds
+        self.sessions: Dict[str, StreamingSession] = {}
+        self._lock = threading.Lock()
+
+    def create_session(self, client: Optional[speech.SpeechClient] = None) -> StreamingSession:
+        """
+        セッションを作成
+
+        Args:
+            client: 使用するSpeechClient（省略時はプロセス共有のクライアント）
+
+        Returns:
+            StreamingSessionインスタンス
+        """
+        self._purge_idle()
+        with self._lock:
+            if len(self.sessions) >= self.max_sessions:
+                raise StreamingSessionLimitError("同時に実行できるストリーミング認識の数が上限に達しています")
+            session = StreamingSession(client or get_speech_client(GOOGLE_APPLICATION_CREDENTIALS),
+                                       self.idle_timeout_seconds)
+            self.sessions[session.session_id] = session
+        return session
+
+    def get_session(self, session_id: str) -> Optional[StreamingSession]:
+        """
+        セッションを取得
+
+        Args:
+            session_id: セッションID
+
+        Returns:
+            StreamingSessionインスタンス（存在しない場合None）
+        """
+        with self._lock:
+            return self.sessions.get(session_id)
+
+    def remove_session(self, session_id: str):
+        """セッションを削除"""
+        with self._lock:
+            self.sessions.pop(session_id, None)
+
+    def _purge_idle(self):
+        """一定時間チャンクが届いていないセッションを終了して削除"""
+        threshold = time.time() - self.idle_timeout_seconds
+        with self._lock:
+            idle = [sid for sid, session in self.sessions.items() if session.updated_at < threshold]
+            for sid in idle:
+                self.sessions.pop(sid).stop(timeout=0)
+        if idle:
+            logger.info(f"放置されたストリーミング認識セッションを{len(idle)}件削除しました")
+
+
+def create_streaming_session_manager() -> StreamingSessionManager:
+    """
+    ストリーミング認識セッション管理オブジェクトを作成
+
+    Returns:
+        StreamingSessionManagerインスタンス
+    """
+    return StreamingSessionManager()
@@ -0,0 +1,125 @@
+"""
+外部API呼び出しの再試行・ヘッジングのテスト（pytest）
+"""
+
+import time
+import threading
+import pytest
+from call_policy import call_with_retries, hedged_call, DeadlineExceededError
+
+
+class TransientError(Exception):
+    """再試行できるエラー"""
+
+
+def _flaky(failures: int, value='ok'):
+    """最初の failures 回だけ失敗する関数と呼び出し回数"""
+    calls = []
+
+    def func(timeout):
+        calls.append(timeout)
+        if len(calls) <= failures:
+            raise TransientError(f"失敗{len(calls)}")
+        return value
+
+    return func, calls
+
+
+def test_call_with_retries_retries_transient_errors():
+    func, calls = _flaky(2)
+    result = call_with_retries(func, time.monotonic() + 5, 3, lambda e: isinstance(e, TransientError),
+                               base_seconds=0.01, max_seconds=0.01)
+    assert result == 'ok'
+    assert len(calls) == 3
+
+
+def test_call_with_retries_stops_at_max_attempts():
+    func, calls = _flaky(5)
+    with pytest.raises(TransientError):
+        call_with_retries(func, time.monotonic() + 5, 2, lambda e: True, base_seconds=0.01, max_seconds=0.01)
+    assert len(calls) == 2
+
+
+def test_call_with_retries_does_not_retry_other_errors():
+    func, calls = _flaky(1)
+    with pytest.raises(TransientError):
+        call_with_retries(func, time.monotonic() + 5, 3, lambda e: False)
+    assert len(calls) == 1
+
+
+def test_call_with_retries_gives_up_when_retry_after_exceeds_deadline():
+    func, calls = _flaky(1)
+    with pytest.raises(TransientError):
+        call_with_retries(func, time.monotonic() + 0.5, 3, lambda e: True, retry_after=lambda e: 10.0)
+    assert len(calls) == 1
+
+
+def test_call_with_retries_raises_after_deadline():
+    with pytest.raises(DeadlineExceededError):
+        call_with_retries(lambda timeout: 'ok', time.monotonic() - 1, 3, lambda e: True)
+
+
+def test_hedged_call_returns_first_result_without_hedging():
+    calls = []
+
+    def func(timeout):
+        calls.append(timeout)
+        return 'first'
+
+    assert hedged_call(func, time.monotonic() + 5, 0.5) == 'first'
+    assert len(calls) == 1
+
+
+def test_hedged_call_uses_faster_hedge_and_discards_loser():
+    calls = []
+    release_slow = threading.Event()
+    discarded = []
+    released = []
+
+    def func(timeout):
+        index = len(calls)
+        calls.append(index)
+        if index == 0:
+            release_slow.wait(5)
+            return 'slow'
+        return 'fast'
+
+    result = hedged_call(func, time.monotonic() + 5, 0.05, discard=discarded.append,
+                         acquire_hedge=lambda: lambda: released.append(True))
+    assert result == 'fast'
+    assert released == [True]
+    release_slow.set()
+    for _ in range(100):
+        if discarded:
+            break
+        time.sleep(0.01)
+    assert discarded == ['slow']
+
+
+def test_hedged_call_skips_hedge_without_capacity():
+    calls = []
+
+    def func(timeout):
+        calls.append(timeout)
+        time.sleep(0.2)
+        return 'only'
+
+    assert hedged_call(func, time.monotonic() + 5, 0.05, acquire_hedge=lambda: None) == 'only'
+    assert len(calls) == 1
+
+
+def test_hedged_call_raises_when_all_calls_fail():
+    def func(timeout):
+        raise TransientError('失敗')
+
+    with pytest.raises(TransientError):
+        hedged_call(func, time.monotonic() + 5, 0.05)
+
+
+def test_hedged_call_raises_after_deadline():
+    def func(timeout):
+        time.sleep(1)
+        return 'late'
+
+    with pytest.raises(DeadlineExceededError):
+        hedged_call(func, time.monotonic() + 0.1, None)
@@ -0,0 +1,88 @@
+"""
+永続ジョブキューのテスト（pytest）
+"""
+
+import time
+import pytest
+from job_store import JobStore, LeaseLostError
+from job_manager import JobQueueFullError
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / 'jobs.sqlite3'), max_pending=10, lease_seconds=0.2, max_attempts=2)
+
+
+def test_claim_returns_queued_job_once(store):
+    job_id = store.enqueue('audio', {'filepath': 'a.wav'})
+    job = store.claim('worker-1')
+    assert job == {'job_id': job_id, 'pipeline': 'audio', 'state': {'filepath': 'a.wav'}, 'next_stage': 0}
+    assert store.claim('worker-2') is None
+    assert store.get_job(job_id)['status'] == 'running'
+
+
+def test_enqueue_rejects_when_full(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'), max_pending=1)
+    store.enqueue('audio', {})
+    with pytest.raises(JobQueueFullError):
+        store.enqueue('audio', {})
+
+
+def test_expired_lease_is_taken_over_from_checkpoint(store):
+    job_id = store.enqueue('audio', {'filepath': 'a.wav'})
+    store.claim('worker-1')
+    store.checkpoint(job_id, 'worker-1', 2, {'filepath': 'a.wav', 'transcript': 'テキスト'})
+    time.sleep(0.3)
+
+    job = store.claim('worker-2')
+    assert job['job_id'] == job_id
+    assert job['next_stage'] == 2
+    assert job['state']['transcript'] == 'テキスト'
+    # 引き継がれた後、元のワーカーは更新できない
+    with pytest.raises(LeaseLostError):
+        store.renew_lease(job_id, 'worker-1')
+    with pytest.raises(LeaseLostError):
+        store.finish(job_id, 'worker-1', {'success': True})
+
+
+def test_renewed_lease_is_not_taken_over(store):
+    job_id = store.enqueue('audio', {})
+    store.claim('worker-1')
+    for _ in range(3):
+        time.sleep(0.1)
+        store.renew_lease(job_id, 'worker-1')
+    assert store.claim('worker-2') is None
+
+
+def test_released_lease_is_taken_over_immediately(store):
+    job_id = store.enqueue('audio', {})
+    store.claim('worker-1')
+    store.release_lease(job_id, 'worker-1')
+    assert store.claim('worker-2')['job_id'] == job_id
+
+
+def test_job_fails_after_max_attempts(store):
+    job_id = store.enqueue('audio', {})
+    store.claim('worker-1')
+    time.sleep(0.3)
+    store.claim('worker-2')
+    time.sleep(0.3)
+    assert store.claim('worker-3') is None
+    assert store.get_job(job_id)['status'] == 'failed'
+
+
+def test_checkpoint_skips_state_that_is_not_json(store):
+    job_id = store.enqueue('audio', {'filepath': 'a.wav'})
+    store.claim('worker-1')
+    assert not store.checkpoint(job_id, 'worker-1', 1, {'pcm': memoryview(b'\0\0')})
+    assert store.checkpoint(job_id, 'worker-1', 1, {'pcm_path': 'a.wav.prepared.pcm'})
+
+
+def test_finish_records_result(store):
+    job_id = store.enqueue('audio', {})
+    store.claim('worker-1')
+    store.finish(job_id, 'worker-1', {'success': True, 'summary': '要約'})
+    job = store.get_job(job_id)
+    assert job['status'] == 'completed'
+    assert job['result']['summary'] == '要約'
+    assert store.get_stats()['completed'] == 1
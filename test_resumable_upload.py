@@ -0,0 +1,145 @@
+"""
+再開可能なアップロードのテスト（pytest）
+"""
+
+import io
+import time
+import struct
+import hashlib
+import threading
+import pytest
+from werkzeug.exceptions import ClientDisconnected
+from resumable_upload import ResumableUploadStore
+from upload_stream import UploadRejectedError
+
+
+def _wav(seconds: float = 1.0, sample_rate: int = 16000) -> bytes:
+    """16bit・モノラルの無音のWAV"""
+    pcm = b'\0\0' * int(seconds * sample_rate)
+    return (b'RIFF' + struct.pack('<I', 36 + len(pcm)) + b'WAVE'
+            + b'fmt ' + struct.pack('<IHHIIHH', 16, 1, 1, sample_rate, sample_rate * 2, 2, 16)
+            + b'data' + struct.pack('<I', len(pcm)) + pcm)
+
+
+class SlowStream(io.BytesIO):
+    """少しずつ届くリクエスト本文"""
+
+    def read(self, size=-1):
+        time.sleep(0.02)
+        return super().read(4096)
+
+
+class DisconnectingStream(io.BytesIO):
+    """limit バイト送ったところで切断されるリクエスト本文"""
+
+    def __init__(self, data: bytes, limit: int):
+        super().__init__(data[:limit])
+
+    def read(self, size=-1):
+        data = super().read(size)
+        if not data:
+            raise ClientDisconnected()
+        return data
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ResumableUploadStore(str(tmp_path / 'uploads.sqlite3'), str(tmp_path / 'parts'))
+
+
+def test_append_in_parts_and_complete(store, tmp_path):
+    data = _wav()
+    session = store.create('audio.wav', len(data))
+    upload_id = session['upload_id']
+
+    assert store.append(upload_id, 0, io.BytesIO(data[:10000]))['offset'] == 10000
+    assert store.append(upload_id, 10000, io.BytesIO(data[10000:]))['offset'] == len(data)
+
+    filepath = str(tmp_path / 'audio.wav')
+    assert store.complete(upload_id, filepath) == hashlib.sha256(data).hexdigest()
+    with open(filepath, 'rb') as f:
+        assert f.read() == data
+    assert store.get(upload_id) is None
+
+
+def test_append_resumes_after_disconnect(store):
+    data = _wav()
+    upload_id = store.create('audio.wav', len(data))['upload_id']
+    assert store.append(upload_id, 0, DisconnectingStream(data, 5000))['offset'] == 5000
+    assert store.get(upload_id)['offset'] == 5000
+    assert store.append(upload_id, 5000, io.BytesIO(data[5000:]))['offset'] == len(data)
+
+
+def test_append_rejects_wrong_offset(store):
+    data = _wav()
+    upload_id = store.create('audio.wav', len(data))['upload_id']
+    with pytest.raises(UploadRejectedError) as e:
+        store.append(upload_id, 100, io.BytesIO(data))
+    assert e.value.status_code == 409
+
+
+def test_append_rejects_data_beyond_length(store):
+    data = _wav()
+    upload_id = store.create('audio.wav', len(data))['upload_id']
+    with pytest.raises(UploadRejectedError) as e:
+        store.append(upload_id, 0, io.BytesIO(data + b'extra'))
+    assert e.value.status_code == 413
+    # 書き込みの権利は解放され、送り直せる
+    assert store.append(upload_id, 0, io.BytesIO(data))['offset'] == len(data)
+
+
+def test_concurrent_append_at_same_offset_has_one_writer(store):
+    data = _wav(2.0)
+    upload_id = store.create('audio.wav', len(data))['upload_id']
+    results = []
+
+    def send():
+        try:
+            results.append(store.append(upload_id, 0, SlowStream(data))['offset'])
+        except UploadRejectedError as e:
+            results.append(e.status_code)
+
+    threads = [threading.Thread(target=send) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results) == [409, len(data)]
+    assert store.get(upload_id)['offset'] == len(data)
+
+
+def test_concurrent_complete_moves_file_once(store, tmp_path):
+    data = _wav()
+    upload_id = store.create('audio.wav', len(data))['upload_id']
+    store.append(upload_id, 0, io.BytesIO(data))
+    results = []
+
+    def complete(index):
+        try:
+            results.append(store.complete(upload_id, str(tmp_path / f'audio_{index}.wav')))
+        except UploadRejectedError as e:
+            results.append(e.status_code)
+
+    threads = [threading.Thread(target=complete, args=(index,)) for index in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results, key=str) == sorted([409, hashlib.sha256(data).hexdigest()], key=str)
+
+
+def test_complete_rejects_incomplete_upload(store, tmp_path):
+    data = _wav()
+    upload_id = store.create('audio.wav', len(data))['upload_id']
+    store.append(upload_id, 0, io.BytesIO(data[:1000]))
+    with pytest.raises(UploadRejectedError) as e:
+        store.complete(upload_id, str(tmp_path / 'audio.wav'))
+    assert e.value.status_code == 409
+    assert store.get(upload_id)['offset'] == 1000
+
+
+def test_create_rejects_unsupported_format(store):
+    with pytest.raises(UploadRejectedError):
+        store.create('notes.txt', 100)
@@ -0,0 +1,73 @@
+"""
+テキスト分割モジュール
+長い音声認識結果を、トークン数の上限を超えないように文の区切りで分割
+"""
+
+import re
+import logging
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+# 文の区切り（句点・感嘆符・疑問符・改行、音声認識結果の区間の区切りとなる空白）
+SENTENCE_BOUNDARY = re.compile(r'(?<=[。．！？!?\n])|(?<=[^\x00-\x7f] )(?=[^\x00-\x7f])')
+# ASCII文字（英数字・記号）はおよそ4文字で1トークン
+ASCII_CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    トークン数を概算（日本語は1文字≒1トークン、ASCIIは約4文字で1トークン）
+
+    Args:
+        text: テキスト
+
+    Returns:
+        推定トークン数
+    """
+    ascii_chars = sum(1 for ch in text if ch < '\x80')
+    return (len(text) - ascii_chars) + (ascii_chars + ASCII_CHARS_PER_TOKEN - 1) // ASCII_CHARS_PER_TOKEN
+
+
+def split_text(text: str, max_tokens: int) -> List[str]:
+    """
+    テキストを文の区切りで分割（各部分は max_tokens 以下）
+
+    1文が max_tokens を超える場合は、その文だけ文字数で分割する
+
+    Args:
+        text: 分割するテキスト
+        max_tokens: 1つの部分の最大トークン数
+
+    Returns:
+        分割されたテキストのリスト
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for sentence in SENTENCE_BOUNDARY.split(text):
+        if not sentence:
+            continue
+        tokens = estimate_tokens(sentence)
+        if tokens > max_tokens:
+            # 区切りのない長い文は上限の文字数ごとに切る（日本語は1文字≒1トークン）
+            pieces = [sentence[i:i + max_tokens] for i in range(0, len(sentence), max_tokens)]
+        else:
+            pieces = [sentence]
+        for piece in pieces:
+            piece_tokens = estimate_tokens(piece)
+            if current and current_tokens + piece_tokens > max_tokens:
+                chunks.append(''.join(current).strip())
+                current = []
+                current_tokens = 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        chunks.append(''.join(current).strip())
+
+    chunks = [chunk for chunk in chunks if chunk]
+    logger.info(f"テキストを{len(chunks)}個に分割しました（推定: {estimate_tokens(text)}トークン）")
+    return chunks
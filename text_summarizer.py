@@ -3,86 +3,49 @@
 ChatGPT APIを使用してテキストを要約・構造化
 """
 
+import time
 import logging
-from typing import Optional, Dict, Any
+import itertools
+import threading
+import openai
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Callable, List
 from openai import OpenAI
-from config import OPENAI_API_KEY
+from config import OPENAI_API_KEY, SUMMARY_MODEL, SUMMARY_MAX_TOKENS, SUMMARY_CHUNK_MAX_TOKENS, SUMMARY_CHUNK_WORKERS
+from config import SUMMARY_SHORT_MAX_CHARS, SUMMARY_SHORT_MAX_WORDS, SUMMARY_SHORT_MODEL, SUMMARY_SHORT_MAX_TOKENS
+from config import SUMMARY_MEDIUM_MAX_CHARS, SUMMARY_MEDIUM_MODEL, SUMMARY_MEDIUM_MAX_TOKENS
+from config import SUMMARY_DEADLINE_SECONDS, SUMMARY_MAX_ATTEMPTS, SUMMARY_RETRY_BASE_SECONDS, SUMMARY_RETRY_MAX_SECONDS
+from config import SUMMARY_HEDGE_ENABLED, SUMMARY_HEDGE_PERCENTILE, SUMMARY_HEDGE_MIN_SECONDS, SUMMARY_HEDGE_MIN_SAMPLES
+from call_policy import LatencyTracker, call_with_retries, hedged_call
+from admission import llm_limiter, openai_tpm
+from client_registry import get_openai_client
+from text_chunker import split_text, estimate_tokens
+from formatter import create_formatter
 
 # ログ設定
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 要約プロンプトの版（プロンプトを変更したら更新し、キャッシュを無効化する）
+SUMMARY_PROMPT_VERSION = '3'
 
-class TextSummarizer:
-    """テキスト要約クラス"""
-    
-    def __init__(self, api_key: Optional[str] = None):
-        """
-        初期化
-        
-        Args:
-            api_key: OpenAI APIキー
-        """
-        self.api_key = api_key or OPENAI_API_KEY
-        
-        if not self.api_key:
-            raise ValueError("OpenAI APIキーが設定されていません")
-        
-        self.client = OpenAI(api_key=self.api_key)
-        logger.info("TextSummarizerを初期化しました")
-    
-    def summarize_text(self, text: str) -> Dict[str, Any]:
-        """
-        テキストを要約
-        
-        Args:
-            text: 要約するテキスト
-            
-        Returns:
-            要約結果の辞書
-        """
-        result = {
-            'success': False,
-            'summary': '',
-            'error': None
-        }
-        
-        try:
-            # プロンプトの作成
-            prompt = self._create_summary_prompt(text)
-            
-            # ChatGPT APIを呼び出し（新APIに対応）
-            response = self.client.chat.completions.create(
-                model="gpt-4o",  # より高精度なモデルに変更
-                messages=[
-                    {"role": "system", "content": "あなたは建設業界の音声議事録を正確に要約する専門家です。建設業界の専門用語や業務内容を理解し、適切に分類します。測量・設計業務における数値や単位（面積、距離、角度、座標など）を正確に認識し、記載することが重要です。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.2,  # より安定した出力のために温度を下げる
-                max_tokens=2000
-            )
-            
-            result['summary'] = response.choices[0].message.content
-            result['success'] = True
-            logger.info("テキストの要約が完了しました")
-            
-        except Exception as e:
-            result['error'] = f"要約エラー: {e}"
-            logger.error(f"要約エラー: {e}")
-        
-        return result
-    
-    def _create_summary_prompt(self, text: str) -> str:
-        """
-        要約用のプロンプトを作成
-        
-        Args:
-            text: 要約するテキスト
-            
-        Returns:
-            プロンプト
-        """
-        prompt = f"""以下の音声内容を建設業界の業務報告書として要約し、指定の形式で出力してください。
+# 音声認識結果の長さによる振り分け（上から順に判定し、最初に条件を満たしたものを使う）
+# max_chars / max_words が None の条件は上限なし
+SUMMARY_ROUTES = [
+    {'name': 'short', 'max_chars': SUMMARY_SHORT_MAX_CHARS, 'max_words': SUMMARY_SHORT_MAX_WORDS,
+     'model': SUMMARY_SHORT_MODEL, 'max_tokens': SUMMARY_SHORT_MAX_TOKENS, 'prompt': 'short'},
+    {'name': 'medium', 'max_chars': SUMMARY_MEDIUM_MAX_CHARS, 'max_words': None,
+     'model': SUMMARY_MEDIUM_MODEL, 'max_tokens': SUMMARY_MEDIUM_MAX_TOKENS, 'prompt': 'full'},
+    {'name': 'long', 'max_chars': None, 'max_words': None,
+     'model': SUMMARY_MODEL, 'max_tokens': SUMMARY_MAX_TOKENS, 'prompt': 'full'},
+]
+
+# システムプロンプト
+SYSTEM_PROMPT = "あなたは建設業界の音声議事録を正確に要約する専門家です。建設業界の専門用語や業務内容を理解し、適切に分類します。測量・設計業務における数値や単位（面積、距離、角度、座標など）を正確に認識し、記載することが重要です。"
+
+# 要約の指示（毎回同じ内容。OpenAIのプロンプトキャッシュは先頭が一致する部分に効くため、
+# 音声内容はこの後ろに付ける）
+SUMMARY_PROMPT_PREFIX = """末尾の【音声内容】を建設業界の業務報告書として要約し、指定の形式で出力してください。
 
 【出力形式】
 1. 業務内容
@@ -113,9 +76,6 @@ class TextSummarizer:
 
 ー以上ー
 
-【音声内容】
-{text}
-
 【重要な指示】
 1. 音声内容の**すべての重要な情報**を漏れなく抽出してください
 2. 音声内で業務名（プロジェクト名、案件名、工事名など）が言及されている場合は、業務内容の冒頭に明記してください
@@ -140,9 +100,497 @@ class TextSummarizer:
 11. 提出書類については、音声内で言及されている書類名があればそれを記載し、なければ空白にしてください
 12. **重要な注意**：音声内容が業務に関連しない一般的な会話（例：「今広島にいます」）の場合でも、その情報を「その他」カテゴリに記述してください
 
-上記の形式と指示に従って、音声内容を正確に要約してください。"""
+上記の形式と指示に従って、以下の【音声内容】を正確に要約してください。
+
+【音声内容】
+"""
+
+# 短い音声内容用の簡潔な指示
+SHORT_SUMMARY_PROMPT_PREFIX = """末尾の短い【音声内容】を建設業界の業務報告書として要約し、指定の形式で出力してください。
+
+【出力形式】
+1. 業務内容
+   (1) 測量業務 / (2) 設計業務 / (3) 地質業務 / (4) その他 のうち、実際に行われたものだけを記載
+   1)具体的な作業内容
+
+2. 提出書類
+以下の書類を2部提出した。
+具体的な書類名を列挙
+
+ー以上ー
+
+【重要な指示】
+1. 音声に含まれる情報だけを記載し、業務に関連しない会話は「その他」に記述してください
+2. 文章は常体（だ・である調）で記述し、数値と単位は正確に記載してください
+3. 項目がないカテゴリと、言及のない提出書類は出力しないでください
+
+上記の形式と指示に従って、以下の【音声内容】を要約してください。
+
+【音声内容】
+"""
+
+
+class SummaryUsageStats:
+    """要約APIのトークン数・応答時間の集計（プロンプトキャッシュの効果確認用）"""
+    
+    def __init__(self):
+        """初期化"""
+        self._lock = threading.Lock()
+        self._models: Dict[str, Dict[str, Any]] = {}
+    
+    def record(self, model: str, usage: Dict[str, Any]):
+        """
+        1回の要約の使用量を記録
+        
+        Args:
+            model: 使用したモデル
+            usage: _extract_usage が返した辞書
+        """
+        with self._lock:
+            stats = self._models.setdefault(model, {
+                'requests': 0,
+                'prompt_tokens': 0,
+                'cached_tokens': 0,
+                'completion_tokens': 0,
+                'total_first_token_seconds': 0.0,
+                'streamed_requests': 0,
+                'total_seconds': 0.0
+            })
+            stats['requests'] += 1
+            stats['prompt_tokens'] += usage['prompt_tokens']
+            stats['cached_tokens'] += usage['cached_tokens']
+            stats['completion_tokens'] += usage['completion_tokens']
+            stats['total_seconds'] += usage['elapsed_seconds']
+            if usage.get('first_token_seconds') is not None:
+                stats['streamed_requests'] += 1
+                stats['total_first_token_seconds'] += usage['first_token_seconds']
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        モデルごとの集計を取得
+        
+        Returns:
+            トークン数・キャッシュ率・平均応答時間の辞書
+        """
+        with self._lock:
+            models = {model: dict(stats) for model, stats in self._models.items()}
+        for stats in models.values():
+            stats['cached_ratio'] = stats['cached_tokens'] / stats['prompt_tokens'] if stats['prompt_tokens'] else 0.0
+            stats['avg_seconds'] = stats['total_seconds'] / stats['requests']
+            stats['avg_first_token_seconds'] = (
+                stats['total_first_token_seconds'] / stats['streamed_requests'] if stats['streamed_requests'] else None
+            )
+        return {'models': models}
+
+
+# プロセス内で共有する使用量の集計
+summary_usage = SummaryUsageStats()
+
+
+def _extract_usage(usage: Any, elapsed_seconds: float, first_token_seconds: Optional[float] = None) -> Dict[str, Any]:
+    """
+    APIレスポンスの usage からトークン数を取り出す
+    
+    Args:
+        usage: レスポンスの usage（含まれない場合None）
+        elapsed_seconds: 要約にかかった秒数
+        first_token_seconds: 最初のトークンまでの秒数（ストリーミング時のみ）
         
-        return prompt
+    Returns:
+        prompt_tokens / cached_tokens / completion_tokens と所要時間の辞書
+    """
+    details = getattr(usage, 'prompt_tokens_details', None)
+    return {
+        'prompt_tokens': getattr(usage, 'prompt_tokens', 0) or 0,
+        'cached_tokens': getattr(details, 'cached_tokens', 0) or 0,
+        'completion_tokens': getattr(usage, 'completion_tokens', 0) or 0,
+        'elapsed_seconds': round(elapsed_seconds, 3),
+        'first_token_seconds': round(first_token_seconds, 3) if first_token_seconds is not None else None
+    }
+
+
+# モデル・呼び出し方法ごとの応答時間（ヘッジを開始するまでの時間の計算に使う）
+_latency_trackers: Dict[tuple, LatencyTracker] = {}
+_latency_lock = threading.Lock()
+
+
+def _latency_tracker(model: str, kind: str) -> LatencyTracker:
+    """モデル・呼び出し方法ごとの LatencyTracker を取得"""
+    with _latency_lock:
+        return _latency_trackers.setdefault((model, kind), LatencyTracker())
+
+
+def _hedge_delay(tracker: LatencyTracker) -> Optional[float]:
+    """
+    2つ目のリクエストを送るまでの秒数（直近の応答時間の SUMMARY_HEDGE_PERCENTILE パーセンタイル）
+
+    Returns:
+        秒数（ヘッジが無効、または応答時間の記録が足りない場合None）
+    """
+    if not SUMMARY_HEDGE_ENABLED:
+        return None
+    latency = tracker.percentile(SUMMARY_HEDGE_PERCENTILE, SUMMARY_HEDGE_MIN_SAMPLES)
+    return max(latency, SUMMARY_HEDGE_MIN_SECONDS) if latency is not None else None
+
+
+def _acquire_hedge(tokens: int) -> Optional[Callable[[], None]]:
+    """
+    ヘッジで送る2つ目のリクエストを要約の同時実行数とTPMに計上
+
+    Args:
+        tokens: リクエストのトークン数の見積もり
+
+    Returns:
+        同時実行数の空きを解放する関数（空きがない・TPMが足りない場合はNoneで、ヘッジしない）
+    """
+    if not llm_limiter.try_acquire():
+        return None
+    if not openai_tpm.try_consume(tokens):
+        llm_limiter.release()
+        return None
+    return llm_limiter.release
+
+
+def _is_retryable(error: Exception) -> bool:
+    """接続エラー・タイムアウト・レート制限・サーバーエラーは再試行する"""
+    if isinstance(error, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in (408, 409, 429)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """レスポンスの Retry-After ヘッダーから待ち時間を取得"""
+    response = getattr(error, 'response', None)
+    value = response.headers.get('retry-after') if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _close_stream(opened: tuple):
+    """ストリームを閉じて接続を解放（ヘッジで使わなかったストリームの後片付けにも使う）"""
+    stream = opened[0]
+    close = getattr(stream, 'close', None)
+    if close is not None:
+        close()
+
+
+class TextSummarizer:
+    """テキスト要約クラス"""
+    
+    def __init__(self, api_key: Optional[str] = None, client: Optional[OpenAI] = None):
+        """
+        初期化
+        
+        Args:
+            api_key: OpenAI APIキー
+            client: 使用するOpenAIクライアント（省略時はプロセス共有のクライアント）
+        """
+        self.api_key = api_key or OPENAI_API_KEY
+        
+        if not self.api_key and client is None:
+            raise ValueError("OpenAI APIキーが設定されていません")
+        
+        self.client = client or get_openai_client(self.api_key)
+        logger.info("TextSummarizerを初期化しました")
+    
+    def select_route(self, text: str, word_count: Optional[int] = None) -> Dict[str, Any]:
+        """
+        音声認識結果の長さから要約に使うモデル・max_tokens・プロンプトを選択
+        
+        Args:
+            text: 要約するテキスト
+            word_count: 音声認識結果の語数（transcribe_audio の 'word_count'、省略時はテキストから計算）
+            
+        Returns:
+            SUMMARY_ROUTES の要素
+        """
+        chars = len(text.strip())
+        words = word_count if word_count is not None else len(text.split())
+        route = SUMMARY_ROUTES[-1]
+        for candidate in SUMMARY_ROUTES:
+            if candidate['max_chars'] is not None and (candidate['max_chars'] <= 0 or chars > candidate['max_chars']):
+                continue
+            if candidate['max_words'] is not None and words > candidate['max_words']:
+                continue
+            route = candidate
+            break
+        logger.info(f"要約の振り分け: {route['name']} (文字数: {chars}, 語数: {words}) -> "
+                    f"モデル: {route['model']}, max_tokens: {route['max_tokens']}, プロンプト: {route['prompt']}")
+        return route
+    
+    def summarize_text(self, text: str, route: Optional[Dict[str, Any]] = None,
+                       deadline: Optional[float] = None) -> Dict[str, Any]:
+        """
+        テキストを要約
+        
+        ストリーミングで受け取って結合する（ヘッジで使わなかった方のリクエストを
+        ストリームを閉じて止められるようにし、生成され続けて課金されるのを防ぐ）
+        
+        Args:
+            text: 要約するテキスト
+            route: select_route の結果（省略時はテキストの長さから選択）
+            deadline: 再試行を含めた期限（time.monotonic() の値、省略時は SUMMARY_DEADLINE_SECONDS 後）
+            
+        Returns:
+            要約結果の辞書
+        """
+        return self.summarize_text_stream(text, route=route, deadline=deadline)
+    
+    def summarize_text_stream(self, text: str, on_delta: Optional[Callable[[str], None]] = None,
+                              route: Optional[Dict[str, Any]] = None,
+                              deadline: Optional[float] = None) -> Dict[str, Any]:
+        """
+        テキストを要約（生成されたトークンを順次受け取る）
+        
+        最初のチャンクが届くまでに失敗・遅延した場合は再試行・ヘッジを行う。
+        差分テキストを渡し始めた後のエラーは再試行しない
+        
+        Args:
+            text: 要約するテキスト
+            on_delta: 生成された差分テキストを受け取るコールバック
+            route: select_route の結果（省略時はテキストの長さから選択）
+            deadline: 再試行を含めた期限（time.monotonic() の値、省略時は SUMMARY_DEADLINE_SECONDS 後）
+            
+        Returns:
+            要約結果の辞書（summarize_text と同じ形式）
+        """
+        result = {
+            'success': False,
+            'summary': '',
+            'error': None
+        }
+        route = route or self.select_route(text)
+        deadline = deadline or time.monotonic() + SUMMARY_DEADLINE_SECONDS
+        tracker = _latency_tracker(route['model'], 'first_chunk')
+        request_tokens = self._estimate_request_tokens(text, route)
+        # ヘッジの確保時に計上済みのリクエスト数（その分は open_stream で計上しない）
+        prepaid = {'count': 0}
+        prepaid_lock = threading.Lock()
+        
+        def acquire_hedge():
+            release = _acquire_hedge(request_tokens)
+            if release is not None:
+                with prepaid_lock:
+                    prepaid['count'] += 1
+            return release
+        
+        def open_stream(timeout: float):
+            # 再試行・ヘッジを含め、送信するリクエスト毎にトークン毎分の上限に計上する
+            with prepaid_lock:
+                charged = prepaid['count'] > 0
+                if charged:
+                    prepaid['count'] -= 1
+            if not charged:
+                openai_tpm.consume(request_tokens, time.monotonic() + timeout)
+            # ストリームを開き、最初のチャンクが届くまで待つ
+            started = time.monotonic()
+            stream = self.client.with_options(timeout=timeout, max_retries=0).chat.completions.create(
+                model=route['model'],
+                messages=self._create_messages(text, route['prompt']),
+                temperature=0.2,
+                max_tokens=route['max_tokens'],
+                stream=True,
+                stream_options={'include_usage': True}  # 最後のチャンクでトークン数を受け取る
+            )
+            chunks = iter(stream)
+            first = next(chunks, None)
+            tracker.record(time.monotonic() - started)
+            return stream, chunks, first
+        
+        parts: List[str] = []
+        usage = None
+        first_token_seconds = None
+        try:
+            # 同時実行数の範囲で実行（ヘッジの2つ目のリクエストも計上する）
+            with llm_limiter.slot(timeout=deadline - time.monotonic()):
+                started = time.monotonic()
+                stream, chunks, first = call_with_retries(
+                    lambda timeout: hedged_call(open_stream, time.monotonic() + timeout, _hedge_delay(tracker),
+                                                discard=_close_stream, name='summary-stream',
+                                                acquire_hedge=acquire_hedge),
+                    deadline, SUMMARY_MAX_ATTEMPTS, _is_retryable,
+                    SUMMARY_RETRY_BASE_SECONDS, SUMMARY_RETRY_MAX_SECONDS, _retry_after, name='summary-stream'
+                )
+            
+                try:
+                    for chunk in itertools.chain([first] if first is not None else [], chunks):
+                        if getattr(chunk, 'usage', None) is not None:
+                            usage = chunk.usage
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if not delta:
+                            continue
+                        if first_token_seconds is None:
+                            first_token_seconds = time.monotonic() - started
+                        parts.append(delta)
+                        if on_delta is not None:
+                            on_delta(delta)
+                finally:
+                    _close_stream((stream, chunks, first))
+            
+                result['summary'] = ''.join(parts)
+                result['usage'] = self._record_usage(route['model'], usage, time.monotonic() - started,
+                                                     first_token_seconds)
+                result['success'] = True
+                logger.info("テキストの要約が完了しました（ストリーミング）")
+            
+        except Exception as e:
+            result['error'] = f"要約エラー: {e}"
+            logger.error(f"要約エラー: {e}")
+        
+        return result
+    
+    def summarize_long_text(self, text: str, on_delta: Optional[Callable[[str], None]] = None,
+                            on_chunk: Optional[Callable[[int, int], None]] = None,
+                            word_count: Optional[int] = None) -> Dict[str, Any]:
+        """
+        テキストを要約（長い場合は分割して並列に要約し、結果を結合）
+        
+        上限以下の長さの場合は summarize_text_stream と同じ。長い場合の所要時間は
+        全体の長さではなく、最も時間のかかった部分で決まる
+        
+        Args:
+            text: 要約するテキスト
+            on_delta: 生成された差分テキストを受け取るコールバック（分割しない場合のみ）
+            on_chunk: 部分の要約が終わるたびに (完了数, 部分の数) を受け取るコールバック
+            word_count: 音声認識結果の語数（モデルの振り分けに使用）
+            
+        Returns:
+            要約結果の辞書（summarize_text と同じ形式、分割した場合は 'chunk_count' を含む）
+        """
+        # 分割した場合もすべての部分で同じ期限を使う
+        deadline = time.monotonic() + SUMMARY_DEADLINE_SECONDS
+        chunks = split_text(text, SUMMARY_CHUNK_MAX_TOKENS)
+        if len(chunks) == 1:
+            return self.summarize_text_stream(text, on_delta=on_delta, route=self.select_route(text, word_count),
+                                              deadline=deadline)
+        
+        result = {
+            'success': False,
+            'summary': '',
+            'error': None,
+            'chunk_count': len(chunks)
+        }
+        logger.info(f"長いテキストを{len(chunks)}個に分割して要約します")
+        
+        completed = [0]
+        completed_lock = threading.Lock()
+        
+        def summarize_chunk(chunk: str) -> Dict[str, Any]:
+            chunk_result = self.summarize_text(chunk, deadline=deadline)
+            with completed_lock:
+                completed[0] += 1
+                done = completed[0]
+            if on_chunk is not None:
+                on_chunk(done, len(chunks))
+            return chunk_result
+        
+        workers = min(SUMMARY_CHUNK_WORKERS, len(chunks))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='summary-chunk') as executor:
+            chunk_results = list(executor.map(summarize_chunk, chunks))
+        
+        failed = [r['error'] for r in chunk_results if not r['success']]
+        if failed:
+            result['error'] = f"{len(failed)}/{len(chunks)}個の部分の要約に失敗しました: {failed[0]}"
+            logger.error(result['error'])
+            return result
+        
+        # 各部分の要約を業務内容・提出書類ごとにまとめる（追加のAPI呼び出しなし）
+        result['summary'] = create_formatter().merge_summaries([r['summary'] for r in chunk_results])
+        result['usage'] = {
+            key: sum(r['usage'][key] for r in chunk_results)
+            for key in ('prompt_tokens', 'cached_tokens', 'completion_tokens')
+        }
+        result['usage']['model'] = chunk_results[0]['usage']['model']
+        result['success'] = True
+        logger.info(f"分割要約を結合しました（{len(chunks)}個）")
+        return result
+    
+    def _estimate_request_tokens(self, text: str, route: Dict[str, Any]) -> int:
+        """
+        1回の要約で使うトークン数を見積もる（TPMの制限に使用）
+        
+        Args:
+            text: 要約するテキスト
+            route: select_route の結果
+            
+        Returns:
+            入力（システムプロンプト・指示・音声内容）と出力の上限の合計
+        """
+        prompt_tokens = sum(estimate_tokens(message['content']) for message in self._create_messages(text, route['prompt']))
+        return prompt_tokens + route['max_tokens']
+    
+    def _record_usage(self, model: str, usage: Any, elapsed_seconds: float,
+                      first_token_seconds: Optional[float] = None) -> Dict[str, Any]:
+        """
+        トークン数と応答時間を記録してログに出力
+        
+        Args:
+            model: 使用したモデル
+            usage: レスポンスの usage
+            elapsed_seconds: 要約にかかった秒数
+            first_token_seconds: 最初のトークンまでの秒数（ストリーミング時のみ）
+            
+        Returns:
+            _extract_usage の辞書（モデル名を含む）
+        """
+        record = _extract_usage(usage, elapsed_seconds, first_token_seconds)
+        summary_usage.record(model, record)
+        record['model'] = model
+        first_token = f"最初のトークンまで {first_token_seconds:.2f}秒, " if first_token_seconds is not None else ''
+        logger.info(f"要約のトークン数: 入力 {record['prompt_tokens']}（うちキャッシュ {record['cached_tokens']}）, "
+                    f"出力 {record['completion_tokens']}, {first_token}合計 {elapsed_seconds:.2f}秒 ({model})")
+        return record
+    
+    def _create_messages(self, text: str, prompt: str = 'full') -> List[Dict[str, str]]:
+        """
+        Chat Completions APIに渡すメッセージを作成
+        
+        Args:
+            text: 要約するテキスト
+            prompt: プロンプトの種類（'full' / 'short'）
+            
+        Returns:
+            メッセージのリスト
+        """
+        if prompt == 'short':
+            user_prompt = self._create_short_summary_prompt(text)
+        else:
+            user_prompt = self._create_summary_prompt(text)
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ]
+    
+    def _create_short_summary_prompt(self, text: str) -> str:
+        """
+        短い音声内容用の簡潔なプロンプトを作成（出力形式は _create_summary_prompt と同じ）
+        
+        Args:
+            text: 要約するテキスト
+            
+        Returns:
+            プロンプト
+        """
+        return SHORT_SUMMARY_PROMPT_PREFIX + text
+    
+    def _create_summary_prompt(self, text: str) -> str:
+        """
+        要約用のプロンプトを作成
+        
+        指示部分は毎回同じ内容のため、プロンプトキャッシュが効くよう先頭に置き、
+        音声内容は末尾に付ける
+        
+        Args:
+            text: 要約するテキスト
+            
+        Returns:
+            プロンプト
+        """
+        return SUMMARY_PROMPT_PREFIX + text
 
 
 def create_text_summarizer(api_key: Optional[str] = None) -> TextSummarizer:
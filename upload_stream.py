@@ -0,0 +1,271 @@
+"""
+アップロード受信モジュール
+multipart/form-data のリクエスト本文を受信しながら読み込み、先頭のヘッダーから
+音声形式と長さを判定して、対応外の音声は本文を受け取り終える前に断る。
+受け付けた音声はディスクに書き出しながらハッシュを計算し、同時にPCMへの変換を進める
+"""
+
+import os
+import time
+import hashlib
+import logging
+from typing import Optional, Dict, Any, Iterator, IO
+from werkzeug.sansio.multipart import MultipartDecoder, File, Data, Epilogue, NeedData
+from audio_probe import HEADER_BYTES, UNKNOWN_CODEC, sniff_audio_header
+from convert_audio import start_streaming_conversion
+from configs.speech_config import SUPPORTED_AUDIO_FORMATS, MAX_AUDIO_SIZE_MB, MAX_AUDIO_DURATION_SECONDS
+from configs.speech_config import PCM_SAMPLE_RATE
+
+# ログ設定
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# リクエスト本文の読み込み単位
+READ_CHUNK_SIZE = 64 * 1024
+# 受け付ける音声ファイルの最大バイト数
+MAX_AUDIO_BYTES = MAX_AUDIO_SIZE_MB * 1024 * 1024
+
+
+class UploadRejectedError(Exception):
+    """アップロードされた音声を受け付けない場合の例外"""
+
+    def __init__(self, message: str, status_code: int = 415):
+        """
+        初期化
+
+        Args:
+            message: エラーメッセージ
+            status_code: 返すHTTPステータス（415: 形式が対応外、413: 大きすぎる・長すぎる）
+        """
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def check_audio_header(header: bytes, filename: str, total_size: Optional[int] = None) -> Dict[str, Any]:
+    """
+    ファイル先頭のヘッダーから、受け付けられる音声か確認
+
+    Args:
+        header: ファイル先頭のバイト列（HEADER_BYTES 程度）
+        filename: 元のファイル名（拡張子の確認に使用）
+        total_size: ファイル全体のバイト数（分かる場合）
+
+    Returns:
+        audio_probe の判定結果の辞書
+
+    Raises:
+        UploadRejectedError: 対応外の形式・コーデック、または大きすぎる・長すぎる音声の場合
+    """
+    extension = os.path.splitext(filename)[1].lower().lstrip('.')
+    if extension not in SUPPORTED_AUDIO_FORMATS:
+        raise UploadRejectedError(f"サポートされていないファイル形式です（対応形式: {', '.join(SUPPORTED_AUDIO_FORMATS)}）")
+    if total_size and total_size > MAX_AUDIO_BYTES:
+        raise UploadRejectedError(f"ファイルサイズが大きすぎます（最大{MAX_AUDIO_SIZE_MB}MB）", 413)
+
+    audio_format = sniff_audio_header(header, total_size)
+    if audio_format is None:
+        raise UploadRejectedError("音声ファイルとして認識できません")
+    if audio_format['codec'] is None:
+        raise UploadRejectedError(f"対応していない音声コーデックです（{audio_format['container']}）")
+
+    duration = audio_format['duration_seconds']
+    if duration is not None and duration > MAX_AUDIO_DURATION_SECONDS:
+        raise UploadRejectedError(f"音声が長すぎます（{duration / 60:.0f}分、最大{MAX_AUDIO_DURATION_SECONDS // 60}分）", 413)
+    return audio_format
+
+
+class MultipartUpload:
+    """multipart/form-data の本文から1つのファイルを受信しながら取り出す"""
+
+    def __init__(self, stream: IO[bytes], boundary: str, field_name: str = 'file',
+                 chunk_size: int = READ_CHUNK_SIZE):
+        """
+        初期化
+
+        Args:
+            stream: リクエスト本文のストリーム
+            boundary: multipart の境界文字列
+            field_name: ファイルのフィールド名
+            chunk_size: 本文の読み込み単位
+        """
+        self.stream = stream
+        self.field_name = field_name
+        self.chunk_size = chunk_size
+        self.filename: Optional[str] = None
+        self.received_bytes = 0
+        self._declared_size: Optional[int] = None
+        self._decoder = MultipartDecoder(boundary.encode('latin-1'))
+        self._events = self._iter_events()
+        self._buffered = []
+        self._finished = False
+
+    def _iter_events(self) -> Iterator[Any]:
+        """本文を少しずつ読み込み、multipart のイベントを順に返す"""
+        while True:
+            data = self.stream.read(self.chunk_size)
+            self._decoder.receive_data(data or None)
+            event = self._decoder.next_event()
+            while not isinstance(event, NeedData):
+                if isinstance(event, Epilogue):
+                    return
+                yield event
+                event = self._decoder.next_event()
+            if not data:
+                return
+
+    def open(self) -> bool:
+        """
+        ファイルのパートまで読み進める（前にあるフィールドは読み捨てる）
+
+        Returns:
+            ファイルが見つかった場合True
+        """
+        for event in self._events:
+            if isinstance(event, File) and event.name == self.field_name:
+                self.filename = event.filename
+                length = event.headers.get('Content-Length', '')
+                self._declared_size = int(length) if length.isdigit() else None
+                return True
+        return False
+
+    def _next_data(self) -> Optional[bytes]:
+        """ファイルの次のデータを取得（ファイルの終わりではNone）"""
+        if self._finished:
+            return None
+        try:
+            for event in self._events:
+                if isinstance(event, Data):
+                    self._finished = not event.more_data
+                    self.received_bytes += len(event.data)
+                    if self.received_bytes > MAX_AUDIO_BYTES:
+                        raise UploadRejectedError(f"ファイルサイズが大きすぎます（最大{MAX_AUDIO_SIZE_MB}MB）", 413)
+                    if event.data or self._finished:
+                        return event.data
+        except ValueError as e:
+            raise UploadRejectedError(f"アップロードデータが不正です: {e}", 400)
+        raise UploadRejectedError("アップロードが途中で切断されました", 400)
+
+    def read_header(self, size: int = HEADER_BYTES) -> bytes:
+        """
+        ファイルの先頭を読み込む（読み込んだデータは chunks() でも返される）
+
+        Args:
+            size: 読み込むバイト数（ファイルがこれより小さい場合は全体）
+
+        Returns:
+            ファイル先頭のバイト列
+        """
+        while sum(len(chunk) for chunk in self._buffered) < size:
+            data = self._next_data()
+            if data is None:
+                break
+            self._buffered.append(data)
+        return b''.join(self._buffered)[:size]
+
+    def known_size(self) -> Optional[int]:
+        """
+        ファイルのパートのバイト数（リクエスト全体ではなくファイルのみ）
+
+        Returns:
+            読み込み済みの範囲でファイルが終わった場合はその長さ、パートに Content-Length がある場合はその値
+            （どちらでもなく分からない場合None）
+        """
+        if self._finished:
+            return self.received_bytes
+        return self._declared_size
+
+    def chunks(self) -> Iterator[bytes]:
+        """
+        ファイルの内容を受信した順に返す
+
+        Returns:
+            データのイテレーター
+        """
+        while self._buffered:
+            yield self._buffered.pop(0)
+        while True:
+            data = self._next_data()
+            if data is None:
+                return
+            if data:
+                yield data
+
+
+def open_upload(stream: IO[bytes], mimetype: str, boundary: Optional[str],
+                field_name: str = 'file') -> Optional[MultipartUpload]:
+    """
+    リクエスト本文からファイルのパートを開く
+
+    Args:
+        stream: リクエスト本文のストリーム
+        mimetype: リクエストの Content-Type（パラメーターを除く）
+        boundary: multipart の境界文字列
+        field_name: ファイルのフィールド名
+
+    Returns:
+        MultipartUploadインスタンス（ファイルが含まれない場合None）
+    """
+    if mimetype != 'multipart/form-data' or not boundary:
+        return None
+    upload = MultipartUpload(stream, boundary, field_name)
+    try:
+        found = upload.open()
+    except ValueError as e:
+        logger.warning(f"multipartの解析に失敗しました: {e}")
+        return None
+    return upload if found else None
+
+
+def _convertible_while_receiving(audio_format: Dict[str, Any]) -> bool:
+    """受信中にffmpegの標準入力から変換できる形式か（先頭から順に復号できる形式）"""
+    if audio_format['recognizer_ready'] and (audio_format['encoding'] == 'LINEAR16'
+                                             or audio_format['duration_seconds'] is not None):
+        # FFmpegを使わずに認識できるため変換しない
+        # （長さが分からない圧縮形式は認識方法を選べないため、変換してPCMの長さで選ぶ）
+        return False
+    # moov が末尾にあるMP4は最後まで受け取らないと復号できない
+    return not (audio_format['container'] == 'mp4' and audio_format['codec'] == UNKNOWN_CODEC)
+
+
+def save_upload(chunks: Iterator[bytes], filepath: str,
+                audio_format: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    アップロードファイルを受信しながら保存し、SHA-256とバイト数を計算
+
+    変換が必要な形式は受信したデータをそのままffmpegにも渡し、アップロードの完了と
+    ほぼ同時にPCMへの変換を終える（ffmpegに空きがない場合は受信後の変換に任せる）
+
+    Args:
+        chunks: 受信したデータのイテレーター
+        filepath: 保存先のパス
+        audio_format: check_audio_header の判定結果（省略時は受信中に変換しない）
+
+    Returns:
+        'sha256'・'size'・'pcm_path'（受信中に変換できなかった場合None）を含む辞書
+    """
+    conversion = None
+    if audio_format and _convertible_while_receiving(audio_format):
+        conversion = start_streaming_conversion(filepath + '.pcm', PCM_SAMPLE_RATE)
+
+    hasher = hashlib.sha256()
+    size = 0
+    started = time.monotonic()
+    try:
+        with open(filepath, 'wb') as f:
+            for chunk in chunks:
+                hasher.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+                if conversion:
+                    conversion.feed(chunk)
+    except Exception:
+        # 途中で断った・切断されたファイルは残さない
+        if conversion:
+            conversion.abort()
+        os.remove(filepath)
+        raise
+
+    pcm_path = conversion.finish() if conversion else None
+    logger.info(f"アップロードを受信しました: {size / (1024 * 1024):.2f}MB, {time.monotonic() - started:.2f}秒"
+                f"{'（受信中に変換済み）' if pcm_path else ''}")
+    return {'sha256': hasher.hexdigest(), 'size': size, 'pcm_path': pcm_path}
@@ -0,0 +1,153 @@
+"""
+音声区間検出（VAD）モジュール
+PCM音声から長い無音・雑音区間を取り除き、認識する音声の長さを短縮
+"""
+
+import logging
+from typing import List, Dict, Any, Tuple
+import numpy as np
+from configs.speech_config import VAD_MIN_SILENCE_SECONDS, VAD_PADDING_SECONDS, VAD_THRESHOLD_DB
+
+logger = logging.getLogger(__name__)
+
+# 判定に使うフレーム長（ミリ秒）
+FRAME_MS = 30
+# 音声の主な周波数帯（風などの低域雑音を除外する）
+SPEECH_BAND_HZ = (300, 3400)
+# これより静かなフレームは常に無音とみなす（dBFS）
+ABSOLUTE_FLOOR_DB = -55.0
+# エネルギーを計算する単位のフレーム数（約1分ずつ。長い音声でもメモリ使用量が一定になる）
+VAD_BLOCK_FRAMES = 2048
+
+
+def _speech_band_energy_db(samples: np.ndarray, sample_rate: int, frame_size: int) -> np.ndarray:
+    """フレームごとの音声帯域のエネルギー（dBFS）を計算（一定数のフレームずつ処理し、音声の長さによらずメモリを抑える）"""
+    frame_count = len(samples) // frame_size
+    window = np.hanning(frame_size).astype(np.float32)
+    freqs = np.fft.rfftfreq(frame_size, 1.0 / sample_rate)
+    band = (freqs >= SPEECH_BAND_HZ[0]) & (freqs <= SPEECH_BAND_HZ[1])
+    energy = np.empty(frame_count, dtype=np.float32)
+    for start in range(0, frame_count, VAD_BLOCK_FRAMES):
+        end = min(start + VAD_BLOCK_FRAMES, frame_count)
+        frames = samples[start * frame_size:end * frame_size].reshape(end - start, frame_size).astype(np.float32)
+        frames *= window / np.float32(32768.0)
+        spectrum = np.fft.rfft(frames, axis=1)[:, band]
+        energy[start:end] = (spectrum.real ** 2 + spectrum.imag ** 2).sum(axis=1) / frame_size
+    return 10.0 * np.log10(energy + np.float32(1e-12))
+
+
+def _speech_regions(is_speech: np.ndarray, min_silence_frames: int) -> List[Tuple[int, int]]:
+    """音声フレームの区間を求め、短い無音で途切れた区間はつなげる"""
+    regions = []
+    start = None
+    silence = 0
+    for index, speech in enumerate(is_speech):
+        if speech:
+            if start is None:
+                start = index
+            silence = 0
+        elif start is not None:
+            silence += 1
+            if silence >= min_silence_frames:
+                regions.append((start, index - silence + 1))
+                start = None
+                silence = 0
+    if start is not None:
+        regions.append((start, len(is_speech) - silence))
+    return regions
+
+
+def trim_silence(pcm: memoryview, sample_rate: int,
+                 min_silence_seconds: float = VAD_MIN_SILENCE_SECONDS,
+                 padding_seconds: float = VAD_PADDING_SECONDS,
+                 threshold_db: float = VAD_THRESHOLD_DB) -> Dict[str, Any]:
+    """
+    長い無音区間を取り除く
+
+    Args:
+        pcm: 16bitリトルエンディアン・モノラルのPCMデータ
+        sample_rate: サンプリングレート
+        min_silence_seconds: これより長い無音区間だけを取り除く
+        padding_seconds: 音声区間の前後に残す秒数
+        threshold_db: 雑音レベルからこのdB以上大きいフレームを音声とみなす
+
+    Returns:
+        'pcm'（処理後のPCM）、'offset_map'（処理後→元の時刻の対応）、
+        'removed_seconds'、'original_seconds' を含む辞書
+    """
+    samples = np.frombuffer(pcm, dtype='<i2')
+    original_seconds = len(samples) / sample_rate
+    result = {
+        'pcm': pcm,
+        'offset_map': [{'trimmed_start': 0.0, 'original_start': 0.0, 'duration': original_seconds}],
+        'removed_seconds': 0.0,
+        'original_seconds': original_seconds
+    }
+
+    frame_size = sample_rate * FRAME_MS // 1000
+    if len(samples) < frame_size * 2:
+        return result
+
+    # 雑音レベル（静かなフレームの10パーセンタイル）を基準に音声フレームを判定
+    energy_db = _speech_band_energy_db(samples, sample_rate, frame_size)
+    noise_floor = float(np.percentile(energy_db, 10))
+    threshold = max(noise_floor + threshold_db, ABSOLUTE_FLOOR_DB)
+    is_speech = energy_db > threshold
+
+    padding_frames = int(padding_seconds * 1000) // FRAME_MS
+    min_silence_frames = max(1, int(min_silence_seconds * 1000) // FRAME_MS)
+    regions = _speech_regions(is_speech, min_silence_frames + 2 * padding_frames)
+    if not regions:
+        # 音声が見つからない場合は誤検出を避けるため元の音声を使う
+        logger.info("音声区間が検出されませんでした。無音除去をスキップします")
+        return result
+
+    # 前後に余白を付けてサンプル単位の区間に変換
+    total_frames = len(energy_db)
+    sample_regions = []
+    for start, end in regions:
+        start = max(0, start - padding_frames)
+        end = min(total_frames, end + padding_frames)
+        start_sample = start * frame_size
+        end_sample = len(samples) if end == total_frames else end * frame_size
+        sample_regions.append((start_sample, end_sample))
+
+    kept = sum(end - start for start, end in sample_regions)
+    if kept >= len(samples):
+        return result
+
+    offset_map = []
+    trimmed_start = 0
+    for start, end in sample_regions:
+        offset_map.append({
+            'trimmed_start': trimmed_start / sample_rate,
+            'original_start': start / sample_rate,
+            'duration': (end - start) / sample_rate
+        })
+        trimmed_start += end - start
+
+    trimmed = np.concatenate([samples[start:end] for start, end in sample_regions])
+    result['pcm'] = memoryview(trimmed.tobytes())
+    result['offset_map'] = offset_map
+    result['removed_seconds'] = (len(samples) - kept) / sample_rate
+
+    logger.info(f"無音区間を除去しました: {result['removed_seconds']:.1f}秒 / {original_seconds:.1f}秒 "
+                f"({len(sample_regions)}区間)")
+    return result
+
+
+def restore_offset(offset_map: List[Dict[str, float]], trimmed_seconds: float) -> float:
+    """
+    無音除去後の時刻を元の音声の時刻に戻す
+
+    Args:
+        offset_map: trim_silence が返した対応表
+        trimmed_seconds: 無音除去後の音声での時刻（秒）
+
+    Returns:
+        元の音声での時刻（秒）
+    """
+    for entry in reversed(offset_map):
+        if trimmed_seconds >= entry['trimmed_start']:
+            return entry['original_start'] + (trimmed_seconds - entry['trimmed_start'])
+    return trimmed_seconds
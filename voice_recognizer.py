@@ -6,13 +6,25 @@ Google Cloud Speech-to-Text APIを使用して音声をテキストに変換
 import os
 import io
 import logging
-import tempfile
-from typing import Optional, Dict, Any
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Tuple, Callable
 from google.cloud import speech
 from google.cloud.speech import RecognitionConfig, RecognitionAudio
 from configs.speech_config import SUPPORTED_AUDIO_FORMATS, SPEECH_CONFIG, MAX_AUDIO_SIZE_MB, MAX_AUDIO_DURATION_SECONDS
-from convert_audio import convert_to_wav
+from configs.speech_config import CHUNKED_RECOGNITION_ENABLED, CHUNK_RECOGNITION_WORKERS
+from configs.speech_config import INLINE_MAX_SECONDS, INLINE_MAX_BYTES, CHUNKED_MAX_SECONDS, PCM_SAMPLE_RATE
+from configs.speech_config import GCS_UPLOAD_FORMAT, VAD_ENABLED
+from convert_audio import convert_audio, convert_to_pcm, encode_pcm, probe_duration, map_file, TARGET_FORMATS
+from audio_chunker import split_on_silence
+from audio_probe import probe_audio_file, UNKNOWN_WAV_DATA_SIZES
+from voice_activity import trim_silence, restore_offset
 from gcs_handler import GCSHandler
+from operation_tracker import get_operation_tracker
+from client_registry import get_speech_client
+from admission import stt_limiter
+from config import GOOGLE_APPLICATION_CREDENTIALS
 
 # ログ設定
 logging.basicConfig(level=logging.INFO)
@@ -22,32 +34,39 @@ logger = logging.getLogger(__name__)
 class VoiceRecognizer:
     """音声認識クラス"""
     
-    def __init__(self, credentials_path: Optional[str] = None):
+    def __init__(self, credentials_path: Optional[str] = None, client: Optional[speech.SpeechClient] = None,
+                 progress_callback: Optional[Callable[[str, int, str], None]] = None,
+                 defer_long_running: bool = False):
         """
         初期化
         
         Args:
             credentials_path: Google Cloud認証情報のパス
+            client: 使用するSpeechClient（省略時はプロセス共有のクライアント）
+            progress_callback: 進捗通知用のコールバック (stage, 音声認識内の進捗率0〜100, message)
+            defer_long_running: Trueの場合、非同期認識の完了を待たずに 'pending_operation'（Operation名）を返す
         """
-        self.client = None
-        self.credentials_path = credentials_path
+        self.credentials_path = credentials_path or GOOGLE_APPLICATION_CREDENTIALS
+        self.client = client
+        self.progress_callback = progress_callback
+        self.defer_long_running = defer_long_running
         self._initialize_client()
     
+    def _report(self, stage: str, progress: int, message: str):
+        """進捗を通知（コールバック未指定時は何もしない）"""
+        if self.progress_callback is None:
+            return
+        try:
+            self.progress_callback(stage, progress, message)
+        except Exception as e:
+            logger.warning(f"進捗通知エラー: {e}")
+    
     def _initialize_client(self):
-        """Google Cloud Speech クライアントを初期化"""
+        """Google Cloud Speech クライアントを取得（プロセス内で共有）"""
+        if self.client is not None:
+            return
         try:
-            logger.info(f"認証情報パスの確認: {self.credentials_path}")
-            
-            if self.credentials_path:
-                if os.path.exists(self.credentials_path):
-                    os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = self.credentials_path
-                    logger.info(f"認証情報を設定: {self.credentials_path}")
-                else:
-                    logger.error(f"認証情報ファイルが見つかりません: {self.credentials_path}")
-                    raise FileNotFoundError(f"File {self.credentials_path} was not found.")
-            
-            self.client = speech.SpeechClient()
-            logger.info("Google Cloud Speech クライアントを初期化しました")
+            self.client = get_speech_client(self.credentials_path)
             
         except Exception as e:
             logger.error(f"クライアント初期化エラー: {e}")
@@ -67,7 +86,8 @@ class VoiceRecognizer:
             'valid': False,
             'error': None,
             'file_size_mb': 0,
-            'duration_seconds': 0
+            'duration_seconds': 0,
+            'audio_format': None
         }
         
         try:
@@ -93,6 +113,16 @@ class VoiceRecognizer:
                 logger.error(f"ファイル拡張子 '{file_extension}' がサポートされていません")
                 return result
             
+            # ヘッダーから長さが分かる場合は上限を確認
+            audio_format = probe_audio_file(file_path)
+            result['audio_format'] = audio_format
+            duration = audio_format['duration_seconds'] if audio_format else None
+            if duration is not None:
+                result['duration_seconds'] = duration
+                if duration > MAX_AUDIO_DURATION_SECONDS:
+                    result['error'] = f"音声が長すぎます（最大{MAX_AUDIO_DURATION_SECONDS // 60}分）"
+                    return result
+            
             result['valid'] = True
             logger.info(f"音声ファイル検証成功: {file_path}")
             
@@ -112,120 +142,514 @@ class VoiceRecognizer:
         Returns:
             変換結果の辞書
         """
-        result = {
+        return self.recognize_prepared(self.prepare_audio(file_path))
+    
+    def prepare_audio(self, file_path: str, pcm_path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        音声ファイルを認識できる形に変換（検証・形式判定・FFmpeg変換・無音除去）
+        
+        CPUを使う処理だけを行い、APIは呼び出さない（パイプラインの変換段階で実行）
+        
+        Args:
+            file_path: 音声ファイルのパス
+            pcm_path: アップロードの受信中に変換済みのPCMファイル（ある場合は変換を省略）
+            
+        Returns:
+            recognize_prepared に渡す辞書（'method' は 'pcm' / 'passthrough' / 'encoded' / 'file'）
+        """
+        prepared = {
             'success': False,
-            'text': '',
-            'confidence': 0.0,
             'error': None,
-            'word_count': 0
+            'method': None,
+            'file_path': file_path,
+            'name': os.path.basename(file_path)
         }
         
         try:
             # ファイル検証
             validation = self.validate_audio_file(file_path)
             if not validation['valid']:
-                result['error'] = validation['error']
-                return result
+                prepared['error'] = validation['error']
+                return prepared
+            
+            # アップロードの受信中に変換が終わっている場合はそのPCMを使う
+            if pcm_path and os.path.exists(pcm_path):
+                logger.info(f"受信中に変換したPCMを使用します: {prepared['name']}")
+                return self._prepare_converted_pcm(prepared, map_file(pcm_path))
             
-            # 全てのファイルをモノラル、16000HzのWAVに変換（オプション）
-            actual_file_path = file_path
+            # 認識可能な形式であればFFmpegを使わずにそのまま渡す
+            audio_format = validation['audio_format']
+            if audio_format and audio_format['recognizer_ready']:
+                # 16bit・モノラルのWAVはdataチャンクをそのままPCMとして扱う（ファイル全体は読み込まない）
+                if audio_format['encoding'] == 'LINEAR16':
+                    logger.info(f"変換をスキップします: {prepared['name']} "
+                                f"(LINEAR16, {audio_format['sample_rate_hertz']}Hz)")
+                    return self._prepare_converted_pcm(prepared, self._map_wav_data(file_path, audio_format),
+                                                       audio_format['sample_rate_hertz'])
+                # 長さが分からない圧縮形式（録音されたWebMなど）は認識方法を選べないためPCMに変換する
+                if (audio_format['duration_seconds'] is not None
+                        and not self._passthrough_needs_pcm(file_path, audio_format)):
+                    prepared.update(method='passthrough', audio_format=audio_format, success=True)
+                    return prepared
+            
+            # GCS経由になる長さが分かっている場合は、PCMを経由せず直接圧縮形式に変換
+            # （無音除去を行う場合は除去後の長さで判定するためPCMに変換する）
+            known_duration = audio_format['duration_seconds'] if audio_format else None
+            if (not VAD_ENABLED and known_duration is not None
+                    and self._select_route(known_duration, True, 0) == 'gcs'):
+                self._report('converting', 0, '音声を変換中...')
+                encoded = convert_audio(file_path, target=GCS_UPLOAD_FORMAT, sample_rate=PCM_SAMPLE_RATE)
+                if encoded is not None:
+                    prepared.update(method='encoded', data=encoded,
+                                    encoding=TARGET_FORMATS[GCS_UPLOAD_FORMAT]['encoding'],
+                                    sample_rate=PCM_SAMPLE_RATE, success=True)
+                    return prepared
+            
+            # モノラル・16kHzのPCMに変換（一時ファイルを使わずパイプで受け取る）
             logger.info(f"音声ファイルを変換中: {file_path}")
-            converted_file = convert_to_wav(file_path)
-            if converted_file != file_path:
-                actual_file_path = converted_file
-                logger.info(f"変換完了: {actual_file_path}")
-            else:
+            self._report('converting', 0, '音声を変換中...')
+            pcm = convert_to_pcm(file_path, sample_rate=PCM_SAMPLE_RATE)
+            if pcm is None:
                 logger.info("元のファイルを使用します")
+                prepared.update(method='file', success=True)
+                return prepared
             
-            # 音声ファイルの読み込み
-            with io.open(actual_file_path, 'rb') as audio_file:
-                content = audio_file.read()
+            logger.info(f"変換完了: {len(pcm) / (1024 * 1024):.2f}MB (LINEAR16, モノラル, {PCM_SAMPLE_RATE}Hz)")
+            return self._prepare_converted_pcm(prepared, pcm)
+            
+        except Exception as e:
+            prepared['error'] = f"音声認識エラー: {e}"
+            logger.error(f"音声認識エラー: {e}")
+        
+        return prepared
+    
+    def _map_wav_data(self, file_path: str, audio_format: Dict[str, Any]) -> memoryview:
+        """WAVのdataチャンクをPCMとしてマップ（サイズが書かれていない場合はファイルの末尾まで）"""
+        data_size = audio_format['data_size']
+        if data_size in UNKNOWN_WAV_DATA_SIZES:
+            data_size = None
+        pcm = map_file(file_path, audio_format['data_offset'], data_size)
+        # 16bitのサンプルの途中で終わるデータは切り捨てる
+        return pcm[:len(pcm) // 2 * 2]
+    
+    def _prepare_converted_pcm(self, prepared: Dict[str, Any], pcm: memoryview,
+                               sample_rate: int = PCM_SAMPLE_RATE) -> Dict[str, Any]:
+        """PCMの長さを確認して prepared に設定"""
+        # ヘッダーに長さがない形式（録音されたWebMやWAVなど）はPCMの長さで確認
+        if not pcm:
+            prepared['error'] = "音声データがありません"
+            return prepared
+        if len(pcm) / (2 * sample_rate) > MAX_AUDIO_DURATION_SECONDS:
+            prepared['error'] = f"音声が長すぎます（最大{MAX_AUDIO_DURATION_SECONDS // 60}分）"
+            return prepared
+        return self._prepare_pcm(prepared, pcm, sample_rate)
+    
+    def _prepare_pcm(self, prepared: Dict[str, Any], pcm: memoryview, sample_rate: int) -> Dict[str, Any]:
+        """PCM音声から長い無音・雑音区間を除去して prepared に設定"""
+        prepared.update(method='pcm', pcm=pcm, sample_rate=sample_rate, vad=None, success=True)
+        if VAD_ENABLED:
+            # 認識時間と課金対象の秒数を削減
+            self._report('trimming', 10, '無音区間を除去中...')
+            vad = trim_silence(pcm, sample_rate)
+            prepared['pcm'] = vad['pcm']
+            prepared['vad'] = {
+                'removed_seconds': vad['removed_seconds'],
+                'original_seconds': vad['original_seconds'],
+                'offset_map': vad['offset_map']
+            }
+        return prepared
+    
+    def recognize_prepared(self, prepared: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        prepare_audio で変換した音声を認識（パイプラインの音声認識段階で実行）
+        
+        Args:
+            prepared: prepare_audio の結果
             
-            # 音声認識の実行（長時間音声対応）
-            audio = RecognitionAudio(content=content)
+        Returns:
+            変換結果の辞書
+        """
+        result = {
+            'success': False,
+            'text': '',
+            'confidence': 0.0,
+            'error': prepared['error'],
+            'word_count': 0
+        }
+        if not prepared['success']:
+            return result
+        
+        try:
+            method = prepared['method']
+            file_path = prepared['file_path']
+            if method == 'passthrough':
+                return self._transcribe_passthrough(file_path, prepared['audio_format'])
+            if method == 'encoded':
+                return self._transcribe_via_gcs(file_path, data=prepared['data'],
+                                                encoding=prepared['encoding'], sample_rate=prepared['sample_rate'])
+            if method == 'file':
+                return self._transcribe_file(file_path)
+            return self._recognize_pcm(prepared['pcm'], prepared['sample_rate'], prepared['name'], prepared['vad'])
             
-            # 設定を更新（ENCODING_UNSPECIFIEDで自動判定、sample_rate_hertzも自動判定）
-            config_dict = dict(SPEECH_CONFIG)
-            config_dict['encoding'] = 'ENCODING_UNSPECIFIED'  # 自動判定
-            # sample_rate_hertzは省略してAPIが自動判定
-            if 'sample_rate_hertz' in config_dict:
-                del config_dict['sample_rate_hertz']
-            config = RecognitionConfig(**config_dict)
+        except Exception as e:
+            result['error'] = f"音声認識エラー: {e}"
+            logger.error(f"音声認識エラー: {e}")
+        
+        return result
+    
+    def transcribe_pcm(self, pcm: memoryview, sample_rate: int, name: str = 'audio') -> Dict[str, Any]:
+        """
+        PCM音声をテキストに変換
+        
+        Args:
+            pcm: 16bitリトルエンディアン・モノラルのPCMデータ
+            sample_rate: サンプリングレート
+            name: ログ・GCSオブジェクト名に使う名前
             
-            logger.info(f"音声認識を開始: {actual_file_path} (LINEAR16, モノラル, 16000Hz)")
+        Returns:
+            変換結果の辞書（無音除去を行った場合は 'vad' に除去秒数と時刻の対応表を含む）
+        """
+        prepared = self._prepare_pcm({'name': name}, pcm, sample_rate)
+        return self._recognize_pcm(prepared['pcm'], sample_rate, name, prepared['vad'])
+    
+    def _recognize_pcm(self, pcm: memoryview, sample_rate: int, name: str,
+                       vad: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """無音除去済みのPCM音声を認識し、区間ごとの時刻を元の音声の時刻に戻す"""
+        result = self._route_pcm(pcm, sample_rate, name)
+        if vad is None:
+            return result
+        result['vad'] = vad
+        for segment in result.get('segments', []):
+            segment['start_seconds'] = restore_offset(vad['offset_map'], segment['start_seconds'])
+            segment['end_seconds'] = restore_offset(vad['offset_map'], segment['end_seconds'])
+        return result
+    
+    def _route_pcm(self, pcm: memoryview, sample_rate: int, name: str) -> Dict[str, Any]:
+        """
+        PCM音声の長さから認識方法を選んで実行
+        
+        Args:
+            pcm: 16bitリトルエンディアン・モノラルのPCMデータ
+            sample_rate: サンプリングレート
+            name: ログ・GCSオブジェクト名に使う名前
             
-            # ファイルサイズをチェック
-            content_size_mb = len(content) / (1024 * 1024)
-            logger.info(f"音声ファイルサイズ: {content_size_mb:.2f}MB")
+        Returns:
+            変換結果の辞書
+        """
+        # 音声の長さから認識方法を決定（インライン / 分割 / GCS非同期）
+        duration = len(pcm) / 2 / sample_rate
+        route = self._select_route(duration, True, len(pcm))
+        logger.info(f"認識方法: {route} (音声の長さ: {duration:.1f}秒)")
+        
+        if route == 'chunked':
+            return self.transcribe_pcm_chunked(pcm, sample_rate)
+        if route == 'gcs':
+            # アップロード量を減らすため圧縮形式にエンコード（失敗時はPCMのまま）
+            encoded = encode_pcm(pcm, GCS_UPLOAD_FORMAT, sample_rate) if GCS_UPLOAD_FORMAT != 'pcm' else None
+            if encoded is not None:
+                return self._transcribe_via_gcs(name, data=encoded,
+                                                encoding=TARGET_FORMATS[GCS_UPLOAD_FORMAT]['encoding'],
+                                                sample_rate=sample_rate)
+            return self._transcribe_via_gcs(name, data=pcm, encoding='LINEAR16', sample_rate=sample_rate)
+        
+        logger.info(f"音声認識を開始: {name} (LINEAR16, モノラル, {sample_rate}Hz)")
+        self._report('recognizing', 20, '音声認識中...')
+        return self._recognize_inline(bytes(pcm), self._linear16_config(sample_rate))
+    
+    def _passthrough_needs_pcm(self, file_path: str, audio_format: Dict[str, Any]) -> bool:
+        """
+        変換不要な圧縮形式（FLAC / Opus）でも、分割認識のためにPCMへ変換した方がよいか判定
+        
+        Args:
+            file_path: 音声ファイルのパス
+            audio_format: probe_audio_file の判定結果
             
-            # すべてのファイルで通常認識を試行し、失敗した場合に非同期APIを使用
-            if False:  # 自動判定をスキップ
-                logger.info("大容量ファイルのため非同期認識を開始...")
-                operation = self.client.long_running_recognize(config=config, audio=audio)
+        Returns:
+            分割認識が速い長さの場合True（FLAC / Opus は分割できないため）
+        """
+        duration = audio_format['duration_seconds']
+        route = self._select_route(duration, False, os.path.getsize(file_path))
+        return (route == 'gcs' and CHUNKED_RECOGNITION_ENABLED
+                and duration is not None and duration <= CHUNKED_MAX_SECONDS)
+    
+    def _transcribe_passthrough(self, file_path: str, audio_format: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        変換不要な圧縮形式（FLAC / Opus）のファイルをFFmpegを通さずに認識
+        
+        Args:
+            file_path: 音声ファイルのパス
+            audio_format: probe_audio_file の判定結果
+            
+        Returns:
+            変換結果の辞書
+        """
+        name = os.path.basename(file_path)
+        encoding = audio_format['encoding']
+        sample_rate = audio_format['sample_rate_hertz']
+        route = self._select_route(audio_format['duration_seconds'], False, os.path.getsize(file_path))
+        
+        logger.info(f"変換をスキップします: {name} ({encoding}, {sample_rate}Hz, 認識方法: {route})")
+        if route == 'gcs':
+            return self._transcribe_via_gcs(file_path, encoding=encoding, sample_rate=sample_rate)
+        
+        with io.open(file_path, 'rb') as audio_file:
+            content = audio_file.read()
+        config_dict = dict(SPEECH_CONFIG)
+        config_dict['encoding'] = encoding
+        config_dict['sample_rate_hertz'] = sample_rate
+        self._report('recognizing', 20, '音声認識中...')
+        return self._recognize_inline(content, RecognitionConfig(**config_dict))
+    
+    def _transcribe_file(self, file_path: str) -> Dict[str, Any]:
+        """
+        変換できなかったファイルをそのまま認識
+        
+        Args:
+            file_path: 音声ファイルのパス
+            
+        Returns:
+            変換結果の辞書
+        """
+        duration, chunkable = self._probe_audio(file_path)
+        
+        # 16bit・モノラルのWAVであればPCMを取り出して同じ経路で処理
+        if chunkable:
+            with wave.open(file_path, 'rb') as wav_file:
+                sample_rate = wav_file.getframerate()
+                pcm = memoryview(wav_file.readframes(wav_file.getnframes()))
+            return self.transcribe_pcm(pcm, sample_rate, name=os.path.basename(file_path))
+        
+        route = self._select_route(duration, False, os.path.getsize(file_path))
+        logger.info(f"認識方法: {route} (音声の長さ: {duration if duration is not None else '不明'}秒)")
+        if route != 'inline':
+            return self._transcribe_via_gcs(file_path)
+        
+        # 音声ファイルの読み込み
+        with io.open(file_path, 'rb') as audio_file:
+            content = audio_file.read()
+        
+        # 設定を更新（ENCODING_UNSPECIFIEDで自動判定、sample_rate_hertzも自動判定）
+        config_dict = dict(SPEECH_CONFIG)
+        config_dict['encoding'] = 'ENCODING_UNSPECIFIED'  # 自動判定
+        # sample_rate_hertzは省略してAPIが自動判定
+        if 'sample_rate_hertz' in config_dict:
+            del config_dict['sample_rate_hertz']
+        
+        logger.info(f"音声認識を開始: {file_path} ({len(content) / (1024 * 1024):.2f}MB)")
+        self._report('recognizing', 20, '音声認識中...')
+        return self._recognize_inline(content, RecognitionConfig(**config_dict))
+    
+    def _linear16_config(self, sample_rate: int) -> RecognitionConfig:
+        """PCM（LINEAR16）用の認識設定を作成"""
+        config_dict = dict(SPEECH_CONFIG)
+        config_dict['encoding'] = 'LINEAR16'
+        config_dict['sample_rate_hertz'] = sample_rate
+        return RecognitionConfig(**config_dict)
+    
+    def _recognize_inline(self, content: bytes, config: RecognitionConfig) -> Dict[str, Any]:
+        """
+        音声データをそのまま同期認識
+        
+        Args:
+            content: 音声データ
+            config: 認識設定
+            
+        Returns:
+            変換結果の辞書
+        """
+        result = {
+            'success': False,
+            'text': '',
+            'confidence': 0.0,
+            'error': None,
+            'word_count': 0
+        }
+        
+        try:
+            with stt_limiter.slot():
+                response = self.client.recognize(config=config, audio=RecognitionAudio(content=content))
+            
+            # 結果の処理
+            if response.results:
+                # 最も信頼度の高い結果を取得
+                best_result = max(response.results, key=lambda x: x.alternatives[0].confidence)
+                result['text'] = best_result.alternatives[0].transcript
+                result['confidence'] = best_result.alternatives[0].confidence
+                result['success'] = True
+                result['word_count'] = len(result['text'].split())
                 
-                # 完了を待つ
-                logger.info("音声認識処理中...")
-                response = operation.result(timeout=300)  # 5分のタイムアウト
+                logger.info(f"音声認識完了: {result['word_count']}語, 信頼度: {result['confidence']:.2f}")
+            else:
+                result['error'] = "音声認識の結果がありません"
+                logger.warning("音声認識の結果がありません")
                 
-                # 結果の処理
-                if response.results:
-                    # 全ての結果を結合
-                    transcripts = []
-                    for res in response.results:
-                        transcripts.append(res.alternatives[0].transcript)
-                    
-                    result['text'] = ' '.join(transcripts)
-                    result['confidence'] = sum(res.alternatives[0].confidence for res in response.results if res.alternatives[0].confidence) / len(response.results)
-                    result['success'] = True
-                    result['word_count'] = len(result['text'].split())
-                    
-                    logger.info(f"長時間音声認識完了: {result['word_count']}語, 平均信頼度: {result['confidence']:.2f}")
-                else:
-                    result['error'] = "音声認識の結果がありません"
-                    logger.warning("音声認識の結果がありません")
+        except Exception as e:
+            result['error'] = f"音声認識エラー: {e}"
+            logger.error(f"音声認識エラー: {e}")
+        
+        return result
+    
+    def _probe_audio(self, file_path: str) -> Tuple[Optional[float], bool]:
+        """
+        音声の長さと分割認識の可否を取得
+        
+        Args:
+            file_path: 音声ファイルのパス
+            
+        Returns:
+            (長さの秒数（不明の場合None）, 16bit・モノラルのWAVかどうか)
+        """
+        try:
+            # WAVの場合はヘッダーから長さを計算
+            with wave.open(file_path, 'rb') as wav_file:
+                duration = wav_file.getnframes() / wav_file.getframerate()
+                chunkable = wav_file.getnchannels() == 1 and wav_file.getsampwidth() == 2
+                return duration, chunkable
+        except (wave.Error, EOFError):
+            pass
+        
+        return probe_duration(file_path), False
+    
+    def _select_route(self, duration: Optional[float], chunkable: bool, size_bytes: int) -> str:
+        """
+        音声の長さから認識方法を選択
+        
+        Args:
+            duration: 音声の長さ（秒、不明の場合None）
+            chunkable: 分割認識が可能かどうか
+            size_bytes: 音声データのバイト数
+            
+        Returns:
+            'inline' / 'chunked' / 'gcs'
+        """
+        if duration is None:
+            # 長さが不明な場合はサイズで判定
+            return 'inline' if size_bytes <= INLINE_MAX_BYTES else 'gcs'
+        
+        if duration <= INLINE_MAX_SECONDS and size_bytes <= INLINE_MAX_BYTES:
+            return 'inline'
+        if CHUNKED_RECOGNITION_ENABLED and chunkable and duration <= CHUNKED_MAX_SECONDS:
+            return 'chunked'
+        return 'gcs'
+    
+    def _transcribe_via_gcs(self, file_path: str, data: Optional[memoryview] = None,
+                            encoding: str = 'ENCODING_UNSPECIFIED',
+                            sample_rate: Optional[int] = None) -> Dict[str, Any]:
+        """
+        GCSにアップロードして非同期認識
+        
+        Args:
+            file_path: 音声ファイルのパス（data指定時はオブジェクト名にのみ使用）
+            data: アップロードする変換済みデータ（省略時はファイルをアップロード）
+            encoding: 音声エンコーディング
+            sample_rate: サンプリングレート（省略時は自動判定）
+            
+        Returns:
+            変換結果の辞書
+        """
+        logger.info("長時間音声のためGCSを使用した非同期認識を開始...")
+        self._report('uploading', 20, '音声をクラウドにアップロード中...')
+        reservation = None
+        tracker = get_operation_tracker()
+        try:
+            # 内容のハッシュを名前にしてアップロード（同じ音声が既にあれば省略）
+            gcs_handler = GCSHandler()
+            if data is not None:
+                source = data
+                extension = next((fmt['extension'] for fmt in TARGET_FORMATS.values() if fmt['encoding'] == encoding), '')
             else:
-                try:
-                    # 通常の認識を試行
+                source = file_path
+                extension = os.path.splitext(file_path)[1]
+            gcs_file_name = gcs_handler.staging_name(source, extension)
+            # 同じ音声を使う他の認識の終了で削除されないよう、アップロード前に参照を記録
+            reservation = tracker.reserve(gcs_file_name)
+            gcs_uri, _ = gcs_handler.upload_staging(source, extension, gcs_file_name=gcs_file_name)
+            if data is not None:
+                logger.info(f"アップロードサイズ: {len(data) / (1024 * 1024):.2f}MB ({encoding})")
+            
+            # GCS URIから音声認識（GCSのファイルは認識の終了時に削除される）
+            return self.transcribe_audio_from_gcs(gcs_uri, encoding=encoding, sample_rate_hertz=sample_rate,
+                                                  gcs_object=gcs_file_name, reservation=reservation)
+            
+        except Exception as gcs_error:
+            logger.error(f"GCS処理エラー: {gcs_error}")
+            tracker.release(reservation)
+            return {
+                'success': False,
+                'text': '',
+                'confidence': 0.0,
+                'error': f"GCS処理エラー: {gcs_error}",
+                'word_count': 0
+            }
+    
+    def transcribe_pcm_chunked(self, pcm: memoryview, sample_rate: int) -> Dict[str, Any]:
+        """
+        長時間のPCM音声を無音区間で分割し、並列に同期認識して結合
+        
+        Args:
+            pcm: 16bitリトルエンディアン・モノラルのPCMデータ
+            sample_rate: サンプリングレート
+            
+        Returns:
+            変換結果の辞書（区間ごとの結果を 'segments' に含む）
+        """
+        result = {
+            'success': False,
+            'text': '',
+            'confidence': 0.0,
+            'error': None,
+            'word_count': 0,
+            'segments': []
+        }
+        
+        try:
+            segments = split_on_silence(pcm, sample_rate)
+            config = self._linear16_config(sample_rate)
+            completed = [0]
+            completed_lock = threading.Lock()
+            self._report('recognizing', 20, f"音声認識中（0/{len(segments)}区間）")
+            
+            def recognize_segment(index: int) -> Dict[str, Any]:
+                start, end = segments[index]
+                # memoryviewのスライスはコピーしない（APIに渡す時点でのみbytes化）
+                audio = RecognitionAudio(content=bytes(pcm[start * 2:end * 2]))
+                # 認識済みの区間を無駄にしないよう、途中の区間は空きをタイムアウトせずに待つ
+                with stt_limiter.slot(wait_forever=True):
                     response = self.client.recognize(config=config, audio=audio)
-                    
-                    # 結果の処理
-                    if response.results:
-                        # 最も信頼度の高い結果を取得
-                        best_result = max(response.results, key=lambda x: x.alternatives[0].confidence)
-                        result['text'] = best_result.alternatives[0].transcript
-                        result['confidence'] = best_result.alternatives[0].confidence
-                        result['success'] = True
-                        result['word_count'] = len(result['text'].split())
-                        
-                        logger.info(f"音声認識完了: {result['word_count']}語, 信頼度: {result['confidence']:.2f}")
-                    else:
-                        result['error'] = "音声認識の結果がありません"
-                        logger.warning("音声認識の結果がありません")
-                        
-                except Exception as e:
-                    # エラーが発生した場合は非同期APIを試行
-                    if "too long" in str(e) or "LongRunningRecognize" in str(e) or "duration limit" in str(e) or "Inline audio exceeds" in str(e):
-                        logger.info("長時間音声のためGCSを使用した非同期認識を開始...")
-                        
-                        try:
-                            # GCSにファイルをアップロード
-                            gcs_handler = GCSHandler()
-                            gcs_uri = gcs_handler.upload_file(actual_file_path)
-                            logger.info(f"ファイルをGCSにアップロードしました: {gcs_uri}")
-                            
-                            # GCS URIから音声認識
-                            result = self.transcribe_audio_from_gcs(gcs_uri)
-                            
-                            # GCSからファイルを削除
-                            import os
-                            gcs_handler.delete_file(os.path.basename(actual_file_path))
-                            
-                        except Exception as gcs_error:
-                            logger.error(f"GCS処理エラー: {gcs_error}")
-                            result['error'] = f"GCS処理エラー: {gcs_error}"
-                    else:
-                        raise
-                
+                alternatives = [res.alternatives[0] for res in response.results if res.alternatives]
+                with completed_lock:
+                    completed[0] += 1
+                    done = completed[0]
+                self._report('recognizing', 20 + 80 * done // len(segments), f"音声認識中（{done}/{len(segments)}区間）")
+                return {
+                    'index': index,
+                    'start_seconds': start / sample_rate,
+                    'end_seconds': end / sample_rate,
+                    'text': ''.join(alt.transcript for alt in alternatives),
+                    'confidence': (sum(alt.confidence for alt in alternatives) / len(alternatives)) if alternatives else 0.0
+                }
+            
+            # 区間を並列に認識し、元の順序で結合
+            workers = min(CHUNK_RECOGNITION_WORKERS, len(segments))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='stt-chunk') as executor:
+                segment_results: List[Dict[str, Any]] = list(executor.map(recognize_segment, range(len(segments))))
+            
+            recognized = [seg for seg in segment_results if seg['text']]
+            if not recognized:
+                result['error'] = "音声認識の結果がありません"
+                logger.warning("音声認識の結果がありません")
+                return result
+            
+            # 区間の長さで重み付けした平均信頼度
+            total_seconds = sum(seg['end_seconds'] - seg['start_seconds'] for seg in recognized)
+            result['text'] = ' '.join(seg['text'] for seg in recognized)
+            result['confidence'] = sum(seg['confidence'] * (seg['end_seconds'] - seg['start_seconds']) for seg in recognized) / total_seconds
+            result['segments'] = segment_results
+            result['success'] = True
+            result['word_count'] = len(result['text'].split())
+            
+            logger.info(f"分割音声認識完了: {len(segments)}区間, {result['word_count']}語, 平均信頼度: {result['confidence']:.2f}")
+            
         except Exception as e:
             result['error'] = f"音声認識エラー: {e}"
             logger.error(f"音声認識エラー: {e}")
@@ -264,7 +688,8 @@ class VoiceRecognizer:
             )
             
             logger.info("音声認識を開始（バイトデータ）")
-            response = self.client.recognize(config=config, audio=audio)
+            with stt_limiter.slot():
+                response = self.client.recognize(config=config, audio=audio)
             
             # 結果の処理
             if response.results:
@@ -285,15 +710,24 @@ class VoiceRecognizer:
         
         return result
 
-    def transcribe_audio_from_gcs(self, gcs_uri: str) -> Dict[str, Any]:
+    def transcribe_audio_from_gcs(self, gcs_uri: str, encoding: str = 'ENCODING_UNSPECIFIED',
+                                  sample_rate_hertz: Optional[int] = None,
+                                  gcs_object: Optional[str] = None,
+                                  reservation: Optional[str] = None) -> Dict[str, Any]:
         """
         GCS URIから音声をテキストに変換（長時間音声対応）
         
+        開始したOperationは名前で保存し、完了の確認は OperationTracker のスレッドがまとめて行う
+        
         Args:
             gcs_uri: Google Cloud Storage のURI (例: gs://bucket-name/file.wav)
+            encoding: 音声エンコーディング（省略時は自動判定）
+            sample_rate_hertz: サンプリングレート（省略時は自動判定）
+            gcs_object: 認識の終了時（成功・失敗とも）に削除するGCSオブジェクト名
+            reservation: アップロード前に OperationTracker.reserve で記録した予約名
             
         Returns:
-            変換結果の辞書
+            変換結果の辞書（defer_long_running の場合は 'pending_operation' にOperation名）
         """
         result = {
             'success': False,
@@ -309,57 +743,64 @@ class VoiceRecognizer:
             
             # 設定を更新
             config_dict = dict(SPEECH_CONFIG)
-            config_dict['encoding'] = 'ENCODING_UNSPECIFIED'
-            if 'sample_rate_hertz' in config_dict:
+            config_dict['encoding'] = encoding
+            if sample_rate_hertz:
+                config_dict['sample_rate_hertz'] = sample_rate_hertz
+            elif 'sample_rate_hertz' in config_dict:
                 del config_dict['sample_rate_hertz']
             config = RecognitionConfig(**config_dict)
             
             logger.info(f"GCS URIから音声認識を開始: {gcs_uri}")
             
             # 非同期APIを使用（長時間音声対応）
-            operation = self.client.long_running_recognize(config=config, audio=audio)
-            
-            # 完了を待つ
-            logger.info("音声認識処理中（長時間音声）...")
-            response = operation.result(timeout=600)  # 10分のタイムアウト
+            with stt_limiter.slot():
+                operation = self.client.long_running_recognize(config=config, audio=audio)
             
-            # 結果の処理
-            if response.results:
-                # 全ての結果を結合
-                transcripts = []
-                confidences = []
-                for res in response.results:
-                    transcripts.append(res.alternatives[0].transcript)
-                    confidences.append(res.alternatives[0].confidence)
-                
-                result['text'] = ' '.join(transcripts)
-                result['confidence'] = sum(confidences) / len(confidences)
-                result['success'] = True
-                result['word_count'] = len(result['text'].split())
-                
-                logger.info(f"長時間音声認識完了: {result['word_count']}語, 平均信頼度: {result['confidence']:.2f}")
-            else:
-                result['error'] = "音声認識の結果がありません"
-                logger.warning("音声認識の結果がありません")
-                
         except Exception as e:
             result['error'] = f"音声認識エラー: {e}"
             logger.error(f"音声認識エラー: {e}")
+            # 認識を開始できなかった場合は、他の認識が参照していなければここで一時ファイルを削除
+            get_operation_tracker().release(reservation, gcs_object)
+            return result
         
-        return result
+        # Operation名を保存（再起動後もポーリングを再開できる）
+        name = operation.operation.name
+        tracker = get_operation_tracker()
+        tracker.track(name, gcs_object, reservation)
+        if self.defer_long_running:
+            result['pending_operation'] = name
+            return result
+        
+        # 完了を待つ（進捗率を通知しながら）
+        logger.info("音声認識処理中（長時間音声）...")
+        return tracker.wait(name, on_progress=self.report_long_running_progress)
+    
+    def report_long_running_progress(self, percent: int):
+        """
+        非同期認識の progress_percent を進捗として通知
+        
+        Args:
+            percent: 非同期認識の進捗率（0〜100）
+        """
+        self._report('recognizing', 30 + percent * 70 // 100, f"音声認識中（{percent}%）")
 
 
-def create_voice_recognizer(credentials_path: Optional[str] = None) -> VoiceRecognizer:
+def create_voice_recognizer(credentials_path: Optional[str] = None,
+                            progress_callback: Optional[Callable[[str, int, str], None]] = None,
+                            defer_long_running: bool = False) -> VoiceRecognizer:
     """
     音声認識オブジェクトを作成
     
     Args:
         credentials_path: Google Cloud認証情報のパス
+        progress_callback: 進捗通知用のコールバック (stage, 音声認識内の進捗率0〜100, message)
+        defer_long_running: 非同期認識の完了を待たずにOperation名を返すかどうか
         
     Returns:
         VoiceRecognizerインスタンス
     """
-    return VoiceRecognizer(credentials_path)
+    return VoiceRecognizer(credentials_path, progress_callback=progress_callback,
+                           defer_long_running=defer_long_running)
 
 
 # テスト用の関数
@@ -0,0 +1,175 @@
+"""
+ジョブ処理ワーカー
+永続ジョブキュー（job_store.py）からリース付きでジョブを取得し、
+音声認識 → 要約 → 整形 → 保存 の各段階を実行して結果を書き戻す
+
+使い方:
+    python worker.py（JOB_BACKEND=sqlite の場合のみ。memory の場合はWebのプロセスが処理するため何もせず終了する）
+"""
+
+import os
+import uuid
+import socket
+import logging
+import threading
+from typing import Optional, Dict, Any
+from job_store import create_job_store, JobStore, LeaseLostError
+from job_manager import StageSuspended
+from operation_tracker import get_operation_tracker
+from gcs_handler import start_staging_sweeper
+from pipeline import PIPELINES, checkpoint_state
+from config import WORKER_CONCURRENCY, WORKER_POLL_SECONDS, JOB_LEASE_SECONDS, JOB_BACKEND, GCS_SWEEP_INTERVAL_SECONDS
+
+# ログ設定
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Worker:
+    """永続ジョブキューのジョブを処理するワーカー"""
+
+    def __init__(self, store: JobStore, concurrency: int = WORKER_CONCURRENCY,
+                 poll_seconds: float = WORKER_POLL_SECONDS):
+        """
+        初期化
+
+        Args:
+            store: 永続ジョブキュー
+            concurrency: 同時に処理するジョブ数
+            poll_seconds: ジョブがない場合の確認間隔
+        """
+        self.store = store
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._active: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def run(self):
+        """ジョブの処理を開始し、停止されるまで待つ"""
+        logger.info(f"ワーカーを開始しました: {self.worker_id} (同時処理数: {self.concurrency})")
+        # 前回の停止時に完了していなかった非同期認識のポーリングを再開（GCSの一時ファイルも削除される）
+        # （複数のワーカーがある場合、ポーリングはリースを持つ1つのワーカーだけが行う）
+        tracker = get_operation_tracker()
+        tracker.resume()
+        # 認識が中断されて残ったGCSの一時ファイルを定期的に削除（同じくリースを持つ1つのワーカーだけ）
+        start_staging_sweeper(should_sweep=lambda: tracker.hold_lease('sweeper', GCS_SWEEP_INTERVAL_SECONDS * 2))
+        threads = [threading.Thread(target=self._heartbeat, name='worker-heartbeat', daemon=True)]
+        threads += [
+            threading.Thread(target=self._loop, args=(index,), name=f"worker-{index}", daemon=True)
+            for index in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            while not self._stopping.is_set():
+                self._stopping.wait(1.0)
+        except KeyboardInterrupt:
+            # 処理中のジョブはリースを手放し、他のワーカーが保存した途中経過から再開する
+            logger.info("ワーカーを停止します")
+            self._stopping.set()
+            self._release_active()
+
+    def stop(self):
+        """ワーカーを停止"""
+        self._stopping.set()
+
+    def _loop(self, index: int):
+        """ジョブを1件ずつ取得して処理"""
+        slot_id = f"{self.worker_id}-{index}"
+        while not self._stopping.is_set():
+            try:
+                job = self.store.claim(slot_id)
+            except Exception as e:
+                logger.error(f"ジョブの取得に失敗しました: {e}")
+                job = None
+            if job is None:
+                self._stopping.wait(self.poll_seconds)
+                continue
+            self.run_job(slot_id, job)
+
+    def run_job(self, slot_id: str, job: Dict[str, Any]):
+        """
+        取得したジョブの残りの段階を実行
+
+        Args:
+            slot_id: リースの所有者として使うID
+            job: JobStore.claim の結果
+        """
+        job_id = job['job_id']
+        stages = PIPELINES[job['pipeline']]
+        state = job['state']
+        with self._lock:
+            self._active[job_id] = slot_id
+
+        def report(stage: str, progress: int, message: str = '', partial: Optional[Dict[str, Any]] = None):
+            try:
+                self.store.update_progress(job_id, slot_id, stage, progress, message, partial)
+            except LeaseLostError:
+                raise
+            except Exception as e:
+                logger.warning(f"進捗の保存に失敗しました: {job_id}: {e}")
+
+        try:
+            result = None
+            for index in range(job['next_stage'], len(stages)):
+                _, func = stages[index]
+                result = func(report, state)
+                if isinstance(result, StageSuspended):
+                    # 非同期認識のOperation名を保存してから待つ（再起動後は同じOperationの完了を待つ）
+                    self.store.checkpoint(job_id, slot_id, index, checkpoint_state(state))
+                    # 待つ間もリースの期限内ごとに延長し、失われた場合は待つのをやめる（他のワーカーが引き継ぐ）
+                    result = result.wait(JOB_LEASE_SECONDS / 3, lambda: self.store.renew_lease(job_id, slot_id))
+                if result is not None:
+                    break
+                # 段階の結果を保存（再起動後に音声認識などをやり直さない）
+                self.store.checkpoint(job_id, slot_id, index + 1, checkpoint_state(state))
+            self.store.finish(job_id, slot_id, result or {'success': False, 'error': '処理結果がありません'})
+        except LeaseLostError as e:
+            logger.warning(f"{e}（他のワーカーが処理を引き継ぎます）")
+        except Exception as e:
+            logger.error(f"ジョブ実行エラー: {job_id}: {e}")
+            try:
+                self.store.finish(job_id, slot_id, {'success': False, 'error': str(e)})
+            except LeaseLostError:
+                pass
+        finally:
+            with self._lock:
+                self._active.pop(job_id, None)
+
+    def _release_active(self):
+        """処理中のジョブのリースを手放す"""
+        with self._lock:
+            active = list(self._active.items())
+        for job_id, slot_id in active:
+            try:
+                self.store.release_lease(job_id, slot_id)
+            except Exception as e:
+                logger.warning(f"リースを手放せませんでした: {job_id}: {e}")
+
+    def _heartbeat(self):
+        """処理中のジョブのリースを定期的に延長"""
+        while not self._stopping.wait(JOB_LEASE_SECONDS / 3):
+            with self._lock:
+                active = list(self._active.items())
+            for job_id, slot_id in active:
+                try:
+                    self.store.renew_lease(job_id, slot_id)
+                except LeaseLostError as e:
+                    logger.warning(str(e))
+                except Exception as e:
+                    logger.warning(f"リースの延長に失敗しました: {job_id}: {e}")
+
+
+def main():
+    """ワーカーを起動"""
+    if JOB_BACKEND != 'sqlite':
+        # memory の場合はWebのプロセスがジョブ・非同期認識・GCSの一時ファイルを管理する
+        logger.info(f"JOB_BACKEND={JOB_BACKEND} のためワーカーは起動しません（JOB_BACKEND=sqlite の場合のみ使用）")
+        return
+    Worker(create_job_store()).run()
+
+
+if __name__ == '__main__':
+    main()